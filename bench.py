@@ -0,0 +1,282 @@
+## Benchmark suite
+#
+# Times the engine's hot paths so a change to command dispatch, cutscenes or item
+# lookups can be checked against an earlier run:
+#
+#   command.<alias>    one command through Game.step, for every alias in Game.commands
+#   fuzzy.*            unknown commands and item names that go through the suggestion path
+#   cutscene.*         rendering every cutscene in the world with sleeps disabled
+#   world.*, session.* loading the world file and creating or restoring a session
+#   playthrough.*      a whole scripted game to each ending
+#   memory.*           bytes per resident session, fresh and part way through a game
+#
+# Everything runs offline and single-threaded with fixed seeds. Each case is timed
+# one operation at a time after a warm-up, and the results are written as JSON.
+# Given a baseline from an earlier run, the median of every case is compared
+# against it and the command exits with status 1 if anything got slower than
+# --max-regression percent.
+#
+#   python bench.py [--quick] [--only PREFIX] [--json FILE] [--baseline FILE] [--max-regression PCT]
+
+import gc
+import sys
+import json
+import time
+import platform
+import statistics
+import tracemalloc
+
+from main import (VirtualClock, Clock, FixedRoll, Game, HeadlessIO, Player, IRIS_CALIBRATION,
+                  build_world, compile_world, load_world, WORLD_FILE, world_template)
+
+# Arguments used when timing each command handler. Aliases of the same handler get
+# the same arguments, handlers not listed here are timed without any.
+COMMAND_ARGS = {
+    "command_move": "back",
+    "command_goto": "old rover pad",
+    "command_take": "small wrench",
+    "command_use": "small wrench on small wrench",
+    "command_inspect": "small wrench",
+}
+
+CALIBRATED = list(IRIS_CALIBRATION.values())
+
+# Scripted games to each ending: (commands and prompt answers, IRIS roll)
+PLAYTHROUGHS = {
+    "RESCUED": ([
+        "look", "inspect small wrench", "take small wrench", "move forward", "exits", "move forward",
+        "move left", "move forward", "EMBER-IRIS-8924", "look", "inspect communications manual",
+        "take emergency beacon", "move left", "yes", "move right", "move right", "1", "inventory",
+        "use antenna on emergency beacon",
+    ], None),
+    "ALIENS": ([
+        "look", "move forward", "move left", "look", "take unstable power cell", "move forward", "yes",
+        "move right", "look", "take rusty spanner", "use rusty spanner on sealed briefcase",
+        "inspect iris", "use unstable power cell on iris", *CALIBRATED, "1",
+    ], 0.0),
+    "SURVIVING, ALONE": ([
+        "look", "move forward", "move left", "take unstable power cell", "move forward", "yes",
+        "move right", "take rusty spanner", "use rusty spanner on sealed briefcase",
+        "use unstable power cell on iris", *CALIBRATED, "1",
+    ], 0.99),
+    "IRIS DESTROYED": ([
+        "move forward", "move left", "take unstable power cell", "move forward", "yes",
+        "move right", "take rusty spanner", "use rusty spanner on sealed briefcase",
+        "use unstable power cell on iris", "2", "2", "2",
+    ], None),
+}
+
+
+def new_game(seed=0):
+    io = HeadlessIO(keep_transcript=False)
+    return Game(Player("Bench", world_template, io=io), world_template, io=io, seed=seed)
+
+
+# --- timing --------------------------------------------------------------------
+
+# Times run() one call at a time. prepare(), if given, runs untimed before each call
+# to put the state back. Runs for at least min_ops calls and about target seconds.
+def measure(run, prepare=None, target=0.2, min_ops=20, warmup=5):
+    for _ in range(warmup):
+        if prepare:
+            prepare()
+        run()
+    samples = []
+    gc.collect()
+    started = time.perf_counter()
+    while len(samples) < min_ops or time.perf_counter() - started < target:
+        if prepare:
+            prepare()
+        t0 = time.perf_counter_ns()
+        run()
+        samples.append(time.perf_counter_ns() - t0)
+    samples.sort()
+    return {
+        "ops": len(samples),
+        "mean_us": statistics.fmean(samples) / 1000,
+        "p50_us": samples[len(samples) // 2] / 1000,
+        "p95_us": samples[min(len(samples) - 1, int(len(samples) * 0.95))] / 1000,
+        "min_us": samples[0] / 1000,
+    }
+
+
+# --- cases -------------------------------------------------------------------
+
+def command_cases():
+    wrench = world_template.items["small_wrench"]
+    for alias, handler in new_game().commands.items():
+        line = f"{alias} {COMMAND_ARGS.get(handler.__name__, '')}".strip()
+        game = new_game()
+        if handler.__name__ == "command_take":
+            # put the wrench back each time so there's always something to take
+            def put_back(game=game):
+                if wrench in game.player.inventory:
+                    game.player.inventory.remove(wrench)
+                    game.rooms.add_item(game.player.current_room, wrench)
+            prepare = put_back
+        else:
+            # carrying the wrench, and moving "back" bounces between the launch bay and the rover pad
+            game.step("take small wrench")
+            game.step("move forward")
+            prepare = None
+        yield f"command.{alias}", (lambda game=game, line=line: game.step(line)), prepare
+
+
+def fuzzy_cases():
+    game = new_game()
+    yield "fuzzy.command_cached", lambda: game.step("lok"), None
+    yield "fuzzy.command_cold", lambda: game.step("lok"), game.command_suggestions.cache.clear
+    yield "fuzzy.unknown_command", lambda: game.step("xyzzy"), None
+    room_items = game.rooms.items_in(game.player.current_room)
+    yield "fuzzy.item_cached", lambda: game.step("take wrenh"), None
+    yield "fuzzy.item_cold", lambda: game.step("take wrenh"), lambda: room_items.suggestions and room_items.suggestions.cache.clear()
+
+
+def cutscene_cases():
+    instant = HeadlessIO(keep_transcript=False, clock=Clock(time_scale=0))
+    paced = HeadlessIO(keep_transcript=False, clock=VirtualClock(time_scale=1.0))
+    for name, cutscene in world_template.cutscenes.items():
+        yield f"cutscene.{name}", lambda cutscene=cutscene: cutscene.play(instant), None
+    # the paced path splits lines into frames, the virtual clock only counts the pauses
+    for name in ("intro", "iris_activation"):
+        cutscene = world_template.cutscenes[name]
+        yield f"cutscene.{name}.paced", lambda cutscene=cutscene: cutscene.play(paced), None
+
+
+def world_cases():
+    with open(WORLD_FILE) as f:
+        data = json.load(f)
+    compiled = compile_world(data)
+    yield "world.load_cached", load_world, None
+    yield "world.load_uncached", lambda: load_world(cache=False), None
+    yield "world.compile", lambda: compile_world(data), None
+    yield "world.build", lambda: build_world(compiled), None
+    yield "session.create", new_game, None
+    snapshot = new_game().snapshot()
+    yield "session.from_snapshot", lambda: Game.from_snapshot(snapshot, io=HeadlessIO(keep_transcript=False)), None
+    game = new_game()
+    yield "session.snapshot", game.snapshot, None
+    yield "session.restore", lambda: game.restore(snapshot), None
+
+
+def playthrough_cases():
+    for ending, (script, roll) in PLAYTHROUGHS.items():
+        def run(script=script, roll=roll, ending=ending):
+            game = new_game()
+            if roll is not None:
+                game.rng = FixedRoll(roll)
+            game.run_script(script)
+            reached = game.ending or ("IRIS DESTROYED" if game.player.flags["iris_broken"] else None)
+            if reached != ending:
+                raise RuntimeError(f"playthrough for {ending} ended with {reached}")
+        yield f"playthrough.{ending.lower().replace(', ', '_').replace(' ', '_')}", run, None
+
+
+SUITES = (command_cases, fuzzy_cases, cutscene_cases, world_cases, playthrough_cases)
+
+# A session part way through a game: items taken, rooms changed, a typo made
+MEMORY_SCRIPT = ["take small wrench", "move forward", "move left", "take oily rag", "look", "tke power cell"]
+
+
+# Average bytes a resident session (game, player, world overlay and I/O port)
+# holds, measured with tracemalloc over many live sessions
+def session_bytes(script=(), sessions=2000):
+    def make():
+        game = new_game()
+        for line in script:
+            game.step(line)
+        return game
+
+    make()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        games = [make() for _ in range(sessions)]
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del games
+    return round((after - before) / sessions)
+
+
+def memory_report():
+    return {"memory.session_fresh": session_bytes(), "memory.session_played": session_bytes(MEMORY_SCRIPT)}
+
+
+def run_benchmarks(only=None, target=0.2):
+    results = {}
+    for suite in SUITES:
+        for name, run, prepare in suite():
+            if only and not name.startswith(only):
+                continue
+            results[name] = measure(run, prepare, target=target)
+    memory = {}
+    if not only or "memory".startswith(only) or only.startswith("memory"):
+        memory = memory_report()
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "system": platform.system(),
+            "world": world_template.fingerprint,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+        "memory": memory,
+    }
+
+
+# Median change against a baseline run for every case both runs have, as a percentage
+def compare(report, baseline):
+    changes = {}
+    for name, stats in report["results"].items():
+        before = baseline["results"].get(name)
+        if before and before["p50_us"] > 0:
+            changes[name] = (stats["p50_us"] - before["p50_us"]) / before["p50_us"] * 100
+    for name, size in report.get("memory", {}).items():
+        before = baseline.get("memory", {}).get(name)
+        if before:
+            changes[name] = (size - before) / before * 100
+    return changes
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+
+    def option(name, default=None):
+        return args[args.index(name) + 1] if name in args else default
+
+    report = run_benchmarks(option("--only"), target=0.05 if "--quick" in args else 0.2)
+    baseline = None
+    if option("--baseline"):
+        with open(option("--baseline")) as f:
+            baseline = json.load(f)
+    changes = compare(report, baseline) if baseline else {}
+
+    print(f"{'case':<36} {'ops':>7} {'p50 us':>10} {'p95 us':>10} {'mean us':>10}" + ("   vs baseline" if baseline else ""))
+    for name, stats in report["results"].items():
+        line = f"{name:<36} {stats['ops']:>7} {stats['p50_us']:>10.2f} {stats['p95_us']:>10.2f} {stats['mean_us']:>10.2f}"
+        if name in changes:
+            line += f"   {changes[name]:+7.1f}%"
+        print(line)
+    for name, size in report["memory"].items():
+        line = f"{name:<36} {size:>10} bytes per session"
+        if name in changes:
+            line += f"   {changes[name]:+7.1f}%"
+        print(line)
+
+    if option("--json"):
+        with open(option("--json"), "w") as f:
+            json.dump(report, f, indent=2)
+
+    limit = option("--max-regression")
+    if baseline and limit is not None:
+        slower = {name: change for name, change in changes.items() if change > float(limit)}
+        if slower:
+            print(f"\n{len(slower)} case(s) more than {limit}% slower than the baseline:")
+            for name, change in sorted(slower.items(), key=lambda pair: -pair[1]):
+                print(f"  {name}: {change:+.1f}%")
+            sys.exit(1)
@@ -0,0 +1,426 @@
+## Sharded game server
+#
+# Runs the games in N worker processes so throughput grows with the number of
+# cores. A router process accepts the telnet connections and does all the
+# network I/O and cutscene pacing; each worker owns a shard of the sessions and
+# only runs commands. Every session gets an ID when it connects and the router
+# keeps a placement table from ID to worker, so all of a connection's commands
+# go to the same shard.
+#
+# Sessions can move between workers while they're being played: the router
+# waits for the session's current command to finish, has the old worker pack it
+# (snapshot, seed and RNG state, see sessions.pack) and the new one unpack it,
+# and points the placement at the new worker. rebalance() evens the shards out
+# and restart() drains a worker onto the others, replaces its process and
+# rebalances, without disconnecting anyone.
+#
+# Router and workers talk over local TCP with length-prefixed marshal frames,
+# one request at a time per session and answered in order per worker:
+#   ("open", id, None)     new game, returns (output, running, waiting)
+#   ("line", id, text)     one line of input, returns (output, running, waiting)
+#   ("export", id, None)   remove the session and return it packed
+#   ("import", id, data)   take over a packed session
+#   ("close", id, None)    drop the session
+#   ("count", None, None)  number of sessions on the worker
+#
+# --events FILE gives every worker its own event log (see events.py) next to FILE,
+# named after the worker's process id: events.log becomes events-<pid>.log.
+#
+#   python cluster.py [--host 127.0.0.1] [--port 4000] [--workers N] [--time-scale 1.0]
+#                     [--rebalance SECONDS] [--no-color] [--events FILE]
+
+import os
+import sys
+import signal
+import struct
+import asyncio
+import marshal
+import secrets
+import multiprocessing
+from collections import deque
+
+from events import EventLog
+from main import Game, Player, rooms
+from server import GameServer, Session, SessionIO
+from sessions import pack, unpack
+
+FRAME_LENGTH = struct.Struct("<I")
+
+# Workers are started fresh rather than forked: a fork after players have
+# connected would inherit their sockets and keep them open after we close them
+WORKER_START = multiprocessing.get_context("spawn")
+
+
+class WorkerError(Exception):
+    pass
+
+
+async def read_frame(reader):
+    (length,) = FRAME_LENGTH.unpack(await reader.readexactly(FRAME_LENGTH.size))
+    return marshal.loads(await reader.readexactly(length))
+
+
+def write_frame(writer, message):
+    data = marshal.dumps(message)
+    writer.write(FRAME_LENGTH.pack(len(data)) + data)
+
+
+# --- worker side -------------------------------------------------------------
+
+# The sessions one worker owns, each a Game on a SessionIO whose queued output
+# (text and cutscene pauses) is sent back with every reply
+class Shard:
+    def __init__(self, time_scale=1.0, color=True, events=None):
+        self.time_scale = time_scale
+        self.color = color
+        # optional events.EventLog for this worker's games
+        self.events = events
+        self.games = {}
+
+    def _events(self, session_id):
+        return self.events.session(session_id) if self.events is not None else None
+
+    def _reply(self, game):
+        return game.io.take(), game.running, game.dialog is not None
+
+    def handle(self, op, session_id, payload):
+        if op == "line":
+            game = self.games[session_id]
+            game.step(payload)
+            return self._reply(game)
+        if op == "open":
+            io = SessionIO(self.time_scale, self.color)
+            game = self.games[session_id] = Game(Player("Player1", rooms, io=io), rooms, io=io,
+                                                 events=self._events(session_id))
+            game.rooms.cutscenes["intro"].play(io)
+            io.output(game.rooms[game.player.current_room].description)
+            return self._reply(game)
+        if op == "export":
+            # the session stays here if it can't be packed
+            data = pack(self.games[session_id])
+            del self.games[session_id]
+            return data
+        if op == "import":
+            self.games[session_id] = unpack(payload, SessionIO(self.time_scale, self.color),
+                                            events=self._events(session_id))
+            return None
+        if op == "close":
+            self.games.pop(session_id, None)
+            return None
+        if op == "count":
+            return len(self.games)
+        raise WorkerError(f"Unknown request {op!r}")
+
+    async def serve(self, reader, writer):
+        try:
+            while True:
+                op, session_id, payload = await read_frame(reader)
+                try:
+                    reply = ("ok", self.handle(op, session_id, payload))
+                except Exception as e:
+                    reply = ("error", f"{type(e).__name__}: {e}")
+                write_frame(writer, reply)
+                await writer.drain()
+        # the router went away, or we're shutting down
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+
+async def _run_worker(conn, shard):
+    server = await asyncio.start_server(shard.serve, "127.0.0.1", 0)
+    conn.send(server.sockets[0].getsockname()[1])
+    conn.close()
+    async with server:
+        await server.serve_forever()
+
+
+def worker_main(conn, time_scale=1.0, color=True, events=None):
+    # unwind normally when the router stops us, so the event log gets written out
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    log = None
+    if events:
+        root, ext = os.path.splitext(events)
+        log = EventLog(f"{root}-{os.getpid()}{ext}").start()
+    try:
+        asyncio.run(_run_worker(conn, Shard(time_scale, color, log)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if log:
+            log.stop()
+
+
+# --- router side -------------------------------------------------------------
+
+# The router's connection to one worker process
+class WorkerLink:
+    def __init__(self, index, process, reader, writer):
+        self.index = index
+        self.process = process
+        self.reader = reader
+        self.writer = writer
+        # futures for the requests sent, replies come back in the same order
+        self.waiting = deque()
+        self.sessions = set()
+        self.draining = False
+        # why the worker can't be used any more, set once its connection is gone
+        self.failure = None
+        self.task = asyncio.create_task(self._read())
+
+    @property
+    def alive(self):
+        return self.failure is None
+
+    @classmethod
+    async def spawn(cls, index, time_scale, color, events=None):
+        parent, child = WORKER_START.Pipe(duplex=False)
+        process = WORKER_START.Process(target=worker_main, args=(child, time_scale, color, events),
+                                          name=f"iris-worker-{index}", daemon=True)
+        process.start()
+        # our copy of the child's end has to go, or recv() never sees it die
+        child.close()
+        try:
+            port = await asyncio.get_running_loop().run_in_executor(None, parent.recv)
+        except EOFError:
+            raise WorkerError(f"worker {index} exited before it started serving") from None
+        finally:
+            parent.close()
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        return cls(index, process, reader, writer)
+
+    async def call(self, op, session_id=None, payload=None):
+        # nothing would ever answer
+        if self.failure is not None:
+            raise WorkerError(self.failure)
+        future = asyncio.get_running_loop().create_future()
+        self.waiting.append(future)
+        write_frame(self.writer, (op, session_id, payload))
+        await self.writer.drain()
+        return await future
+
+    async def _read(self):
+        try:
+            while True:
+                status, payload = await read_frame(self.reader)
+                future = self.waiting.popleft()
+                if status == "ok":
+                    future.set_result(payload)
+                else:
+                    future.set_exception(WorkerError(payload))
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            self.failure = f"worker {self.index} went away: {e}"
+        finally:
+            # killed, crashed or stopped: fail what's waiting, and every call from now on
+            if self.failure is None:
+                self.failure = f"worker {self.index} stopped"
+            while self.waiting:
+                self.waiting.popleft().set_exception(WorkerError(self.failure))
+
+    async def stop(self):
+        self.writer.close()
+        self.task.cancel()
+        self.process.terminate()
+        await asyncio.get_running_loop().run_in_executor(None, self.process.join)
+
+
+# A connection whose game lives on a worker. The lock is held for each request,
+# so a migration never happens in the middle of a command.
+class RoutedSession(Session):
+    def __init__(self, reader, writer, router):
+        self.id = secrets.token_hex(8)
+        self.reader = reader
+        self.writer = writer
+        self.metrics = None
+        self.router = router
+        self.lock = asyncio.Lock()
+        self.outbox = []
+
+    async def _call(self, op, payload=None):
+        async with self.lock:
+            output, running, waiting = await self.router.link_for(self.id).call(op, self.id, payload)
+        self.outbox.extend(output)
+        return running, waiting
+
+    async def open(self):
+        self.router.place(self)
+        await self._call("open")
+
+    # A game whose worker died is gone with it. Tell the player rather than leave
+    # them waiting on a reply that will never come.
+    async def run(self):
+        try:
+            await super().run()
+        except WorkerError:
+            self.writer.write(b"\r\nSorry, your game was lost with the server running it. Please reconnect.\r\n")
+            await self.writer.drain()
+
+    async def execute(self, line):
+        return await self._call("line", line)
+
+    async def flush(self):
+        output, self.outbox = self.outbox, []
+        await self.send(output)
+
+    # Never raises, the connection's writer is closed after this whatever the worker did
+    async def close(self):
+        async with self.lock:
+            link = self.router.unplace(self.id)
+            if link is not None and link.alive:
+                try:
+                    await link.call("close", self.id)
+                except (WorkerError, ConnectionError):
+                    pass
+
+
+class Router(GameServer):
+    def __init__(self, host="127.0.0.1", port=4000, workers=None, time_scale=1.0, backlog=1024, color=True,
+                 rebalance_interval=None, events=None):
+        super().__init__(host, port, time_scale, backlog, color=color)
+        self.worker_count = workers or os.cpu_count() or 1
+        # event log path the workers derive theirs from
+        self.events_path = events
+        self.rebalance_interval = rebalance_interval
+        self.links = []
+        # session id -> worker index
+        self.placement = {}
+        self.routed = {}
+        self.migrations = 0
+        # held while rebalancing or restarting, so the set of workers only changes in one place at a time
+        self.reshaping = asyncio.Lock()
+        self.balancer = None
+
+    async def start(self):
+        self.links = list(await asyncio.gather(*(
+            WorkerLink.spawn(index, self.time_scale, self.color, self.events_path)
+            for index in range(self.worker_count))))
+        await super().start()
+        if self.rebalance_interval:
+            self.balancer = asyncio.create_task(self._rebalance_every(self.rebalance_interval))
+        return self
+
+    async def close(self):
+        if self.balancer:
+            self.balancer.cancel()
+        await super().close()
+        for link in self.links:
+            await link.stop()
+
+    def new_session(self, reader, writer):
+        return RoutedSession(reader, writer, self)
+
+    # workers new sessions can go to
+    def active(self):
+        return [link for link in self.links if link.alive and not link.draining]
+
+    # pin a new session to the least loaded worker that's up and isn't being drained
+    def place(self, session):
+        active = self.active()
+        if not active:
+            raise WorkerError("no workers left to run games")
+        link = min(active, key=lambda link: len(link.sessions))
+        self.placement[session.id] = link.index
+        self.routed[session.id] = session
+        link.sessions.add(session.id)
+
+    def unplace(self, session_id):
+        self.routed.pop(session_id, None)
+        index = self.placement.pop(session_id, None)
+        if index is None:
+            return None
+        self.links[index].sessions.discard(session_id)
+        return self.links[index]
+
+    def link_for(self, session_id):
+        return self.links[self.placement[session_id]]
+
+    # Move a live session to another worker between two of its commands
+    async def migrate(self, session_id, target):
+        session = self.routed.get(session_id)
+        if session is None:
+            return False
+        async with session.lock:
+            source = self.placement.get(session_id)
+            if source is None or source == target:
+                return False
+            data = await self.links[source].call("export", session_id)
+            try:
+                await self.links[target].call("import", session_id, data)
+            except WorkerError:
+                # put it back where it was rather than lose it
+                await self.links[source].call("import", session_id, data)
+                raise
+            self.links[source].sessions.discard(session_id)
+            self.links[target].sessions.add(session_id)
+            self.placement[session_id] = target
+            self.migrations += 1
+            return True
+
+    # Even out the shards, moving sessions from the busiest to the quietest worker
+    async def rebalance(self):
+        async with self.reshaping:
+            return await self._rebalance()
+
+    async def _rebalance(self):
+        moved = 0
+        while True:
+            active = self.active()
+            # sessions on a dead worker died with it, there's nothing to move
+            live = [link for link in self.links if link.alive]
+            if not active:
+                return moved
+            # a draining worker with sessions left comes first
+            busiest = max(live, key=lambda link: (link.draining and bool(link.sessions), len(link.sessions)))
+            quietest = min(active, key=lambda link: len(link.sessions))
+            if not busiest.sessions or (not busiest.draining and len(busiest.sessions) - len(quietest.sessions) <= 1):
+                return moved
+            if not await self.migrate(next(iter(busiest.sessions)), quietest.index):
+                return moved
+            moved += 1
+
+    async def _rebalance_every(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            await self.rebalance()
+
+    # Replace a worker's process: start the new one, move the sessions off the old one,
+    # stop it and spread them out again. Works with a single worker too.
+    async def restart(self, index):
+        async with self.reshaping:
+            await self._restart(index)
+
+    async def _restart(self, index):
+        old = self.links[index]
+        spare = len(self.links)
+        self.links.append(await WorkerLink.spawn(spare, self.time_scale, self.color, self.events_path))
+        old.draining = True
+        await self._rebalance()
+        await old.stop()
+        # the replacement takes over the old one's slot
+        new = self.links.pop()
+        new.index = index
+        self.links[index] = new
+        for session_id in new.sessions:
+            self.placement[session_id] = index
+        await self._rebalance()
+
+    async def counts(self):
+        return [await link.call("count") for link in self.links]
+
+
+if __name__ == "__main__":
+    options = {"--host": "127.0.0.1", "--port": "4000", "--workers": "0", "--time-scale": "1.0", "--rebalance": "0",
+               "--events": None}
+    args = sys.argv[1:]
+    for i, arg in enumerate(args[:-1]):
+        if arg in options:
+            options[arg] = args[i + 1]
+
+    router = Router(options["--host"], int(options["--port"]), int(options["--workers"]) or None,
+                    float(options["--time-scale"]), color="--no-color" not in args,
+                    rebalance_interval=float(options["--rebalance"]) or None, events=options["--events"])
+    try:
+        asyncio.run(router.serve_forever())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,278 @@
+## Player event log
+#
+# Structured events for working out how people play: where they get stuck, how
+# often the comms keypad turns them away, how many harvest the Old Rover's antenna.
+# A Game given an event stream (EventLog.session) emits:
+#
+#   command  {"room", "text"[, "to"]}             a command, "to" if it moved the player
+#   answer   {"room", "dialog", "text"[, "to"]}   an answer to a question the game asked
+#   flag     {"room", "flag", "value"}            a change to one of Player.flags
+#   ending   {"room", "ending", "moves"}          the game ended
+#
+# Every event also has "t" (unix time), "s" (session id) and "e" (its type).
+#
+# Emitting never touches the disk, or even takes a lock. Events go on a bounded
+# in-memory queue (a deque, appending to one is atomic) and a background thread
+# wakes every flush_interval seconds, takes them off in batches, writes each batch
+# to the log as compact JSON lines with a single write, and rotates the file once
+# it's bigger than max_bytes (events.log, events.log.1, ... up to backups old
+# files). When the queue is full, overflow decides what happens to a new event:
+#
+#   drop   it's dropped and counted (default)
+#   wait   the game waits up to max_wait seconds for the writer, then drops it
+#
+#   python events.py FILE [FILE...]      summarise logs, rotated files included
+
+import os
+import sys
+import json
+import time
+import threading
+from collections import Counter, deque
+
+OVERFLOW = ("drop", "wait")
+
+# how often a waiting emit checks for room
+WAIT_STEP = 0.001
+
+encode = json.JSONEncoder(separators=(",", ":")).encode
+
+
+class EventLog:
+    def __init__(self, path, max_bytes=16 * 2 ** 20, backups=5, queue_size=65536, batch_size=4096,
+                 flush_interval=0.2, overflow="drop", max_wait=0.01, metrics=None):
+        if overflow not in OVERFLOW:
+            raise ValueError(f"Unknown overflow policy {overflow!r}, expected one of {', '.join(OVERFLOW)}")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.max_wait = max_wait
+        self.metrics = metrics
+        self.queue_size = queue_size
+        self.queue = deque()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.file = None
+        self.size = 0
+        self.queued = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.rotations = 0
+
+    # An event stream for one session, what Game takes as events
+    def session(self, session_id):
+        return SessionEvents(self, session_id)
+
+    # Queue an event for writing, False if it had to be dropped
+    def put(self, event):
+        if len(self.queue) >= self.queue_size and not self._wait():
+            self.dropped += 1
+            if self.metrics is not None:
+                self.metrics.inc("iris_events_total", result="dropped")
+            return False
+        self.queue.append(event)
+        self.queued += 1
+        if self.metrics is not None:
+            self.metrics.inc("iris_events_total", result="queued")
+        return True
+
+    # backpressure: give the writer up to max_wait seconds to make room
+    def _wait(self):
+        if self.overflow != "wait" or self.thread is None:
+            return False
+        deadline = time.monotonic() + self.max_wait
+        while len(self.queue) >= self.queue_size:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(WAIT_STEP)
+        return True
+
+    # --- writer thread ---------------------------------------------------------
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(self.path, "ab")
+        self.size = self.file.tell()
+
+    # events.log -> events.log.1 -> events.log.2 ..., the oldest falls off the end
+    def _rotate(self):
+        self.file.close()
+        for number in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{number}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{number + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.rotations += 1
+        self._open()
+
+    def _write(self, batch):
+        for event in batch:
+            # milliseconds are plenty, rounded here rather than when the game emits
+            event["t"] = round(event["t"], 3)
+        data = "".join([encode(event) + "\n" for event in batch]).encode()
+        if self.size and self.size + len(data) > self.max_bytes:
+            self._rotate()
+        self.file.write(data)
+        self.file.flush()
+        self.size += len(data)
+        self.written += len(batch)
+        self.batches += 1
+
+    # write out everything queued so far, a batch at a time
+    def _drain(self):
+        pending = self.queue
+        while pending:
+            batch = [pending.popleft() for _ in range(min(len(pending), self.batch_size))]
+            self._write(batch)
+
+    def _run(self):
+        while not self.stopped.wait(self.flush_interval):
+            self._drain()
+        self._drain()
+
+    def start(self):
+        self._open()
+        self.thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+        self.thread.start()
+        return self
+
+    # write everything still queued and close the file
+    def stop(self):
+        if self.thread:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def stats(self):
+        return {
+            "queued": self.queued,
+            "dropped": self.dropped,
+            "written": self.written,
+            "backlog": len(self.queue),
+            "batches": self.batches,
+            "rotations": self.rotations,
+        }
+
+
+# One session's events, stamped with its id
+class SessionEvents:
+    __slots__ = ("log", "session")
+
+    def __init__(self, log, session):
+        self.log = log
+        self.session = session
+
+    def emit(self, kind, **fields):
+        return self.log.put({"t": time.time(), "s": self.session, "e": kind, **fields})
+
+
+# --- analysis --------------------------------------------------------------------
+
+# A log and its rotated files, oldest first
+def log_files(path):
+    found = []
+    number = 1
+    while os.path.exists(f"{path}.{number}"):
+        found.append(f"{path}.{number}")
+        number += 1
+    found.reverse()
+    if os.path.exists(path):
+        found.append(path)
+    return found
+
+
+def read_events(paths):
+    for path in paths:
+        for name in log_files(path):
+            with open(name, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+
+# What the designers asked about: rooms players keep coming back to, keypad
+# attempts, the Old Rover's antenna and how games end
+def summarize(events):
+    sessions = set()
+    entered = Counter()
+    revisits = Counter()
+    seen = {}
+    keypad_attempts = Counter()
+    unlocked = set()
+    rover_met = set()
+    harvested = set()
+    endings = Counter()
+    for event in events:
+        session = event["s"]
+        sessions.add(session)
+        kind = event["e"]
+        if kind in ("command", "answer") and "to" in event:
+            room = event["to"]
+            entered[room] += 1
+            visited = seen.setdefault(session, set())
+            if room in visited:
+                revisits[room] += 1
+            visited.add(room)
+        if kind == "answer":
+            if event["dialog"] == "keypad":
+                keypad_attempts[session] += 1
+            elif event["dialog"] == "old_rover":
+                rover_met.add(session)
+        elif kind == "flag":
+            if event["flag"] == "comms_unlocked" and event["value"]:
+                unlocked.add(session)
+            elif event["flag"] == "old_rover_alive" and not event["value"]:
+                harvested.add(session)
+        elif kind == "ending":
+            endings[event["ending"]] += 1
+
+    attempts = sum(keypad_attempts.values())
+    return {
+        "sessions": len(sessions),
+        "rooms": {room: {"entered": entered[room], "revisits": revisits[room]} for room, _ in entered.most_common()},
+        "keypad": {
+            "sessions": len(keypad_attempts),
+            "attempts": attempts,
+            "failures": attempts - len(unlocked & set(keypad_attempts)),
+            "unlocked": len(unlocked),
+        },
+        "old_rover": {"decided": len(rover_met), "harvested": len(harvested & rover_met),
+                      "left": len(rover_met - harvested)},
+        "endings": dict(endings.most_common()),
+    }
+
+
+if __name__ == "__main__":
+    paths = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    if not paths:
+        print("usage: python events.py FILE [FILE...] [--json]")
+        sys.exit(2)
+    summary = summarize(read_events(paths))
+    if "--json" in sys.argv:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(f"{summary['sessions']} sessions\n")
+        print(f"{'room':<28} {'entered':>8} {'revisits':>9}")
+        for room, counts in summary["rooms"].items():
+            print(f"{room:<28} {counts['entered']:>8} {counts['revisits']:>9}")
+        keypad = summary["keypad"]
+        print(f"\nkeypad: {keypad['attempts']} attempts in {keypad['sessions']} sessions, "
+              f"{keypad['failures']} failed, {keypad['unlocked']} unlocked")
+        rover = summary["old_rover"]
+        print(f"old rover: {rover['harvested']} harvested the antenna, {rover['left']} left it "
+              f"({rover['decided']} decided)")
+        print("\nendings:")
+        for ending, count in summary["endings"].items():
+            print(f"  {ending:<20} {count}")
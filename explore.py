@@ -0,0 +1,282 @@
+## State-space explorer
+#
+# Walks every state the game can reach from a new Player, breadth first, trying
+# every move, every take and use of a plot item and every answer to every prompt.
+# States are deduplicated by a canonical hash of their snapshot and each BFS level
+# is expanded across a process pool. The report lists every ending that can be
+# reached with the shortest way to get there, plus dead ends (states no command
+# can leave) and softlocks (states from which no ending can be reached any more).
+#
+#   python explore.py [--workers N] [--json]
+
+import sys
+import json
+import time
+import hashlib
+from multiprocessing import Pool
+
+from main import Clock, FixedRoll, Game, GameIO, Player, world_template
+
+MOVES = ("forward", "back", "left", "right")
+
+# Item pairs the game reacts to beyond the requires/contains data on items
+USE_PAIRS = tuple(world_template.triggers.keys("use"))
+
+# "moves" triggers fire at an exact move count, so every count past the last of
+# them plays out the same and states only need to tell counts up to here apart
+MOVE_CAP = max(world_template.triggers.keys("moves"), default=-1) + 1
+
+# Answers worth trying for each kind of prompt
+ACCESS_CODES = ("EMBER-IRIS-8924", "0000")
+CONFIRM = ("yes", "no")
+CHOICES = ("1", "2")
+
+# Rolls fed to the IRIS ending: one under both extraterrestrial chances, one over
+ROLLS = {"low roll": 0.0, "high roll": 0.99}
+
+# Outcome reported for smashing IRIS, which doesn't end the game
+IRIS_DESTROYED = "IRIS DESTROYED"
+
+
+# Port that throws all output away
+class ExplorerIO(GameIO):
+    def __init__(self):
+        super().__init__(Clock(time_scale=0))
+
+    def write(self, text):
+        pass
+
+
+def answers_for(prompt):
+    if "ACCESS CODE" in prompt:
+        return ACCESS_CODES
+    if "(yes/no)" in prompt:
+        return CONFIRM
+    return CHOICES
+
+
+# Items that can matter to how the game ends. Everything else can be carried
+# around freely without changing anything, so the explorer never picks it up.
+def plot_items(template):
+    names = {name for pair in USE_PAIRS for name in pair}
+    for item in template.item_list:
+        if item.requires or item.contains:
+            names.add(item.name)
+            names.update(item.requires)
+            names.update(template.items[key].name for key in item.contains if key in template.items)
+    return frozenset(names)
+
+
+# Canonical key for a game state, equal for states that play out the same way:
+# item order doesn't matter, rooms back to their original contents count as untouched,
+# and the move count is capped at MOVE_CAP
+def canonical(game):
+    template = game.rooms.template
+    player = game.player
+    moved = []
+    for room_name, room_items in game.rooms.moved.items():
+        contents = sorted(room_items.ids)
+        if contents != sorted(template.rooms[room_name].items.ids):
+            moved.append((template.room_ids[room_name], tuple(contents)))
+    state = (
+        player.room_id, player.facing, min(player.move_count, MOVE_CAP), player.flags.bits,
+        tuple(sorted(player.inventory.ids)), tuple(sorted(moved)), game.running, game.ending,
+    )
+    return hashlib.blake2b(repr(state).encode(), digest_size=16).digest(), game.snapshot()
+
+
+# --- worker side -------------------------------------------------------------
+
+_worker = {}
+
+def _init_worker():
+    io = ExplorerIO()
+    game = Game(Player("Explorer", world_template, io=io), world_template, io=io)
+    _worker["game"] = game
+    _worker["plot"] = plot_items(world_template)
+
+
+def candidate_commands(game, plot):
+    commands = [f"move {move}" for move in MOVES]
+    room_items = [item for item in game.rooms.items_in(game.player.current_room) if item.name in plot]
+    carried = [item for item in game.player.inventory if item.name in plot]
+    commands += [f"take {item.name}" for item in room_items]
+    for tool in carried:
+        for target in room_items + carried:
+            if target is not tool:
+                commands.append(f"use {tool.name} on {target.name}")
+    return commands
+
+
+# Run one command from a state with the given answers and roll.
+# Returns the question asked next if the answers ran out, else the new state.
+def run(snapshot, command, answers, roll):
+    game = _worker["game"]
+    game.restore(snapshot)
+    game.rng = FixedRoll(roll)
+    game.step(command)
+    for answer in answers:
+        game.step(answer)
+    if game.dialog is not None:
+        return game.io.render(game.dialog.prompt(game)), None, None
+    key, child = canonical(game)
+    return None, (key, child, game.ending, game.player.flags["iris_broken"]), game.rng.used
+
+
+# Every transition out of a state, as (command label, lines typed, child key, child snapshot,
+# ending, iris broken)
+def expand(snapshot):
+    game = _worker["game"]
+    game.restore(snapshot)
+    transitions = []
+    for command in candidate_commands(game, _worker["plot"]):
+        pending = [()]
+        while pending:
+            answers = pending.pop()
+            prompt, child, rolled = run(snapshot, command, answers, ROLLS["low roll"])
+            if prompt is not None:
+                pending.extend(answers + (answer,) for answer in answers_for(prompt))
+                continue
+            label = command + (f" [{', '.join(answers)}]" if answers else "")
+            lines = (command,) + answers
+            if not rolled:
+                transitions.append((label, lines) + child)
+                continue
+            # the IRIS roll decides the ending, so follow both sides of it
+            for name, roll in ROLLS.items():
+                _, child, _ = run(snapshot, command, answers, roll)
+                transitions.append((f"{label} ({name})", lines) + child)
+    return transitions
+
+
+def expand_batch(batch):
+    return [(key, expand(snapshot)) for key, snapshot in batch]
+
+
+# --- driver ------------------------------------------------------------------
+
+class Exploration:
+    def __init__(self):
+        self.parents = {}
+        # state key -> the lines typed to get there from its parent
+        self.lines = {}
+        self.edges = {}
+        self.endings = {}
+        self.terminals = set()
+        self.levels = 0
+        self.elapsed = 0.0
+
+    def path_to(self, key):
+        path = []
+        while self.parents[key] is not None:
+            key, command = self.parents[key]
+            path.append(command)
+        return path[::-1]
+
+    # what to type to get to a state: every command and answer, in order
+    def lines_to(self, key):
+        lines = []
+        while self.parents[key] is not None:
+            lines[:0] = self.lines[key]
+            key = self.parents[key][0]
+        return lines
+
+    # states from which no ending can be reached (terminal states excluded)
+    def softlocks(self):
+        reverse = {}
+        for key, transitions in self.edges.items():
+            for _, child in transitions:
+                reverse.setdefault(child, set()).add(key)
+        winning = set(self.terminals)
+        frontier = list(winning)
+        while frontier:
+            key = frontier.pop()
+            for parent in reverse.get(key, ()):
+                if parent not in winning:
+                    winning.add(parent)
+                    frontier.append(parent)
+        return [key for key in self.edges if key not in winning]
+
+    def dead_ends(self):
+        return [key for key, transitions in self.edges.items()
+                if all(child == key for _, child in transitions)]
+
+    def report(self):
+        softlocks = self.softlocks()
+        dead_ends = self.dead_ends()
+        return {
+            "states": len(self.parents),
+            "levels": self.levels,
+            "seconds": round(self.elapsed, 3),
+            "endings": {name: self.path_to(key) for name, key in self.endings.items()},
+            "dead_ends": len(dead_ends),
+            "softlocks": len(softlocks),
+            "softlock_example": self.path_to(min(softlocks, key=lambda key: len(self.path_to(key)))) if softlocks else None,
+        }
+
+
+# Breadth first from a new game. With until, stops after the level that first
+# reaches that ending, which is enough for the shortest way there.
+def explore(workers=None, batch_size=64, until=None):
+    started = time.perf_counter()
+    _init_worker()
+    start = Game(Player("Explorer", world_template, io=ExplorerIO()), world_template)
+    root, snapshot = canonical(start)
+
+    result = Exploration()
+    result.parents[root] = None
+    frontier = [(root, snapshot)]
+    with Pool(workers, initializer=_init_worker) as pool:
+        while frontier:
+            result.levels += 1
+            batches = [frontier[i:i + batch_size] for i in range(0, len(frontier), batch_size)]
+            next_frontier = []
+            for expanded in pool.imap(expand_batch, batches):
+                for key, transitions in expanded:
+                    result.edges[key] = []
+                    for command, lines, child, child_snapshot, ending, iris_broken in transitions:
+                        result.edges[key].append((command, child))
+                        if child in result.parents:
+                            continue
+                        result.parents[child] = (key, command)
+                        result.lines[child] = lines
+                        if iris_broken and IRIS_DESTROYED not in result.endings:
+                            result.endings[IRIS_DESTROYED] = child
+                        if ending:
+                            result.terminals.add(child)
+                            result.endings.setdefault(ending, child)
+                        else:
+                            next_frontier.append((child, child_snapshot))
+            frontier = next_frontier
+            if until in result.endings:
+                break
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+# The lines a player types to reach an ending the quickest way
+def shortest_lines(ending, workers=None):
+    result = explore(workers, until=ending)
+    if ending not in result.endings:
+        raise ValueError(f"No way to reach the {ending} ending")
+    return result.lines_to(result.endings[ending])
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    workers = int(args[args.index("--workers") + 1]) if "--workers" in args else None
+    report = explore(workers).report()
+    if "--json" in args:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"Explored {report['states']} states in {report['levels']} levels ({report['seconds']}s)")
+        for ending, path in sorted(report["endings"].items()):
+            print(f"\n{ending} in {len(path)} commands:")
+            for command in path:
+                print(f"  {command}")
+        print(f"\nDead ends: {report['dead_ends']}")
+        print(f"Softlocks: {report['softlocks']}")
+        if report["softlock_example"]:
+            print("Shortest way into a softlock:")
+            for command in report["softlock_example"]:
+                print(f"  {command}")
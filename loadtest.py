@@ -0,0 +1,382 @@
+## Load test
+#
+# Finds out how many players a host can serve before responses slow down. Starts
+# a game server on this machine (or uses one given with --port) and connects
+# --bots simulated players to it, ramped up over --ramp seconds. Each session
+# follows one of these scripts, picked at random with the --mix weights:
+#
+#   wander   random moves, answering whatever the game asks
+#   spam     look and exits over and over
+#   rescue   the shortest way to the RESCUED ending, then a new session (worked out
+#            with the explorer when the run starts, so it follows the world)
+#   fuzz     commands with typos in them, which go through the suggestion path
+#
+# Players wait about --think seconds between commands and leave after
+# --session-length commands to make room for a new session. Latency is timed
+# from sending a line until the server hands the turn back. The report has the
+# throughput and p50/p95/p99 latency for every --interval seconds of the run and
+# for the whole run by script and by command, and is written as JSON. Given a
+# baseline from an earlier run, the summary is compared against it.
+#
+# Thousands of bots can use more CPU than one client process has: --processes
+# splits them over several. Run the server with --time-scale 0 (the default when
+# it's started here) or cutscene pauses count as latency.
+#
+#   python loadtest.py [--bots N] [--duration SECONDS] [--ramp SECONDS] [--think SECONDS]
+#                      [--mix wander=4,spam=3,rescue=2,fuzz=1] [--session-length N]
+#                      [--interval SECONDS] [--processes P] [--workers W] [--time-scale 0]
+#                      [--host 127.0.0.1] [--port PORT] [--timeout SECONDS] [--seed S]
+#                      [--json FILE] [--baseline FILE]
+
+import sys
+import json
+import math
+import time
+import random
+import signal
+import asyncio
+import platform
+import multiprocessing
+
+from explore import shortest_lines
+from main import world_template
+from server import GameServer, LocalClient
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Processes are spawned, not forked, for the same reason as cluster.py's workers
+SPAWN = multiprocessing.get_context("spawn")
+
+MOVES = ("forward", "back", "left", "right")
+ANSWERS = ("yes", "no", "1", "2", "EMBER-IRIS-8924")
+
+# Lines the fuzz script misspells
+FUZZ_LINES = ("look", "exits", "inventory", "help", "move forward", "move left", "take small wrench",
+              "inspect small wrench", "take oily rag", "use small wrench on small wrench")
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+PERCENTILES = (50, 95, 99)
+
+
+# --- scripts -------------------------------------------------------------------
+#
+# A script is made from the bot's RNG and the run's plan, and is a generator of
+# (kind, line) pairs. After each line it's sent whether the game is now waiting on
+# an answer to a question (the server says so, see LocalClient.asking), so it can
+# answer. kind groups the latencies in the report.
+
+def wander(rng, plan):
+    while True:
+        if rng.random() < 0.2:
+            asking = yield "look", "look"
+        else:
+            asking = yield "move", f"move {rng.choice(MOVES)}"
+        while asking:
+            asking = yield "answer", rng.choice(ANSWERS)
+
+
+def spam(rng, plan):
+    while True:
+        yield "look", "look"
+        if rng.random() < 0.5:
+            yield "exits", "exits"
+
+
+def rescue(rng, plan):
+    asking = False
+    for line in plan["rescue"]:
+        asking = yield ("answer" if asking else line.split()[0]), line
+
+
+def typo(rng, text):
+    i = rng.randrange(len(text))
+    edit = rng.randrange(4)
+    if edit == 0:
+        return text[:i] + text[i + 1:]
+    if edit == 1:
+        return text[:i] + rng.choice(LETTERS) + text[i + 1:]
+    if edit == 2:
+        return text[:i] + rng.choice(LETTERS) + text[i:]
+    j = min(i + 1, len(text) - 1)
+    return text[:i] + text[j] + text[i] + text[j + 1:] if j > i else text
+
+
+def fuzz(rng, plan):
+    while True:
+        asking = yield "typo", typo(rng, rng.choice(FUZZ_LINES))
+        while asking:
+            asking = yield "answer", rng.choice(ANSWERS)
+
+
+SCRIPTS = {"wander": wander, "spam": spam, "rescue": rescue, "fuzz": fuzz}
+DEFAULT_MIX = {"wander": 4, "spam": 3, "rescue": 2, "fuzz": 1}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCRIPTS:
+            raise ValueError(f"Unknown script {name!r}, expected one of {', '.join(SCRIPTS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+# --- bots ----------------------------------------------------------------------
+
+# Lets one client process hold thousands of connections
+def raise_file_limit():
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = max(soft, 65536) if hard == resource.RLIM_INFINITY else hard
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+
+# One simulated player, session after session until the deadline. Every line sent
+# is recorded as (seconds since the start, script, kind, latency, ok).
+async def bot(plan, delay, records, rng):
+    host, port, started, deadline = plan["host"], plan["port"], plan["started"], plan["deadline"]
+    names, weights = list(plan["mix"]), list(plan["mix"].values())
+    await asyncio.sleep(delay)
+    while time.time() < deadline:
+        name = rng.choices(names, weights)[0]
+        client = LocalClient(host, port)
+        sent = time.time()
+        t0 = time.perf_counter()
+        try:
+            await asyncio.wait_for(client.connect(), plan["timeout"])
+        except (OSError, asyncio.TimeoutError):
+            records.append((sent - started, name, "connect", time.perf_counter() - t0, False))
+            await asyncio.sleep(plan["think"])
+            continue
+        records.append((sent - started, name, "connect", time.perf_counter() - t0, True))
+        script = SCRIPTS[name](rng, plan)
+        try:
+            kind, line = next(script)
+            for _ in range(plan["session_length"]):
+                await asyncio.sleep(rng.expovariate(1 / plan["think"]) if plan["think"] > 0 else 0)
+                if time.time() >= deadline:
+                    break
+                sent = time.time()
+                t0 = time.perf_counter()
+                try:
+                    await asyncio.wait_for(client.send(line), plan["timeout"])
+                except (OSError, asyncio.TimeoutError):
+                    records.append((sent - started, name, kind, time.perf_counter() - t0, False))
+                    break
+                records.append((sent - started, name, kind, time.perf_counter() - t0, True))
+                # the game is over and the server hung up
+                if client.reader.at_eof():
+                    break
+                kind, line = script.send(client.asking)
+        except StopIteration:
+            pass
+        finally:
+            try:
+                await client.close()
+            except OSError:
+                pass
+
+
+async def run_bots(plan, first, count):
+    records = []
+    ramp = plan["ramp"]
+    total = plan["bots"]
+    rng = random.Random(repr((plan["seed"], first)))
+    await asyncio.gather(*(
+        bot(plan, (first + i) * ramp / total, records, random.Random(rng.random())) for i in range(count)))
+    return records
+
+
+def _bot_process(task):
+    plan, first, count = task
+    raise_file_limit()
+    return asyncio.run(run_bots(plan, first, count))
+
+
+# --- local server --------------------------------------------------------------
+
+def serve_main(conn, workers, time_scale):
+    raise_file_limit()
+    # exit normally when terminated, so a cluster router takes its workers down with it
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    async def serve():
+        if workers:
+            from cluster import Router
+            server = Router("127.0.0.1", 0, workers, time_scale, color=True)
+        else:
+            server = GameServer("127.0.0.1", 0, time_scale)
+        await server.start()
+        conn.send(server.port)
+        conn.close()
+        await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+def start_server(workers=0, time_scale=0.0):
+    parent, child = SPAWN.Pipe(duplex=False)
+    # not a daemon, a cluster router has worker processes of its own
+    process = SPAWN.Process(target=serve_main, args=(child, workers, time_scale), name="iris-loadtest-server")
+    process.start()
+    child.close()
+    try:
+        port = parent.recv()
+    except EOFError:
+        raise RuntimeError("the game server exited before it started listening") from None
+    finally:
+        parent.close()
+    return process, port
+
+
+# --- report --------------------------------------------------------------------
+
+def latency_stats(latencies, seconds=None):
+    latencies = sorted(latencies)
+    stats = {"commands": len(latencies)}
+    if seconds:
+        stats["throughput"] = len(latencies) / seconds
+    for p in PERCENTILES:
+        stats[f"p{p}_ms"] = latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] * 1000 if latencies else None
+    stats["max_ms"] = latencies[-1] * 1000 if latencies else None
+    return stats
+
+
+def build_report(records, plan, elapsed):
+    ok = [record for record in records if record[4]]
+    commands = [record for record in ok if record[2] != "connect"]
+
+    summary = latency_stats([record[3] for record in commands], elapsed)
+    summary["errors"] = len(records) - len(ok)
+    summary["sessions"] = sum(1 for record in records if record[2] == "connect")
+
+    def grouped(field, records):
+        groups = {}
+        for record in records:
+            groups.setdefault(record[field], []).append(record[3])
+        return {name: latency_stats(latencies, elapsed) for name, latencies in sorted(groups.items())}
+
+    interval = plan["interval"]
+    buckets = {}
+    for record in records:
+        buckets.setdefault(int(record[0] // interval), []).append(record)
+    timeline = []
+    for bucket in range(math.ceil(elapsed / interval)):
+        found = buckets.get(bucket, [])
+        stats = latency_stats([record[3] for record in found if record[4] and record[2] != "connect"], interval)
+        stats["t"] = bucket * interval
+        stats["errors"] = sum(1 for record in found if not record[4])
+        timeline.append(stats)
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "system": platform.system(),
+            "world": world_template.fingerprint,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "config": {name: plan[name] for name in ("bots", "duration", "ramp", "think", "mix", "session_length",
+                                                 "interval", "processes", "workers", "seed", "target")},
+        "summary": summary,
+        "scripts": grouped(1, commands),
+        "commands": grouped(2, ok),
+        "timeline": timeline,
+    }
+
+
+def load_test(bots=1000, duration=30.0, ramp=5.0, think=1.0, mix=None, session_length=100, interval=1.0,
+              processes=1, workers=0, time_scale=0.0, host="127.0.0.1", port=None, timeout=10.0, seed=0):
+    mix = mix or dict(DEFAULT_MIX)
+    rescue_lines = shortest_lines("RESCUED") if mix.get("rescue") else []
+    server = None
+    if port is None:
+        server, port = start_server(workers, time_scale)
+    try:
+        started = time.time() + 0.5
+        plan = {
+            "host": host, "port": port, "bots": bots, "duration": duration, "ramp": ramp, "think": think,
+            "mix": mix, "session_length": session_length, "interval": interval, "rescue": rescue_lines,
+            "processes": processes, "workers": workers, "seed": seed, "timeout": timeout,
+            "target": "local" if server else f"{host}:{port}",
+            "started": started, "deadline": started + duration,
+        }
+        # bots split evenly over the client processes, numbered so the ramp stays even
+        shares = [bots // processes + (1 if i < bots % processes else 0) for i in range(processes)]
+        tasks = [(plan, sum(shares[:i]), n) for i, n in enumerate(shares) if n]
+        if len(tasks) == 1:
+            raise_file_limit()
+            records = asyncio.run(run_bots(*tasks[0]))
+        else:
+            with SPAWN.Pool(len(tasks)) as pool:
+                records = [record for found in pool.map(_bot_process, tasks) for record in found]
+        elapsed = max(0.001, min(time.time(), plan["deadline"]) - started)
+        return build_report(records, plan, elapsed)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
+
+
+# Change in the summary against a baseline run, as a percentage
+def compare(report, baseline):
+    changes = {}
+    for name in ("throughput", *(f"p{p}_ms" for p in PERCENTILES)):
+        now, before = report["summary"].get(name), baseline.get("summary", {}).get(name)
+        if now is not None and before:
+            changes[name] = (now - before) / before * 100
+    return changes
+
+
+def ms(value):
+    return f"{value:10.2f}" if value is not None else f"{'-':>10}"
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+
+    def option(name, default=None):
+        return args[args.index(name) + 1] if name in args else default
+
+    report = load_test(
+        bots=int(option("--bots", 1000)), duration=float(option("--duration", 30)), ramp=float(option("--ramp", 5)),
+        think=float(option("--think", 1.0)), mix=parse_mix(option("--mix")) if option("--mix") else None,
+        session_length=int(option("--session-length", 100)), interval=float(option("--interval", 1)),
+        processes=int(option("--processes", 1)), workers=int(option("--workers", 0)),
+        time_scale=float(option("--time-scale", 0)), host=option("--host", "127.0.0.1"),
+        port=int(option("--port")) if option("--port") else None, timeout=float(option("--timeout", 10)),
+        seed=int(option("--seed", 0)))
+
+    print(f"{'t':>6} {'cmd/s':>9} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'errors':>7}")
+    for row in report["timeline"]:
+        print(f"{row['t']:>6.0f} {row['throughput']:>9.1f} {ms(row['p50_ms'])} {ms(row['p95_ms'])} "
+              f"{ms(row['p99_ms'])} {row['errors']:>7}")
+
+    print(f"\n{'':<18} {'commands':>9} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'max ms':>10}")
+    for title, group in (("script", report["scripts"]), ("command", report["commands"])):
+        for name, stats in group.items():
+            print(f"{title + ' ' + name:<18} {stats['commands']:>9} {ms(stats['p50_ms'])} {ms(stats['p95_ms'])} "
+                  f"{ms(stats['p99_ms'])} {ms(stats['max_ms'])}")
+
+    summary = report["summary"]
+    print(f"\n{summary['commands']} commands in {summary['sessions']} sessions, {summary['throughput']:.1f}/s, "
+          f"{summary['errors']} errors, p50 {ms(summary['p50_ms']).strip()} ms, p95 {ms(summary['p95_ms']).strip()} ms, "
+          f"p99 {ms(summary['p99_ms']).strip()} ms")
+
+    if option("--baseline"):
+        with open(option("--baseline")) as f:
+            changes = compare(report, json.load(f))
+        print("vs baseline: " + ", ".join(f"{name} {change:+.1f}%" for name, change in changes.items()))
+
+    with open(option("--json", "loadtest.json"), "w") as f:
+        json.dump(report, f, indent=2)
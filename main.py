@@ -1,9 +1,23 @@
 ## Start Dhyan's Code
 
+import re
+import sys
 import time
 import random
 # library for fuzzy spellcheck
 import difflib
+import os
+import json
+import marshal
+import hashlib
+import secrets
+import struct
+import zlib
+from array import array
+from collections import deque
+
+from events import EventLog
+from metrics import Metrics, PrometheusFileExporter
 
 # Class to create exceptions for game errors
 class GameError(Exception):
@@ -21,72 +35,351 @@ class Colors:
     BOLD = "\033[1m"
     UNDERLINE = "\033[4m"
 
-# main player class
+COLOR_NAMES = {name: code for name, code in vars(Colors).items() if name.isupper()}
+
+ANSI_CODES = re.compile(r"\x1b\[[0-9;]*m")
+
+def strip_ansi(text):
+    return ANSI_CODES.sub("", text)
+
+# Output text with {RED}-style colour placeholders, resolved once into a coloured and
+# a plain variant so nothing is rebuilt or stripped per command. Other {fields} are
+# filled in by output(template, field=value).
+class Template:
+    __slots__ = ("color", "plain")
+
+    def __init__(self, text):
+        color = plain = text
+        for name, code in COLOR_NAMES.items():
+            color = color.replace("{" + name + "}", code)
+            plain = plain.replace("{" + name + "}", "")
+        self.color = color
+        self.plain = plain
+
+    def render(self, color=True, **values):
+        text = self.color if color else self.plain
+        return text.format(**values) if values else text
+
+# Compass directions in clockwise order
+DIRECTIONS = ("north", "east", "south", "west")
+DIRECTION_IDS = {direction: i for i, direction in enumerate(DIRECTIONS)}
+
+# Everything the player can type for each relative direction
+DIRECTION_ALIASES = {
+    "front": ("front", "forward", "f", "forwards", "frontward"),
+    "back": ("back", "backward", "b", "backwards"),
+    "left": ("left", "l"),
+    "right": ("right", "r"),
+}
+RELATIVE_ALIASES = {alias: key for key, aliases in DIRECTION_ALIASES.items() for alias in aliases}
+
+# Lookup tables between relative and compass directions, built once:
+# ABSOLUTE_DIRECTION[facing][relative] and RELATIVE_DIRECTION[facing][absolute]
+ABSOLUTE_DIRECTION = {
+    facing: {relative: DIRECTIONS[(i + offset) % 4] for offset, relative in enumerate(("front", "right", "back", "left"))}
+    for i, facing in enumerate(DIRECTIONS)
+}
+RELATIVE_DIRECTION = {
+    facing: {DIRECTIONS[(i + offset) % 4]: relative for offset, relative in enumerate(("forward", "right", "back", "left"))}
+    for i, facing in enumerate(DIRECTIONS)
+}
+
+# Structured result of a single command: the lines it printed, the prompts it answered
+# (with the answers given), the state it changed, as {key: (before, after)}, and the
+# question it stopped at if it's now waiting for an answer
+class CommandResult:
+    def __init__(self, command):
+        self.command = command
+        self.lines = []
+        self.prompts = []
+        self.changes = {}
+        self.awaiting = None
+
+    def __repr__(self):
+        awaiting = f", awaiting={self.awaiting!r}" if self.awaiting is not None else ""
+        return f"CommandResult({self.command!r}, lines={len(self.lines)}, changes={self.changes}{awaiting})"
+
+# Clock used for cutscene pacing. Every pause is multiplied by time_scale,
+# so 0.5 plays cutscenes twice as fast and 0 makes them instant.
+class Clock:
+    def __init__(self, time_scale=1.0):
+        self.time_scale = max(0.0, float(time_scale))
+
+    def now(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        if self.time_scale > 0 and seconds > 0:
+            time.sleep(seconds * self.time_scale)
+
+# Clock that never really waits, it only advances its own counter.
+# Used by headless sessions and tests so cutscenes finish straight away.
+class VirtualClock(Clock):
+    def __init__(self, time_scale=0.0):
+        super().__init__(time_scale)
+        self.elapsed = 0.0
+
+    def now(self):
+        return self.elapsed
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.elapsed += seconds * self.time_scale
+
+# Count an error reported to the player, when the session records metrics
+def record_error(io, where, error):
+    if io.metrics is not None:
+        io.metrics.inc("iris_errors_total", where=where, type=type(error).__name__)
+
+# Base I/O port. All game output goes through output() and questions are shown with
+# ask(), so the engine never touches print() or input() directly. The engine never
+# reads either: a question ends the command and the answer comes in as the next
+# input (see Dialog). read() is for whatever drives the game, like Game.start().
+# Subclasses only need to implement write() and read().
+#
+# While a command runs the output is held in a buffer and written with one write()
+# when it's done (or when the game stops to ask something or pause a cutscene).
+# Clients without colour get the same text with the ANSI codes left out.
+class GameIO:
+    def __init__(self, clock=None, color=True):
+        self.result = None
+        # cutscenes read time from the port's clock
+        self.clock = clock or Clock()
+        # set by Game when the session records metrics
+        self.metrics = None
+        self.color = color
+        # output waiting for flush(), None when writes go straight through
+        self.buffer = None
+        # lines output while Game.cached() renders a view, None otherwise
+        self.captured = None
+
+    def write(self, text):
+        raise NotImplementedError
+
+    def read(self, prompt=""):
+        raise NotImplementedError
+
+    # record a line in the current command result without writing it
+    def record(self, text):
+        if self.result is not None:
+            self.result.lines.append(text)
+
+    def send(self, text):
+        if self.buffer is None:
+            self.write(text)
+        else:
+            self.buffer.append(text)
+
+    # start collecting output instead of writing it
+    def hold(self):
+        if self.buffer is None:
+            self.buffer = []
+
+    # write whatever has been collected in one go and keep collecting
+    def flush(self):
+        if self.buffer:
+            text = "".join(self.buffer)
+            self.buffer.clear()
+            self.write(text)
+
+    # flush and go back to writing straight through
+    def release(self):
+        self.flush()
+        self.buffer = None
+
+    # text for this client: a Template's matching variant, or a string stripped of
+    # colour codes if the client can't show them
+    def render(self, text, **values):
+        if isinstance(text, Template):
+            return text.render(self.color, **values)
+        text = str(text)
+        if not self.color and "\x1b" in text:
+            return strip_ansi(text)
+        return text
+
+    def output(self, text="", **values):
+        text = self.render(text, **values)
+        self.record(text)
+        if self.captured is not None:
+            self.captured.append(text)
+        self.send(text + "\n")
+
+    # output lines rendered earlier, as output() would have
+    def replay(self, lines):
+        if self.result is not None:
+            self.result.lines.extend(lines)
+        self.send("\n".join(lines) + "\n")
+
+    # show a question the game is stopping at, the answer is the next input
+    def ask(self, text=""):
+        text = self.render(text)
+        self.send(text)
+        if self.result is not None:
+            self.result.awaiting = text
+        return text
+
+# Terminal I/O, the default when playing normally
+# Colour only on a terminal, and never when NO_COLOR is set
+def terminal_color():
+    return sys.stdout.isatty() and not os.environ.get("NO_COLOR")
+
+class ConsoleIO(GameIO):
+    def __init__(self, clock=None, color=None):
+        if color is None:
+            color = terminal_color()
+        super().__init__(clock, color)
+
+    def write(self, text):
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+    def read(self, prompt=""):
+        return input(prompt)
+
+# Headless I/O for scripted sessions. Answers are taken from a queue instead of stdin
+# and output is kept in memory (or thrown away if keep_transcript is False).
+class HeadlessIO(GameIO):
+    def __init__(self, inputs=None, keep_transcript=True, clock=None, color=True):
+        super().__init__(clock or VirtualClock(), color)
+        self.inputs = deque(inputs or [])
+        self.keep_transcript = keep_transcript
+        self.transcript = []
+
+    def feed(self, *lines):
+        self.inputs.extend(lines)
+
+    def write(self, text):
+        if self.keep_transcript:
+            self.transcript.append(text)
+
+    def read(self, prompt=""):
+        self.write(prompt)
+        if not self.inputs:
+            raise EOFError("No scripted input left")
+        return self.inputs.popleft()
+
+    def text(self):
+        return "".join(self.transcript)
+
+# Flags to track game events and states, in a fixed order. A player keeps them as
+# the bits of one int (the layout snapshots use too) behind a dict-like Flags.
+PLAYER_FLAGS = (
+    "comms_unlocked",
+    "old_rover_alive",
+    "has_working_antenna",
+    "three_move_cutscene_played",
+    "iris_broken",
+    "entered_airlock_from_door",
+)
+FLAG_BITS = {name: 1 << bit for bit, name in enumerate(PLAYER_FLAGS)}
+DEFAULT_FLAGS = FLAG_BITS["old_rover_alive"]
+# keys of the flags in Player.state()
+FLAG_STATE_KEYS = tuple((f"flags.{name}", FLAG_BITS[name]) for name in PLAYER_FLAGS)
+
+class Flags:
+    __slots__ = ("bits",)
+
+    def __init__(self, bits=DEFAULT_FLAGS):
+        self.bits = bits
+
+    def __getitem__(self, name):
+        return bool(self.bits & FLAG_BITS[name])
+
+    def __setitem__(self, name, value):
+        if value:
+            self.bits |= FLAG_BITS[name]
+        else:
+            self.bits &= ~FLAG_BITS[name]
+
+    def get(self, name, default=None):
+        bit = FLAG_BITS.get(name)
+        return default if bit is None else bool(self.bits & bit)
+
+    def __contains__(self, name):
+        return name in FLAG_BITS
+
+    def __iter__(self):
+        return iter(PLAYER_FLAGS)
+
+    def __len__(self):
+        return len(PLAYER_FLAGS)
+
+    def keys(self):
+        return PLAYER_FLAGS
+
+    def values(self):
+        return [bool(self.bits & FLAG_BITS[name]) for name in PLAYER_FLAGS]
+
+    def items(self):
+        return [(name, bool(self.bits & FLAG_BITS[name])) for name in PLAYER_FLAGS]
+
+    def __repr__(self):
+        return f"Flags({dict(self.items())})"
+
+# main player class. Sessions can number in the hundreds of thousands, so a player
+# is slotted and keeps its room and facing as small ints; current_room and
+# facing_direction give the names.
 class Player:
-    def __init__(self, name, rooms):
+    __slots__ = ("name", "rooms", "io", "room_id", "facing", "move_count", "inventory", "flags")
+
+    def __init__(self, name, rooms, io=None):
         self.name = name
-        self.rooms = rooms
+        # every player gets their own copy-on-write world
+        self.rooms = as_world(rooms)
+        self.io = io or ConsoleIO()
         self.current_room = "rover_pad"
-        self.inventory = []
+        self.inventory = ItemBag(catalog=self.rooms.template.catalog)
         self.facing_direction = "north"
         self.move_count = 0
-        # flags to track game events and states
-        self.flags = {
-            "comms_unlocked": False,
-            "old_rover_alive": True,
-            "has_working_antenna": False,
-            "three_move_cutscene_played": False,
-            "iris_broken": False,
-            "entered_airlock_from_door": False,
+        self.flags = Flags()
+
+    @property
+    def current_room(self):
+        return self.rooms.template.room_list[self.room_id]
+
+    @current_room.setter
+    def current_room(self, name):
+        self.room_id = self.rooms.template.room_ids[name]
+
+    @property
+    def facing_direction(self):
+        return DIRECTIONS[self.facing]
+
+    @facing_direction.setter
+    def facing_direction(self, direction):
+        self.facing = DIRECTION_IDS[direction]
+
+    # flat view of the player's state, used to work out what a command changed
+    def state(self):
+        state = {
+            "current_room": self.current_room,
+            "facing_direction": self.facing_direction,
+            "move_count": self.move_count,
+            "inventory": tuple([item.name for item in self.inventory]),
         }
+        bits = self.flags.bits
+        for key, bit in FLAG_STATE_KEYS:
+            state[key] = bool(bits & bit)
+        return state
 # This game has a special movement system where movement is relative to the player's facing direction.
 # The player can move forward, backward, left, or right relative to their current facing direction
     def get_absolute_direction(self, facing, relative_direction):
         try:
-            direction_aliases = {
-                "front": {"front","forward", "f", "forwards", "frontward"},
-                "back": {"back", "backward", "b", "backwards", "backward"},
-                "left": {"left", "l"},
-                "right": {"right", "r"},
-            }
-            
-            for key, aliases in direction_aliases.items():
-                if relative_direction in aliases:
-                    relative_direction = key
-                    break
-            else:
+            relative = RELATIVE_ALIASES.get(relative_direction)
+            if relative is None:
                 # Only allow relative directions
                 raise GameError(f"Invalid direction: {relative_direction}. Use forward/back/left/right.")
             
-            directions = ["north", "east", "south", "west"]
-            offsets = {"front": 0, "right": 1, "back": 2, "left": 3}
-            
-            if facing not in directions:
+            if facing not in ABSOLUTE_DIRECTION:
                 raise GameError(f"Invalid facing direction: {facing}")
             
-            facing_index = directions.index(facing)
-            abs_index = (facing_index + offsets[relative_direction]) % 4
-            return directions[abs_index]
+            return ABSOLUTE_DIRECTION[facing][relative]
             
         except Exception as e:
             raise GameError(f"Error occurred while trying to move: {str(e)}")
             
     def get_relative_direction(self, absolute_direction):
-        directions = ["north", "east", "south", "west"]
-        if absolute_direction not in directions:
-            return absolute_direction
-            
-        facing_index = directions.index(self.facing_direction)
-        exit_index = directions.index(absolute_direction)
-        diff = (exit_index - facing_index) % 4
-        if diff == 0:
-            return "forward"
-        elif diff == 1:
-            return "right"
-        elif diff == 2:
-            return "back"
-        elif diff == 3:
-            return "left"
+        return RELATIVE_DIRECTION[self.facing_direction].get(absolute_direction, absolute_direction)
 
     def move(self, direction):
         try:
@@ -102,65 +395,34 @@ class Player:
             if absolute_direction not in room.exits:
                 raise GameError(f"Cannot move {direction} from {self.current_room}")
                 
-            new_room_name = room.exits[absolute_direction]
-
-            # Track if entering airlock from door
-            if self.current_room == "exit_hatch" and new_room_name == "open_area":
-                self.flags["entered_airlock_from_door"] = True
-            elif new_room_name == "exit_hatch" and self.current_room == "open_area":
-                self.flags["entered_airlock_from_door"] = True
-
-            # Handle special room cases
-            if new_room_name == "communications_room" and not self.flags.get("comms_unlocked"):
-                code = input(f"{Colors.YELLOW}A keypad flashes: ENTER ACCESS CODE >> {Colors.RESET}").strip().upper()
-                if code == "EMBER-IRIS-8924":
-                    print(f"{Colors.GREEN}Access granted. The door slides open.{Colors.RESET}")
-                    self.flags["comms_unlocked"] = True
-                else:
-                    print(f"{Colors.RED}Access denied. The door remains sealed.{Colors.RESET}")
-                    return
-                    
-            elif new_room_name == "exit_hatch":
-                action = "exit" if room.name != "open_area" else "enter"
-                confirm = input(f"You are about to {action} the rover. Are you sure? (yes/no) ").strip().lower()
-                if confirm != "yes":
-                    print(f"You decide to stay {'inside' if room.name != 'open_area' else 'outside'}.")
-                    return
-                
-                # Only play cutscene if entering from the door
-                if self.flags["entered_airlock_from_door"]:
-                    cutscene_text = ["Depressurising the airlock..."] if room.name != "open_area" else ["Entering the spaceship..."]
-                    Cutscene(cutscene_text, speed=0.5, lineDelay=1).play()
-                
-                self.current_room = "open_area" if room.name != "open_area" else "exit_hatch"
-                self.facing_direction = "west"
-                self.move_count += 1
-                print(self.rooms[self.current_room].description)
-                
-                # Only trigger cutscene if entered from door
-                if room.name != "open_area" and self.flags["entered_airlock_from_door"]:
-                    self.flags["three_move_cutscene_played"] = True
-                return
-                
-            elif new_room_name == "old_rover_pad" and self.flags.get("old_rover_alive"):
-                Cutscene([
-                    "You approach the Old Rover.",
-                    "It looks battered, but its antenna is intact.",
-                    "You can hear a faint hum as you get closer."
-                ], speed=0.04, lineDelay=2).play()
-                Cutscene(old_rover.dialogue, speed=0.04, lineDelay=2).play()
-                old_rover.interaction(self)
-
-            # Update player position
-            self.current_room = new_room_name
-            self.facing_direction = absolute_direction
-            print(self.rooms[self.current_room].description)
-            self.move_count += 1
+            return self.enter(room, absolute_direction)
             
         except GameError as e:
-            print(f"Movement error: {str(e)}")
+            self.io.output(f"Movement error: {str(e)}")
+            record_error(self.io, "move", e)
         except Exception as e:
-            print(f"Unexpected movement error: {str(e)}")
+            self.io.output(f"Unexpected movement error: {str(e)}")
+            record_error(self.io, "move", e)
+
+# go through the exit on that side of room. Scripted events for the room behind it
+# (a locked door, the airlock) can take over the move or stop to ask the player
+# something, then the Dialog they started is returned and finishes the move later.
+# start skips the triggers that already ran before a dialog.
+    def enter(self, room, direction, start=0):
+        new_room_name = room.exits[direction]
+        taken = self.rooms.triggers.fire("enter", new_room_name, self.flags, self, room, start=start)
+        if taken:
+            if isinstance(taken, Dialog):
+                taken.room, taken.direction = room.name, direction
+                return taken
+            return None
+
+        # Update player position
+        self.current_room = new_room_name
+        self.facing_direction = direction
+        self.io.output(self.rooms[self.current_room].description)
+        self.move_count += 1
+        return None
 
 # look command, list items in current room
     def look(self):
@@ -169,356 +431,1893 @@ class Player:
             if not room:
                 raise GameError("Current room not found")
                 
-            print(room.description)
-            if room.items:
-                print("You see the following items:")
-                for item in room.items:
-                    print(f"- {Colors.CYAN}{item.name}{Colors.RESET}")
+            self.io.output(room.description)
+            room_items = self.rooms.items_in(room.name)
+            if room_items:
+                self.io.output("You see the following items:")
+                for item in room_items:
+                    self.io.output(ITEM_LINE, name=item.name)
             else:
-                print("There seems to be no items in this room.")
+                self.io.output("There seems to be no items in this room.")
                 
         except GameError as e:
-            print(f"Look error: {str(e)}")
+            self.io.output(f"Look error: {str(e)}")
+            record_error(self.io, "look", e)
         except Exception as e:
-            print(f"Unexpected look error: {str(e)}")
+            self.io.output(f"Unexpected look error: {str(e)}")
+            record_error(self.io, "look", e)
 
 # view items in inventory
     def view_inventory(self): 
         try:
             if not self.inventory:
-                print("You currently have no items with you.")
+                self.io.output("You currently have no items with you.")
             else:
-                print("You are carrying:")
+                self.io.output("You are carrying:")
                 for item in self.inventory: 
-                    print(f"- {item.name}")
+                    self.io.output(f"- {item.name}")
                     
         except Exception as e:
-            print(f"Error viewing inventory: {str(e)}")
+            self.io.output(f"Error viewing inventory: {str(e)}")
+            record_error(self.io, "view_inventory", e)
     # get possible movement directions from current room
     def get_room_exits(self):
-        """Get exits in relative directions"""
-        room = self.rooms.get(self.current_room)
-        if not room:
+        """Get exits in relative directions (precomputed, don't modify the result)"""
+        if self.current_room not in self.rooms:
             return {}
-            
-        relative_exits = {}
-        for abs_dir, room_name in room.exits.items():
-            rel_dir = self.get_relative_direction(abs_dir)
-            relative_exits[rel_dir] = room_name
-            
-        return relative_exits
+        return self.rooms.template.navigation.exits[self.current_room][self.facing_direction]
 ## End Dhyan's Code
 
 ## Start Saatvik's Code
 
+ITEM_INSPECT = Template("{YELLOW}{description}{RESET}")
+
 # Item class to define items in the game
 class Item:
-    def __init__(self, name, description, requires=None, interactions=None, contains=None):
+    __slots__ = ("name", "description", "requires", "interactions", "contains", "aliases",
+                 "key", "keys", "prefixes")
+
+    def __init__(self, name, description, requires=None, interactions=None, contains=None, aliases=None):
         self.name = name
         self.description = description
         self.requires = requires or []
         self.interactions = interactions or {}
         self.contains = contains or []
-
+        self.aliases = aliases or []
+        # case-folded lookup keys, worked out once per item instead of on every command
+        self.key = name.casefold()
+        self.keys = self._lookup_keys()
+        self.prefixes = {key[:i] for key in self.keys for i in range(2, len(key))} - self.keys
+
+    # full name, aliases and each word of the name ("spanner" for "Rusty Spanner")
+    def _lookup_keys(self):
+        keys = {self.key}
+        keys.update(alias.casefold() for alias in self.aliases)
+        for word in self.key.split():
+            keys.add(word)
+            if word.endswith("'s"):
+                keys.add(word[:-2])
+        return keys
+
+    # what "inspect" says about the item, shown with ITEM_INSPECT
     def inspect(self):
         try:
-            return f"{Colors.YELLOW}{self.interactions.get('inspect', self.description)}{Colors.RESET}"
+            return self.interactions.get('inspect', self.description)
         except Exception:
-            return f"{Colors.YELLOW}{self.description}{Colors.RESET}"
+            return self.description
+
+# Fuzzy "did you mean" lookups over a fixed set of words.
+# Words are indexed by their letter pairs, so a typo is only compared against words
+# that share at least one pair with it, and only those are scored with difflib.
+# Answers are cached until the vocabulary changes, so repeated typos cost a dict lookup.
+class SuggestionIndex:
+    cache_size = 256
+
+    def __init__(self, words=()):
+        self.counts = {}
+        self.grams = {}
+        self.cache = {}
+        for word in words:
+            self.add(word)
+
+    @staticmethod
+    def _grams(word):
+        padded = f" {word} "
+        return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+    def add(self, word):
+        self.counts[word] = self.counts.get(word, 0) + 1
+        if self.counts[word] == 1:
+            for gram in self._grams(word):
+                self.grams.setdefault(gram, set()).add(word)
+            self.cache.clear()
+
+    def remove(self, word):
+        self.counts[word] -= 1
+        if self.counts[word] == 0:
+            del self.counts[word]
+            for gram in self._grams(word):
+                self.grams[gram].discard(word)
+                if not self.grams[gram]:
+                    del self.grams[gram]
+            self.cache.clear()
+
+    # (score, word) for the closest word scoring at least cutoff, or None
+    def best(self, query, cutoff=0.6):
+        key = (query, cutoff)
+        if key in self.cache:
+            return self.cache[key]
+
+        candidates = set()
+        for gram in self._grams(query):
+            candidates.update(self.grams.get(gram, ()))
+
+        best = None
+        matcher = difflib.SequenceMatcher()
+        matcher.set_seq2(query)
+        for word in candidates:
+            matcher.set_seq1(word)
+            if matcher.real_quick_ratio() < cutoff or matcher.quick_ratio() < cutoff:
+                continue
+            score = matcher.ratio()
+            # ties go to the later word, same as difflib.get_close_matches
+            if score >= cutoff and (best is None or (score, word) > best):
+                best = (score, word)
+
+        if len(self.cache) >= self.cache_size:
+            del self.cache[next(iter(self.cache))]
+        self.cache[key] = best
+        return best
+
+    def suggest(self, query, cutoff=0.6):
+        best = self.best(query, cutoff)
+        return best[1] if best else None
+
+# Every item of a world under a small integer id, with one name index shared by
+# all the bags holding those items. Each name maps to the ids of the items it can
+# mean, in catalog order. The ids live here rather than on the items, so one Item
+# can be in several worlds (as_world builds one per custom room set) with
+# different ids and no world changes what another one sees.
+class ItemCatalog:
+    def __init__(self, items):
+        self.items = list(items)
+        self.ids = {}
+        self.names = {}
+        self.prefixes = {}
+        for item_id, item in enumerate(self.items):
+            self.ids[item] = item_id
+            for key in item.keys:
+                self.names[key] = self.names.get(key, ()) + (item_id,)
+            for prefix in item.prefixes:
+                self.prefixes[prefix] = self.prefixes.get(prefix, ()) + (item_id,)
+
+# A collection of items (a room's contents or the inventory), stored as an array of
+# item ids. find() looks a name up in the catalog's index and keeps the matches
+# that are in this bag, so exact names, aliases and words resolve without a per-bag
+# index, then falls back to a prefix that only one item in the bag starts with.
+# Next to the array, mask has bit n set while item n is in the bag, so membership
+# is one shift however full the bag is. An int costs far less than a set per bag.
+class ItemBag:
+    __slots__ = ("catalog", "ids", "mask", "suggestions")
+
+    def __init__(self, items=(), catalog=None):
+        self.catalog = catalog
+        self.ids = array("H")
+        self.mask = 0
+        # suggestion index over the item names, built on the first miss
+        self.suggestions = None
+        for item in items:
+            self.append(item)
+
+    @classmethod
+    def from_ids(cls, ids, catalog):
+        bag = cls(catalog=catalog)
+        bag.ids.extend(ids)
+        for item_id in bag.ids:
+            bag.mask |= 1 << item_id
+        return bag
+
+    def __iter__(self):
+        if not self.ids:
+            return iter(())
+        items = self.catalog.items
+        return (items[item_id] for item_id in self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, item):
+        item_id = self.catalog.ids.get(item)
+        return item_id is not None and self.mask >> item_id & 1 == 1
+
+    def __getitem__(self, index):
+        return self.catalog.items[self.ids[index]]
+
+    def append(self, item):
+        item_id = self.catalog.ids.get(item)
+        if item_id is None:
+            raise ValueError(f"{item.name} is not in this world")
+        self.ids.append(item_id)
+        self.mask |= 1 << item_id
+        if self.suggestions:
+            self.suggestions.add(item.key)
+
+    def remove(self, item):
+        if item not in self:
+            raise ValueError(f"{item.name} is not in this bag")
+        item_id = self.catalog.ids[item]
+        self.ids.remove(item_id)
+        if item_id not in self.ids:
+            self.mask &= ~(1 << item_id)
+        if self.suggestions:
+            self.suggestions.remove(item.key)
+
+    def copy(self):
+        return ItemBag.from_ids(self.ids, self.catalog)
+
+    # the item a player means by name, None if nothing matches
+    def find(self, name):
+        if not self.ids:
+            return None
+        key = " ".join(name.split()).casefold()
+        mask = self.mask
+        matches = ([item_id for item_id in self.catalog.names.get(key, ()) if mask >> item_id & 1]
+                   or [item_id for item_id in self.catalog.prefixes.get(key, ()) if mask >> item_id & 1])
+        if not matches:
+            return None
+        items = [self.catalog.items[item_id] for item_id in matches]
+        # a full name always wins over a word of another item's name
+        exact = [item for item in items if item.key == key]
+        if exact:
+            return exact[0]
+        if len(items) > 1:
+            items.sort(key=lambda item: self.ids.index(self.catalog.ids[item]))
+            options = " or ".join(f"'{item.name}'" for item in items)
+            raise GameError(f"'{name}' could mean {options}. Please be more specific.")
+        return items[0]
+
+    # (score, name) of the closest item name for a miss, or None
+    def suggest(self, name, cutoff=0.5):
+        if self.suggestions is None:
+            self.suggestions = SuggestionIndex(item.key for item in self)
+        return self.suggestions.best(name.casefold(), cutoff)
 
 # Room class to define rooms in the game
 class Room:
+    __slots__ = ("name", "description", "exits", "items")
+
     def __init__(self, name, description, exits, items=None):
         self.name = name
         self.description = description
         self.exits = exits
         self.items = items or []
 
+# The world as it is at the start of the game. Shared by every session and never
+# modified once built. It keeps its own copy of each room, with the contents as an
+# ItemBag of its catalog, so the Room objects it was built from are left as they were.
+class WorldTemplate:
+    def __init__(self, items, rooms, npcs=None, cutscenes=None, triggers=None):
+        self.items = items
+        self.npcs = npcs or {}
+        self.cutscenes = cutscenes or {}
+        self.triggers = triggers or TriggerIndex()
+        # small integer ids for rooms and items, used by sessions and snapshots
+        self.catalog = ItemCatalog(items.values())
+        self.item_list = self.catalog.items
+        self.item_ids = self.catalog.ids
+        self.rooms = {}
+        for name, room in rooms.items():
+            own = self.rooms[name] = Room(room.name, room.description, room.exits)
+            own.items = ItemBag(room.items, self.catalog)
+        self.room_list = list(rooms)
+        self.room_ids = {name: i for i, name in enumerate(self.room_list)}
+        # rooms behind a keypad, and the player flags they're locked under
+        locks = {trigger.key: trigger.flags for trigger in self.triggers.triggers
+                 if trigger.event == "enter" and trigger.action is keypad_trigger}
+        self.navigation = NavGraph(rooms, locks)
+        # snapshots are only valid for the world they were taken in
+        layout = "\n".join(self.room_list + list(items))
+        self.fingerprint = zlib.crc32(layout.encode())
+
+# The airlock isn't a normal room: walking into it from inside the rover takes you
+# straight out to the open area, and walking into it from outside brings you back in.
+# Either way you end up facing west.
+AIRLOCK = "exit_hatch"
+
+def airlock_arrival(from_room):
+    return ("open_area" if from_room != "open_area" else AIRLOCK), "west"
+
+# The room graph compiled once per world: where every exit really leads, the exits
+# as seen from each facing, and the shortest route between every pair of rooms
+# from every facing, as the relative moves the player would type.
+class NavGraph:
+    def __init__(self, rooms, locks=None):
+        # room -> {compass direction: (room you arrive in, direction you face)}
+        self.moves = {}
+        for name, room in rooms.items():
+            self.moves[name] = {}
+            for direction, target in room.exits.items():
+                self.moves[name][direction] = airlock_arrival(name) if target == AIRLOCK else (target, direction)
+
+        # room -> facing -> {relative direction: room}, what the exits command lists
+        self.exits = {
+            name: {facing: {RELATIVE_DIRECTION[facing][direction]: target for direction, target in room.exits.items()}
+                   for facing in DIRECTIONS}
+            for name, room in rooms.items()
+        }
+
+        # room -> the flags it's locked under, see locked()
+        self.locks = locks or {}
+        self.rooms = rooms
+        # the routes avoiding each set of locked rooms, worked out the first time a
+        # player is in that situation. There are only ever a handful of these.
+        self.tables = {}
+
+        # lookup names for the goto command: "engine_room", "engine room"
+        self.names = {}
+        for name in rooms:
+            self.names[name.casefold()] = name
+            self.names[name.replace("_", " ").casefold()] = name
+
+    # (room, facing) -> {destination: tuple of relative moves}, and room -> {destination:
+    # the doors the route goes through}, for routes that never enter the blocked rooms
+    def _table(self, blocked):
+        if blocked not in self.tables:
+            routes = {}
+            doors = {}
+            for start in self.rooms:
+                paths = self._shortest_paths(start, blocked)
+                doors[start] = {target: tuple(self.rooms[room].exits[direction] for room, direction, _ in path)
+                                for target, path in paths.items()}
+                for facing in DIRECTIONS:
+                    routes[start, facing] = {target: self._relative(facing, path) for target, path in paths.items()}
+            self.tables[blocked] = routes, doors
+        return self.tables[blocked]
+
+    # the rooms that are locked for a player with these flags
+    def locked(self, flags):
+        return frozenset(room for room, needs in self.locks.items()
+                         if all(flags.get(name) == value for name, value in needs.items()))
+
+    # breadth-first search from one room, paths are tuples of (room, compass direction, arrival facing)
+    def _shortest_paths(self, start, blocked=frozenset()):
+        paths = {start: ()}
+        queue = deque([start])
+        while queue:
+            room = queue.popleft()
+            for direction, (target, facing) in self.moves[room].items():
+                if target not in paths and (target not in blocked or target == start):
+                    paths[target] = paths[room] + ((room, direction, facing),)
+                    queue.append(target)
+        return paths
+
+    def _relative(self, facing, path):
+        moves = []
+        for _, direction, arrival_facing in path:
+            moves.append(RELATIVE_DIRECTION[facing][direction])
+            facing = arrival_facing
+        return tuple(moves)
+
+    # (relative moves, doors on the way) to a room, None if it can't be reached. Rooms
+    # locked for the player are kept out of the route unless there's no other way,
+    # or they're where the player wants to go.
+    def route(self, room, facing, target, flags=None):
+        locked = self.locked(flags) - {target} if flags is not None else frozenset()
+        for blocked in (locked, frozenset()) if locked else (locked,):
+            routes, doors = self._table(blocked)
+            moves = routes[room, facing].get(target)
+            if moves is not None:
+                return moves, doors[room][target]
+        return None
+
+    # room id for a name the player typed, None if there's no such room
+    def find_room(self, name):
+        key = " ".join(name.replace("_", " ").split()).casefold()
+        if key.startswith("the "):
+            key = key[4:]
+        if key in self.names:
+            return self.names[key]
+        matches = {room for room_key, room in self.names.items() if room_key.startswith(key) or f" {key}" in room_key}
+        return matches.pop() if len(matches) == 1 else None
+
+# One session's view of the world. Rooms and items come straight from the template,
+# only the rooms whose contents this session changed get their own copy of the item bag,
+# so creating a world costs the same no matter how big the template is.
+class World:
+    __slots__ = ("template", "items", "npcs", "cutscenes", "triggers", "moved", "touched")
+
+    def __init__(self, template):
+        self.template = template
+        self.items = template.items
+        self.npcs = template.npcs
+        self.cutscenes = template.cutscenes
+        self.triggers = template.triggers
+        self.moved = {}
+        # rooms changed since the game last took a checkpoint, see Checkpoint
+        self.touched = None
+
+    def __getitem__(self, name):
+        return self.template.rooms[name]
+
+    def __contains__(self, name):
+        return name in self.template.rooms
+
+    def __iter__(self):
+        return iter(self.template.rooms)
+
+    def get(self, name, default=None):
+        return self.template.rooms.get(name, default)
+
+    # items currently in a room, treat as read-only
+    def items_in(self, room_name):
+        if room_name in self.moved:
+            return self.moved[room_name]
+        return self.template.rooms[room_name].items
+
+    # copy a room's item list the first time this session changes it
+    def _own_items(self, room_name):
+        if self.touched is None:
+            self.touched = set()
+        self.touched.add(room_name)
+        if room_name not in self.moved:
+            self.moved[room_name] = self.template.rooms[room_name].items.copy()
+        return self.moved[room_name]
+
+    def remove_item(self, room_name, item):
+        self._own_items(room_name).remove(item)
+
+    def add_item(self, room_name, item):
+        self._own_items(room_name).append(item)
+
 # Cutscene class to handle cutscenes in the game
 class Cutscene:
-    def __init__(self, text=None, speed=0.03, lineDelay=1):
+    # roughly 30 writes per second however fast the text is typed
+    frame_time = 1 / 30
+
+    def __init__(self, text=None, speed=0.03, lineDelay=1, name=None):
+        self.name = name
         self.text = text if isinstance(text, list) else [str(text)] if text else []
         self.speed = max(0.01, min(float(speed), 0.1))
         self.lineDelay = max(0, float(lineDelay))
-
-    def play(self):
+        # (lines, instant text, frames per line) for coloured and plain output,
+        # built the first time the cutscene plays that way
+        self._rendered = {}
+
+    # split a line into (text, delay) frames, with the colour codes added to the
+    # first and last frame so they don't count towards the typing delay
+    def frames(self, line, color=True):
+        per_frame = max(1, round(self.frame_time / self.speed))
+        chunks = [line[i:i + per_frame] for i in range(0, len(line), per_frame)] or [""]
+        frames = [[chunk, len(chunk) * self.speed] for chunk in chunks]
+        if color:
+            frames[0][0] = Colors.BLUE + frames[0][0]
+            frames[-1][0] = frames[-1][0] + Colors.RESET
+        return frames
+
+    def rendered(self, color=True):
+        if color not in self._rendered:
+            lines = [str(line) if color else strip_ansi(str(line)) for line in self.text]
+            if color:
+                instant = "".join(f"{Colors.BLUE}{line}{Colors.RESET}" for line in lines)
+            else:
+                instant = "".join(lines)
+            self._rendered[color] = (lines, f"\n\n{instant}\n\n", [self.frames(line, color) for line in lines])
+        return self._rendered[color]
+
+    def play(self, io=None):
+        io = io or ConsoleIO()
+        if io.metrics is not None:
+            started = time.perf_counter()
+            self._play(io)
+            io.metrics.observe("iris_cutscene_seconds", time.perf_counter() - started, cutscene=self.name or "unnamed")
+        else:
+            self._play(io)
+
+    def _play(self, io):
+        clock = io.clock
         try:
-            print("\n")
-            for line in self.text:
-                colored_line = f"{Colors.BLUE}{line}{Colors.RESET}"
-                for char in str(colored_line):
-                    print(char, end='', flush=True)
-                    time.sleep(self.speed)
-                time.sleep(self.lineDelay)
-            print("\n")
+            lines, instant, frames = self.rendered(io.color)
+            # instant playback sends the whole cutscene in one go
+            if clock.time_scale == 0:
+                for line in lines:
+                    io.record(line)
+                io.send(instant)
+                return
+            # otherwise one write per frame instead of one per character
+            io.send("\n\n")
+            for line, line_frames in zip(lines, frames):
+                io.record(line)
+                for chunk, delay in line_frames:
+                    io.send(chunk)
+                    io.flush()
+                    clock.sleep(delay)
+                clock.sleep(self.lineDelay)
+            io.send("\n\n")
         except Exception:
-            print("\n<Cutscene playback failed>\n")
+            io.output("\n<Cutscene playback failed>\n")
 
 # NPC class to define non-player characters in the game
 class NPC:
-    def __init__(self, name, description, dialogue, interaction):
+    __slots__ = ("name", "description", "dialogue", "interaction", "room")
+
+    def __init__(self, name, description, dialogue, interaction, room=None):
         self.name = name
         self.description = description
         self.dialogue = dialogue
         self.interaction = interaction
+        self.room = room
+
+# Scripted events. Each trigger names the event it waits for ("enter" a room, reach a
+# number of "moves", "use" one item on another), the key within that event, the
+# player flags it needs and the action to run. Triggers are indexed by (event, key),
+# so a command only ever looks at the few triggers that could fire for it.
+# An action returns True when it has taken over, e.g. a locked door stopping a move.
+class Trigger:
+    def __init__(self, event, key, action, flags=None):
+        self.event = event
+        self.key = key
+        self.action = action
+        self.flags = flags or {}
+
+    # "use" pairs are matched case-insensitively, like item names
+    @property
+    def index_key(self):
+        if self.event == "use":
+            return tuple(name.casefold() for name in self.key)
+        return self.key
+
+class TriggerIndex:
+    def __init__(self, triggers=()):
+        self.triggers = list(triggers)
+        self.index = {}
+        for trigger in self.triggers:
+            self.index.setdefault((trigger.event, trigger.index_key), []).append(trigger)
+
+    def keys(self, event):
+        return [trigger.key for trigger in self.triggers if trigger.event == event]
+
+    # run the matching triggers in order, from the start-th on, until one takes over.
+    # Returns what that one returned (True, or a Dialog if it stopped to ask something).
+    def fire(self, event, key, flags, *args, start=0):
+        triggers = self.index.get((event, key), ())
+        for position in range(start, len(triggers)):
+            trigger = triggers[position]
+            if all(flags.get(name) == value for name, value in trigger.flags.items()):
+                taken = trigger.action(*args)
+                if taken:
+                    if isinstance(taken, Dialog):
+                        taken.trigger = position
+                    return taken
+        return False
+
+# Actions for "enter" triggers get the player and the room they're leaving. One that
+# needs an answer first returns a Dialog, which takes the move from there.
+
+def keypad_trigger(player, room):
+    return KeypadDialog()
+
+def airlock_trigger(player, room):
+    # Track if entering airlock from door
+    if room.name == "open_area":
+        player.flags["entered_airlock_from_door"] = True
+    return AirlockDialog()
+
+def old_rover_trigger(player, room):
+    player.rooms.cutscenes["old_rover_approach"].play(player.io)
+    player.rooms.cutscenes["old_rover_dialogue"].play(player.io)
+    return player.rooms.npcs["old_rover"].interaction(player)
+
+# Actions for "moves" triggers get the game
+
+def storm_warning_trigger(game):
+    game.rooms.cutscenes["storm_warning"].play(game.io)
+    game.player.flags["three_move_cutscene_played"] = True
+
+# Actions for "use" triggers get the game, both items and whether the target is carried.
+# The target is None when nothing here matched the name that was typed.
+
+IRIS_DESTROYED = Template("{RED}The IRIS device is completely destroyed and cannot be used.{RESET}")
+
+def iris_trigger(game, tool, target, in_inventory):
+    if game.player.flags.get("iris_broken"):
+        game.io.output(IRIS_DESTROYED)
+        return True
+    if not in_inventory:
+        raise GameError("You need to have the IRIS device in your inventory to use the power cell on it.")
+    game.trigger_iris_ending()
+    return True
+
+def beacon_trigger(game, tool, target, in_inventory):
+    if not target:
+        return False
+    game.rooms.cutscenes["rescued"].play(game.io)
+    game.io.output("=== ENDING: RESCUED ===")
+    game.end("RESCUED")
+    return True
 
 # Function to handle interaction with the Old Rover
 def interact_old_rover(player):
     try:
-        lines = [
-            f"{Colors.CYAN}The Old Rover lowers its voice module to a faint whisper.{Colors.RESET}",
-            f"{Colors.GREEN}Old Rover: You need the antenna, don't you?{Colors.RESET}",
-            f"{Colors.GREEN}Old Rover: If you take it... I will go dark.{Colors.RESET}",
-            f"{Colors.GREEN}Old Rover: But maybe... maybe it's time.{Colors.RESET}",
-            "",
-            f"{Colors.YELLOW}What do you do?{Colors.RESET}",
-            f"{Colors.BLUE}1. Harvest the antenna{Colors.RESET}",
-            f"{Colors.BLUE}2. Leave Old Rover intact{Colors.RESET}"
-        ]
-        Cutscene(lines, speed=0.04, lineDelay=1.5).play()
-
-        while True:
-            choice = input("> ").strip()
+        player.rooms.cutscenes["old_rover_offer"].play(player.io)
+        return OldRoverDialog()
+    except Exception:
+        player.io.output("Rover interaction failed")
+
+# A question the game is waiting on. Asking one ends the command (see Game.ask) and
+# the player's next input goes to answer() instead of the parser, which carries on
+# from where the question was asked, possibly by asking the next one. Everything
+# needed to carry on is in these few fields, so a session can be snapshotted or
+# set aside mid-dialog with nothing left on the call stack.
+#
+# Dialogs started by "enter" triggers finish the move that started them with
+# carry_on(): room and direction are the exit being used and trigger the trigger
+# that asked, so the ones after it still run.
+class Dialog:
+    __slots__ = ("room", "direction", "trigger", "step", "calibrated")
+    kind = None
+
+    def __init__(self, room=None, direction=None, trigger=0, step=0, calibrated=True):
+        self.room = room
+        self.direction = direction
+        self.trigger = trigger
+        self.step = step
+        self.calibrated = calibrated
+
+    def prompt(self, game):
+        return "> "
+
+    def answer(self, game, text):
+        raise NotImplementedError
+
+    def carry_on(self, game):
+        dialog = game.player.enter(game.rooms[self.room], self.direction, self.trigger + 1)
+        if dialog:
+            game.ask(dialog)
+
+    def __repr__(self):
+        return f"{type(self).__name__}(room={self.room!r}, step={self.step})"
+
+KEYPAD_PROMPT = Template("{YELLOW}A keypad flashes: ENTER ACCESS CODE >> {RESET}")
+KEYPAD_GRANTED = Template("{GREEN}Access granted. The door slides open.{RESET}")
+KEYPAD_DENIED = Template("{RED}Access denied. The door remains sealed.{RESET}")
+
+class KeypadDialog(Dialog):
+    __slots__ = ()
+    kind = "keypad"
+
+    def prompt(self, game):
+        return KEYPAD_PROMPT
+
+    def answer(self, game, text):
+        player = game.player
+        if text.strip().upper() == "EMBER-IRIS-8924":
+            player.io.output(KEYPAD_GRANTED)
+            player.flags["comms_unlocked"] = True
+            self.carry_on(game)
+            return
+        player.io.output(KEYPAD_DENIED)
+
+class AirlockDialog(Dialog):
+    __slots__ = ()
+    kind = "airlock"
+
+    def prompt(self, game):
+        action = "exit" if self.room != "open_area" else "enter"
+        return f"You are about to {action} the rover. Are you sure? (yes/no) "
+
+    def answer(self, game, text):
+        player = game.player
+        if text.strip().lower() != "yes":
+            player.io.output(f"You decide to stay {'inside' if self.room != 'open_area' else 'outside'}.")
+            return
+
+        # Only play cutscene if entering from the door
+        if player.flags["entered_airlock_from_door"]:
+            cutscene = "airlock_exit" if self.room != "open_area" else "airlock_enter"
+            player.rooms.cutscenes[cutscene].play(player.io)
+
+        player.current_room, player.facing_direction = airlock_arrival(self.room)
+        player.move_count += 1
+        player.io.output(player.rooms[player.current_room].description)
+
+        # Only trigger cutscene if entered from door
+        if self.room != "open_area" and player.flags["entered_airlock_from_door"]:
+            player.flags["three_move_cutscene_played"] = True
+
+class OldRoverDialog(Dialog):
+    __slots__ = ()
+    kind = "old_rover"
+
+    def answer(self, game, text):
+        player = game.player
+        try:
+            choice = text.strip()
             if choice == "1":
-                Cutscene([
-                    "You reach out slowly, disconnecting the antenna.",
-                    "Old Rover: I knew this day would come.",
-                    "The lights on its sensors fade.",
-                    "You now have the beacon antenna.",
-                    "Try using the emergency beacon in the communications room."
-                ], speed=0.04, lineDelay=1.5).play()
+                player.rooms.cutscenes["old_rover_harvest"].play(player.io)
                 player.flags["old_rover_alive"] = False
-                player.inventory.append(items["antenna"])
-                break
+                player.inventory.append(player.rooms.items["antenna"])
             elif choice == "2":
-                Cutscene([
-                    "You step back. The Old Rover's sensors flash briefly.",
-                    "The rover gets back to its exploration, as it has done for so long."
-                ], speed=0.04, lineDelay=1.5).play()
+                player.rooms.cutscenes["old_rover_leave"].play(player.io)
                 player.flags["old_rover_alive"] = True
-                break
             else:
-                print("Invalid choice. Please enter 1 or 2")
-    except Exception:
-        print("Rover interaction failed")
+                player.io.output("Invalid choice. Please enter 1 or 2")
+                game.ask(self)
+                return
+        except Exception:
+            player.io.output("Rover interaction failed")
+        self.carry_on(game)
+
+# IRIS calibration, one step per question in IRIS_CALIBRATION, then the final choice
+class IrisDialog(Dialog):
+    __slots__ = ()
+    kind = "iris"
+
+    def answer(self, game, text):
+        choice = text.strip()
+        if self.step < len(IRIS_CALIBRATION):
+            if choice != list(IRIS_CALIBRATION.values())[self.step]:
+                game.rooms.cutscenes["iris_calibration_failed"].play(game.io)
+                game.iris_choice(calibrated=False)
+            else:
+                game.rooms.cutscenes["iris_acknowledged"].play(game.io)
+                game.iris_calibration(self.step + 1)
+            return
+        game.iris_decision(self, choice)
+
+# for snapshots, by position
+DIALOGS = (None, KeypadDialog, AirlockDialog, OldRoverDialog, IrisDialog)
 
 ## End Saatvik's Code
 
 ## Start Dhyan's Code
 
-# Creating all items in the game
-items = { 
-    "sticky_note": Item("Sticky Note", "A dusty yellow sticky-note", 
-                       interactions={'inspect': "\"don't forget the password!\nEMBER-IRIS-8924\n      — Halberg\""}),
-    "mre": Item("MRE's", "A pack of MRE's (Meals Ready to Eat).", 
-               interactions={"inspect": "These will keep you fed for a while."}),
-    "old_air_filter": Item("Old Air Filter", "An old air filter, covered in dust.", 
-                          interactions={"inspect": "It looks like it hasn't been used in a long time."}),
-    "empty_containers": Item("Empty Containers", "A few empty containers", 
-                            interactions={"inspect": "They are empty and useless now."}),
-    "north_metal_scraps": Item("Metal Scraps", "A pile of metal scraps", 
-                              interactions={"inspect": "These could be useful for repairs."}),
-    "sealed_briefcase": Item("Sealed Briefcase", "Sealed Black Briefcase with an embossed US government seal", 
-                            interactions={"inspect": "It seems to be locked with a rusty padlock. You'll need something with leverage to break it open."}, 
-                            requires=["Rusty Spanner"], 
-                            contains=["iris"]),
-    "rusty_spanner": Item("Rusty Spanner", "A rusty spanner.", 
-                         interactions={"inspect": "It might still be useful for some repairs."}),
-    "torn_clothing": Item("Torn Clothing", "A pile of ripped clothes", 
-                         interactions={"inspect": "This doesn't look like it's useful anymore."}),
-    "iris": Item("Iris", "A small black box with a small screen and a few buttons.", 
-                interactions={"inspect":"The handbook is still attached. It reads:\n\nIRIS: STRICTLY CONFIDENTIAL\n\nFOR AUTHORISED PERSONNEL ONLY\n\nDO NOT ATTEMPT TO ACCESS WITHOUT PROPER AUTHORISATION\n\n-------------------------\n\nIRIS is a self-regulating, life support system designed to preserve designated subjects indefinitely in the event of catastrophic failure in hostile environments.\n\nOnce activated, IRIS *will* take care of you, however IRIS remains a prototype at this stage\n\nThere are known tendencies for IRIS to emit unintended UHF signals, known to cause interterrestrial interference and potentially attract extraterrestrial attention.\n\nAT THIS POINT IN TIME, IRIS IS NOT TO BE ACTIVATED, RISK OF FAILURE REMAINS TOO HIGH.\n\nA small, handwritten note is taped below the empty power slot: 'Requires a standard 250-volt portable power cell to initiate.'"}),
-    "unstable_power_cell": Item("Unstable Power Cell", "A portable 250-volt power cell. It feels warm to the touch and hums faintly.", 
-                               interactions={"inspect": "The casing is cracked, and a warning label reads: 'CAUTION: Unstable. Risk of UHF signal leakage.' This must be the power source for IRIS."}),
-    "headphones": Item("Headphones", "A good old pair of wired headphones.", 
-                      interactions={"inspect": "These were probably used to communicate with earth."}),
-    "radio": Item("Radio", "A small radio device", 
-                 interactions={"inspect": "It seems to be broken, doesn't look like it's in a repairable condition."}),
-    "emergency_beacon": Item("Emergency Beacon", "A small emergency beacon", 
-                            interactions={"inspect": "This could be useful to call back to Earth for help. You need a working antenna to activate this."}),
-    "broken_antenna": Item("Broken Antenna", "A broken antenna", 
-                          interactions={"inspect": "It seems to be damaged beyond repair. This would've been used to activate the emergency beacon."}),
-    "communications_manual": Item("Communications Manual", "A manual for the communications system.", 
-                                interactions={"inspect":"Communications Manual: \n\nThis manual contains information on how to operate the communications system, including troubleshooting steps for common issues:\n\n To activate general communications, press the green 'Power' button on the console and tune frequency to 145.800 MHz, fine-tune as required.\n\n For emergency communications, use the dedicated emergency beacon.\nAttach the portable antenna to the beacon and hold the red button for 5 seconds, a blue light should activate.\nOnce the singal is received by earth, a green light will activate.\nThe beacon will display a red light if an antenna is not attached.\n\n\nThe light is red indeed, you need an antenna.\nThe antenna that's laying around here is broken. Where can you possibly find a working antenna?\nMaybe the old rovers that are active from the previous mission may have some.\nThe old mission was North of our spaceship."}),
-    "antenna": Item("Antenna", "A working antenna", 
-                   interactions={"inspect": "This antenna is in good condition and can be used to activate the emergency beacon."}),
-    "flickering_datapad": Item("Flickering Datapad", "A datapad with a cracked screen", 
-                              interactions={"inspect": "The battery is almost dead. The screen shows a single, corrupted log entry: 'Sol 36: ...strange readings from the northern ridge. It's not geological. Re-calibrating the deep-scan array...' The screen dies."}),
-    "oily_rag": Item("Oily Rag", "A greasy rag left on a console.", 
-                    interactions={"inspect": "It smells strongly of hydraulic fluid. It's covered in grime."}),
-    "nutrient_paste_crate": Item("Nutrient Paste Crate", "A large crate of emergency rations.", 
-                               interactions={"inspect": "A manifest is taped to the side: 'CONTENTS: 150x Nutrient Paste Tubes. FLAVOR: Gray.' The crate is sealed shut."}),
-    "small_wrench": Item("Small Wrench", "A small, adjustable wrench lying on the floor.", 
-                        interactions={"inspect": "It's a standard-issue 10mm wrench. It seems too small to be useful for any of the heavy machinery here."}),
-    "warning_placard": Item("Warning Placard", "A faded warning placard bolted to the wall.", 
-                           interactions={"inspect": "The placard reads: 'CAUTION: Airlock door must remain sealed during dust storms. In case of emergency, communications manual is located in the comms room.'"}),
-    "strange_rock": Item("Strange Rock", "A peculiar-looking rock, different from the surrounding regolith.", 
-                        interactions={"inspect": "The rock has an unusual, almost metallic sheen. It's probably just a high concentration of iron ore."}),
-    "scorched_panel": Item("Scorched Panel", "A scorched panel from the habitat's outer wall.", 
-                          interactions={"inspect": "This panel looks like it was hit by a massive power surge. The circuits are completely fried."}),
-    "withered_plant": Item("Withered Plant", "The desiccated remains of a small plant in a pot.", 
-                          interactions={"inspect": "This was once someone's attempt to grow something green on Mars. It has long since died."}),
-    "halbergs_datapad": Item("Halberg's Datapad", "A personal datapad lying half-buried under a torn blanket.", 
-                            interactions={"inspect": "It's Dr. Halberg's datapad. The final entry is open:\n\n'Sol 37. The storm is too much. I had to lock down the comms room, but I'm always forgetting that blasted code. I stuck a note somewhere obvious near my seat in the control room. If IRIS is our only hope, I pray the briefcase is still in the north debris field where I left it. The old spanner should be there too. Someone has to make it.'"}),
-    "soil_kit": Item("Soil Analysis Kit", "A soil analysis kit, dropped on the floor.", 
-                    interactions={"inspect": "The last analysis reads: 'Sample 42. High iron-oxide content. Trace organic compounds... anomalous reading detected. Recommend further investigation.'"}),
-    "old_rover_tracks": Item("Old Rover Tracks", "Deep tracks in the dust.", 
-                            interactions={"inspect": "These tracks lead away from the pad and into the vast Martian landscape. The Old Rover has been busy."}),
-    "halberg_log": Item("Halberg Log", "A personal log from Dr. Halberg", 
-                       interactions={"inspect": "Halberg's Personal Log:\n\n...technical notes about the IRIS system...\n\nIMPORTANT CALIBRATION PARAMETERS:\n- Auxiliary power to life-support (option 2)\n- Gravimetric field at 77.3 GHz (option 1)\n- Coolant system vent externally (option 1)\n\nThese settings seem to stabilize the prototype..."}),
+# The game world lives in world.json: items, rooms, NPCs and cutscene scripts.
+# Text in it can use colour placeholders like {GREEN}...{RESET}. The file is
+# validated and compiled into plain lists once, and the compiled form is cached in
+# __pycache__ keyed by a hash of the file and WORLD_NAMES, so later runs and pool
+# workers load it with a single read and no parsing or checking.
+WORLD_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "world.json")
+# bump when the compiled form changes so old caches are ignored
+WORLD_FORMAT = 2
+
+# Actions world files can attach to triggers, by event
+TRIGGER_ACTIONS = {
+    "enter": {"keypad": keypad_trigger, "airlock": airlock_trigger, "old_rover": old_rover_trigger},
+    "moves": {"storm_warning": storm_warning_trigger},
+    "use": {"iris": iris_trigger, "beacon": beacon_trigger},
 }
 
-# Creating all rooms in the game
-rooms = {
-    "center": Room("center", "You are in the center of the ship, a nexus connecting the main sections.", 
-                  {"west": "communications_room", "east": "storage_room", "north": "control_room", "south": "engine_room"}, 
-                  [items["flickering_datapad"]]),
-    "communications_room": Room("communications_room", "You are in the communications room. Consoles are dark and silent.", 
-                              {"east": "center", "south": "exit_hatch"}, 
-                              [items["headphones"], items["broken_antenna"], items["radio"], items["emergency_beacon"], items["communications_manual"]]),
-    "storage_room": Room("storage_room", "You are in the storage room. Shelves are mostly empty.", 
-                        {"west": "center", "south": "rover_launch_bay"}, 
-                        [items["nutrient_paste_crate"], items["empty_containers"]]), 
-    "control_room": Room("control_room", "You are in the control room. The main viewscreen is cracked.", 
-                        {"south": "center"}, 
-                        [items["sticky_note"]]),
-    "engine_room": Room("engine_room", "You are in the engine room. The low hum of dormant machinery fills the air. Tucked away behind a coolant pipe, you see something.", 
-                       {"north": "center", "west": "exit_hatch", "east": "rover_launch_bay"}, 
-                       [items["unstable_power_cell"], items["oily_rag"]]),
-    "rover_launch_bay": Room("rover_launch_bay", "You are in the rover launch bay. A fine layer of red dust covers everything.", 
-                            {"north": "storage_room", "west": "engine_room", "south": "rover_pad"}, 
-                            []),
-    "exit_hatch": Room("exit_hatch", "You are at the exit hatch. The outer door is sealed tight.", 
-                      {"north": "communications_room", "east": "engine_room"}, 
-                      [items["warning_placard"]]),
-    "open_area": Room("open_area", "You roam free on the lands of Mars. The red desert stretches to the horizon.", 
-                     {"north": "north_debris", "west": "habitat_air_lock", "south": "south_debris", "east": "exit_hatch"}, 
-                     [items["strange_rock"]]),
-    "south_debris": Room("south_debris", "You are in the south debris area, amidst twisted metal from the habitat.", 
-                        {"north": "open_area", "west": "habitat_sleeping_quarters"}, 
-                        [items["scorched_panel"], items["torn_clothing"], items["halberg_log"]]),  # Added Halberg Log
-    "north_debris": Room("north_debris", "You are in the north debris area. This seems to be where supplies were offloaded.", 
-                        {"south": "open_area", "west": "habitat_storage_room", "east": "old_rover_pad"}, 
-                        [items["mre"], items["old_air_filter"], items["north_metal_scraps"], items["sealed_briefcase"], items["rusty_spanner"]]),
-    "habitat_air_lock": Room("habitat_air_lock", "You are in the habitat air lock. The inner door hangs ajar.", 
-                           {"north": "habitat_irrigation_area", "south": "habitat_sleeping_quarters"}, 
-                           []),
-    "habitat_irrigation_area": Room("habitat_irrigation_area", "You are in the habitat irrigation area. A row of empty planters lines the wall.", 
-                                  {"north": "habitat_storage_room", "south": "habitat_air_lock"}, 
-                                  [items["withered_plant"], items["soil_kit"]]),
-    "habitat_sleeping_quarters": Room("habitat_sleeping_quarters", "You are in the habitat sleeping quarters. A gaping hole in the wall reveals the red landscape.", 
-                                    {"north": "habitat_air_lock", "east": "south_debris"}, 
-                                    [items["halbergs_datapad"]]),
-    "habitat_storage_room": Room("habitat_storage_room", "You are in the habitat storage room. Most of the contents have been sucked out through a tear in the hull.", 
-                               {"south": "habitat_irrigation_area", "east": "north_debris"}, 
-                               []),
-    "rover_pad": Room("rover_pad", "You are in the rover pad, your only sanctuary from the storm.", 
-                     {"north": "rover_launch_bay"}, 
-                     [items["small_wrench"]]),
-    "old_rover_pad": Room("old_rover_pad", "You are at the old rover pad. It looks like it hasn't been used for years.", 
-                         {"west": "north_debris"}, 
-                         [items["old_rover_tracks"]]),
-}
+# NPCs and cutscenes the engine plays by name, so every world file has to have them
+NPC_INTERACTIONS = {"old_rover": interact_old_rover}
+# typing speed and pause between lines when an NPC talks
+NPC_DIALOGUE_SPEED = 0.04
+NPC_DIALOGUE_DELAY = 2
+WORLD_CUTSCENES = (
+    "intro", "airlock_exit", "airlock_enter", "storm_warning",
+    "old_rover_approach", "old_rover_offer", "old_rover_harvest", "old_rover_leave",
+    "rescued", "iris_activation", "iris_calibration_failed", "iris_acknowledged",
+    "iris_calibration_successful", "iris_countdown", "iris_aliens", "iris_surviving", "iris_smashed",
+)
+
+# The names compile_world checks a world file against. They're part of the cache
+# key, so a cached world that passed the checks of an older engine isn't reused.
+WORLD_NAMES = repr((
+    WORLD_CUTSCENES,
+    sorted((event, sorted(actions)) for event, actions in TRIGGER_ACTIONS.items()),
+    sorted(NPC_INTERACTIONS),
+)).encode()
+
+class WorldError(Exception):
+    pass
+
+# Checks a parsed world file and turns it into plain lists and dicts with the colour
+# placeholders filled in. Every problem is collected and reported together.
+def compile_world(data):
+    problems = []
+
+    def check(value, kind, where):
+        if not isinstance(value, kind):
+            problems.append(f"{where}: expected {'text' if kind is str else kind.__name__}")
+            return False
+        return True
+
+    def text(value, where):
+        if not check(value, str, where):
+            return ""
+        try:
+            return value.format_map(COLOR_NAMES)
+        except (KeyError, ValueError, IndexError) as e:
+            problems.append(f"{where}: bad colour placeholder {e}")
+            return value
+
+    def texts(values, where):
+        if not check(values, list, where):
+            return []
+        return [text(value, f"{where}[{i}]") for i, value in enumerate(values)]
+
+    def section(name, fields, required):
+        entries = data.get(name)
+        if not check(entries, dict, name):
+            return {}
+        for key, entry in entries.items():
+            if not check(entry, dict, f"{name}.{key}"):
+                continue
+            for field in entry.keys() - fields:
+                problems.append(f"{name}.{key}: unknown field '{field}'")
+            for field in required[name]:
+                if field not in entry:
+                    problems.append(f"{name}.{key}: missing '{field}'")
+        return {key: entry for key, entry in entries.items() if isinstance(entry, dict)}
+
+    if not isinstance(data, dict):
+        raise WorldError("world file must be a JSON object")
+    required = {"items": ("name", "description"), "rooms": ("description",), "npcs": ("name", "room", "description"), "cutscenes": ("lines",)}
+    items_data = section("items", {"name", "description", "interactions", "requires", "contains", "aliases"}, required)
+    rooms_data = section("rooms", {"description", "exits", "items"}, required)
+    npcs_data = section("npcs", {"name", "room", "description", "dialogue"}, required)
+    cutscenes_data = section("cutscenes", {"lines", "speed", "line_delay"}, required)
+
+    names = {}
+    for key, item in items_data.items():
+        name = item.get("name", "")
+        if name in names:
+            problems.append(f"items.{key}: name '{name}' is already used by items.{names[name]}")
+        names[name] = key
+
+    compiled_items = []
+    for key, item in items_data.items():
+        where = f"items.{key}"
+        interactions = item.get("interactions", {})
+        if check(interactions, dict, f"{where}.interactions"):
+            interactions = {action: text(value, f"{where}.interactions.{action}") for action, value in interactions.items()}
+        requires = texts(item.get("requires", []), f"{where}.requires")
+        for name in requires:
+            if name not in names:
+                problems.append(f"{where}.requires: no item named '{name}'")
+        contains = texts(item.get("contains", []), f"{where}.contains")
+        for content in contains:
+            if content not in items_data:
+                problems.append(f"{where}.contains: no item '{content}'")
+        compiled_items.append([key, text(item.get("name"), f"{where}.name"), text(item.get("description"), f"{where}.description"),
+                               requires, interactions if isinstance(interactions, dict) else {}, contains,
+                               texts(item.get("aliases", []), f"{where}.aliases")])
+
+    compiled_rooms = []
+    for name, room in rooms_data.items():
+        where = f"rooms.{name}"
+        exits = room.get("exits", {})
+        if not check(exits, dict, f"{where}.exits"):
+            exits = {}
+        for direction, target in exits.items():
+            if direction not in DIRECTIONS:
+                problems.append(f"{where}.exits: '{direction}' is not a compass direction")
+            if target not in rooms_data:
+                problems.append(f"{where}.exits.{direction}: no room '{target}'")
+        contents = texts(room.get("items", []), f"{where}.items")
+        for key in contents:
+            if key not in items_data:
+                problems.append(f"{where}.items: no item '{key}'")
+        compiled_rooms.append([name, text(room.get("description"), f"{where}.description"), dict(exits), contents])
+
+    compiled_npcs = []
+    for key in NPC_INTERACTIONS:
+        if key not in npcs_data:
+            problems.append(f"npcs: missing '{key}'")
+    for key, npc in npcs_data.items():
+        where = f"npcs.{key}"
+        if npc.get("room") not in rooms_data:
+            problems.append(f"{where}.room: no room '{npc.get('room')}'")
+        compiled_npcs.append([key, text(npc.get("name"), f"{where}.name"), npc.get("room"),
+                              text(npc.get("description"), f"{where}.description"), texts(npc.get("dialogue", []), f"{where}.dialogue")])
+
+    compiled_cutscenes = []
+    for name in WORLD_CUTSCENES:
+        if name not in cutscenes_data:
+            problems.append(f"cutscenes: missing '{name}'")
+    for name, cutscene in cutscenes_data.items():
+        where = f"cutscenes.{name}"
+        timing = []
+        for field, default in (("speed", 0.03), ("line_delay", 1)):
+            value = cutscene.get(field, default)
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or value < 0:
+                problems.append(f"{where}.{field}: expected a number of seconds")
+                value = default
+            timing.append(float(value))
+        compiled_cutscenes.append([name, texts(cutscene.get("lines"), f"{where}.lines")] + timing)
+
+    compiled_triggers = []
+    triggers = data.get("triggers", [])
+    if not check(triggers, list, "triggers"):
+        triggers = []
+    for i, trigger in enumerate(triggers):
+        where = f"triggers[{i}]"
+        if not check(trigger, dict, where):
+            continue
+        for field in trigger.keys() - {"on", "key", "flags", "action"}:
+            problems.append(f"{where}: unknown field '{field}'")
+        event, key, flags = trigger.get("on"), trigger.get("key"), trigger.get("flags", {})
+        if event not in TRIGGER_ACTIONS:
+            problems.append(f"{where}.on: expected one of {', '.join(TRIGGER_ACTIONS)}")
+            continue
+        if trigger.get("action") not in TRIGGER_ACTIONS[event]:
+            problems.append(f"{where}.action: no '{event}' action called '{trigger.get('action')}'")
+        if event == "enter" and key not in rooms_data:
+            problems.append(f"{where}.key: no room '{key}'")
+        elif event == "moves" and (not isinstance(key, int) or isinstance(key, bool) or key < 0):
+            problems.append(f"{where}.key: expected a move count")
+        elif event == "use":
+            if not isinstance(key, list) or len(key) != 2:
+                problems.append(f"{where}.key: expected [tool, target]")
+                key = []
+            for name in key:
+                if name not in names:
+                    problems.append(f"{where}.key: no item named '{name}'")
+        if not isinstance(flags, dict) or not all(isinstance(value, bool) for value in flags.values()):
+            problems.append(f"{where}.flags: expected flag names mapped to true or false")
+            flags = {}
+        for name in flags:
+            if name not in FLAG_BITS:
+                problems.append(f"{where}.flags: no player flag called '{name}'")
+        compiled_triggers.append([event, key, trigger.get("action"), flags])
+
+    if problems:
+        raise WorldError("invalid world file:\n  " + "\n  ".join(problems))
+    return [WORLD_FORMAT, compiled_items, compiled_rooms, compiled_npcs, compiled_cutscenes, compiled_triggers]
+
+# Fresh game objects from a compiled world
+def build_world(compiled):
+    _, items_data, rooms_data, npcs_data, cutscenes_data, triggers_data = compiled
+    items = {key: Item(name, description, requires=requires, interactions=interactions, contains=contains, aliases=aliases)
+             for key, name, description, requires, interactions, contains, aliases in items_data}
+    rooms = {name: Room(name, description, exits, [items[key] for key in contents])
+             for name, description, exits, contents in rooms_data}
+    npcs = {key: NPC(name, description, dialogue, NPC_INTERACTIONS.get(key), room=room)
+            for key, name, room, description, dialogue in npcs_data}
+    cutscenes = {name: Cutscene(lines, speed=speed, lineDelay=line_delay, name=name)
+                 for name, lines, speed, line_delay in cutscenes_data}
+    # what each NPC says is played like a cutscene, "<npc>_dialogue"
+    for key, npc in npcs.items():
+        name = f"{key}_dialogue"
+        cutscenes[name] = Cutscene(npc.dialogue, speed=NPC_DIALOGUE_SPEED, lineDelay=NPC_DIALOGUE_DELAY, name=name)
+    triggers = TriggerIndex(Trigger(event, tuple(key) if event == "use" else key, TRIGGER_ACTIONS[event][action], flags)
+                            for event, key, action, flags in triggers_data)
+    return WorldTemplate(items, rooms, npcs, cutscenes, triggers)
+
+def _world_cache_path(path, source):
+    key = source + bytes([WORLD_FORMAT, marshal.version]) + WORLD_NAMES
+    digest = hashlib.blake2b(key, digest_size=12).hexdigest()
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(os.path.dirname(os.path.abspath(path)), "__pycache__", f"{name}.{digest}.bin")
+
+def load_world(path=WORLD_FILE, cache=True):
+    with open(path, "rb") as f:
+        source = f.read()
+    cache_path = _world_cache_path(path, source)
+    if cache:
+        try:
+            with open(cache_path, "rb") as f:
+                compiled = marshal.loads(f.read())
+            if compiled[0] == WORLD_FORMAT:
+                return build_world(compiled)
+        except (OSError, EOFError, ValueError, TypeError, IndexError):
+            pass
+
+    try:
+        data = json.loads(source)
+    except ValueError as e:
+        raise WorldError(f"{path} is not valid JSON: {e}")
+    compiled = compile_world(data)
+    if cache:
+        _write_world_cache(cache_path, compiled)
+    return build_world(compiled)
+
+# write the cache atomically and drop the ones left behind by older versions of the file.
+# A read-only install just compiles on every start.
+def _write_world_cache(cache_path, compiled):
+    directory = os.path.dirname(cache_path)
+    prefix = os.path.basename(cache_path).split(".")[0] + "."
+    try:
+        os.makedirs(directory, exist_ok=True)
+        temporary = f"{cache_path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(marshal.dumps(compiled))
+        os.replace(temporary, cache_path)
+        for name in os.listdir(directory):
+            stale = os.path.join(directory, name)
+            if name.startswith(prefix) and name.endswith(".bin") and stale != cache_path:
+                os.remove(stale)
+    except OSError:
+        pass
+
+world_template = load_world()
+items = world_template.items
+rooms = world_template.rooms
+
+# Turn whatever was passed as "rooms" into a fresh per-session World
+def as_world(rooms):
+    if isinstance(rooms, World):
+        return rooms
+    if isinstance(rooms, WorldTemplate):
+        return World(rooms)
+    if rooms is world_template.rooms:
+        return World(world_template)
+    return World(WorldTemplate(items, rooms, world_template.npcs, world_template.cutscenes, world_template.triggers))
 
 ## End Dhyan's Code
 
 ## Start Saatvik's Code
 
-# Create the npc
-old_rover = NPC(
-    name="Old Rover",
-    description=f"{Colors.GREEN}A battered exploration unit with an intact antenna. It hums faintly as you approach. {Colors.RESET}",
-    dialogue=[
-        f"{Colors.GREEN}Old Rover: I remember this crater. Dust storms used to dance here like children. {Colors.RESET}",
-        f"{Colors.GREEN}Old Rover: Most of my memory banks are corrupted... but I remember the stars. {Colors.RESET}",
-        f"{Colors.GREEN}Old Rover: My antenna still works... keeps me connected to the sky. {Colors.RESET}"
-    ],
-    interaction=interact_old_rover
-)
+old_rover = world_template.npcs["old_rover"]
 
 ## End Saatvik's Code
 
 ## Start Dhyan's Code
 
+# IRIS calibration prompts and their correct answers
+IRIS_CALIBRATION = {
+    "First, reroute auxiliary power. Do you route to [1] shields or [2] life-support?": "2",
+    "Next, align the gravimetric field. Set frequency to [1] 77.3 GHz or [2] 99.1 GHz?": "1",
+    "Finally, purge the coolant system. Do you [1] vent externally or [2] recycle coolant?": "1"
+}
+
+# Chance that activating IRIS attracts the aliens, by whether calibration succeeded
+IRIS_ALIEN_CHANCE = {True: 0.55, False: 0.80}
+
+# Stand-in for Game.rng that always rolls the same value and remembers whether it
+# was asked, for tools that want to see both sides of the IRIS roll
+class FixedRoll:
+    def __init__(self, value):
+        self.value = value
+        self.used = False
+
+    def random(self):
+        self.used = True
+        return self.value
+
+# Ways the game can end, None while it's still going
+ENDINGS = (None, "RESCUED", "ALIENS", "SURVIVING, ALONE")
+
+# Binary snapshot layout, see Game.snapshot()
+SNAPSHOT_MAGIC = b"IRS"
+SNAPSHOT_VERSION = 4
+SNAPSHOT_HEADER = struct.Struct("<3sBIHBIIBBI")
+SNAPSHOT_COUNT = struct.Struct("<H")
+SNAPSHOT_ID = struct.Struct("<H")
+SNAPSHOT_LENGTH = struct.Struct("<I")
+# dialog kind (0 for none), room id, direction, trigger, step, calibrated
+SNAPSHOT_DIALOG = struct.Struct("<BHBBBB")
+NO_ROOM = 0xFFFF
+
+# Id lists are little-endian like the rest of a snapshot. arrays use the host's byte
+# order, so they're swapped on big-endian machines.
+BIG_ENDIAN = sys.byteorder == "big"
+
+def _pack_ids(ids):
+    ids = array("H", ids)
+    if BIG_ENDIAN:
+        ids.byteswap()
+    return SNAPSHOT_COUNT.pack(len(ids)) + ids.tobytes()
+
+def _unpack_ids(data, offset):
+    (count,) = SNAPSHOT_COUNT.unpack_from(data, offset)
+    offset += SNAPSHOT_COUNT.size
+    ids = array("H")
+    ids.frombytes(data[offset:offset + count * ids.itemsize])
+    if BIG_ENDIAN:
+        ids.byteswap()
+    return ids, offset + count * ids.itemsize
+
+# Streaming export: write each game's snapshot to a binary stream as a
+# length-prefixed record, so any number of sessions fit in one file
+def write_snapshots(stream, games):
+    count = 0
+    for game in games:
+        data = game.snapshot()
+        stream.write(SNAPSHOT_LENGTH.pack(len(data)))
+        stream.write(data)
+        count += 1
+    return count
+
+# Read back the snapshots written by write_snapshots(), one at a time
+def read_snapshots(stream):
+    while True:
+        header = stream.read(SNAPSHOT_LENGTH.size)
+        if len(header) < SNAPSHOT_LENGTH.size:
+            return
+        (length,) = SNAPSHOT_LENGTH.unpack(header)
+        yield stream.read(length)
+
+# Suggestion indexes for command vocabularies, built once per distinct set of aliases
+_command_suggestions = {}
+
+def command_suggestions(commands):
+    vocabulary = frozenset(commands)
+    if vocabulary not in _command_suggestions:
+        _command_suggestions[vocabulary] = SuggestionIndex(vocabulary)
+    return _command_suggestions[vocabulary]
+
+# One game's view of Game.COMMANDS. Handlers are bound when they're looked up, so a
+# game doesn't carry a dict of bound methods, and entries set on the table (metrics
+# wrappers) override the class's handler for this game only.
+class CommandTable:
+    __slots__ = ("game", "overrides")
+
+    def __init__(self, game):
+        self.game = game
+        self.overrides = None
+
+    def __getitem__(self, alias):
+        if self.overrides and alias in self.overrides:
+            return self.overrides[alias]
+        return getattr(self.game, self.game.COMMANDS[alias])
+
+    def __setitem__(self, alias, handler):
+        if self.overrides is None:
+            self.overrides = {}
+        self.overrides[alias] = handler
+
+    def __contains__(self, alias):
+        return alias in self.game.COMMANDS
+
+    def __iter__(self):
+        return iter(self.game.COMMANDS)
+
+    def __len__(self):
+        return len(self.game.COMMANDS)
+
+    def keys(self):
+        return self.game.COMMANDS.keys()
+
+    def items(self):
+        return [(alias, self[alias]) for alias in self.game.COMMANDS]
+
+# One parsed command: the alias typed, its handler, and the phrases read for the
+# handler's arguments. Incomplete commands are kept as the game's pending command
+# and carry on with the next line the player types.
+class ParsedCommand:
+    __slots__ = ("verb", "handler", "args", "slots")
+
+    def __init__(self, verb, handler=None, args=(), slots=()):
+        self.verb = verb
+        self.handler = handler
+        self.args = args
+        self.slots = slots
+
+    @property
+    def complete(self):
+        return len(self.args) >= len(self.slots)
+
+    # the command as text that parses back to the same state, for snapshots
+    def text(self):
+        words = [self.verb]
+        for (lead, _), arg in zip(self.slots, self.args):
+            words.append(lead)
+            words.append(arg)
+        if self.args and not self.complete and self.slots[len(self.args)][0]:
+            words.append(self.slots[len(self.args)][0])
+        return " ".join(word for word in words if word)
+
+    def __repr__(self):
+        return f"ParsedCommand({self.verb!r}, {self.handler!r}, {self.args!r})"
+
+# Parser compiled from the command table and each handler's syntax. Verbs, including
+# ones of several words like "pick up", live in a word trie and the longest one at
+# the start of the line wins. The rest of the line is read into the handler's
+# argument phrases in the same pass, split at the prepositions the syntax names.
+#
+# A syntax is a tuple of argument names with prepositions between them, e.g.
+# ("item", "on", "item"). A preposition is optional when continuing a command, so
+# after "use spanner" the next line can be "on briefcase" or just "briefcase".
+class CommandGrammar:
+    def __init__(self, commands, syntax):
+        self.verbs = {}
+        for alias, handler in commands.items():
+            node = self.verbs
+            for word in alias.split():
+                node = node.setdefault(word, {})
+            node[None] = (alias, handler)
+        # per handler: ((preposition or None, argument name), ...)
+        self.slots = {}
+        for handler, pattern in syntax.items():
+            slots, lead = [], None
+            for index, part in enumerate(pattern):
+                if index % 2:
+                    lead = part
+                else:
+                    slots.append((lead, part))
+                    lead = None
+            self.slots[handler] = tuple(slots)
+
+    # longest verb at the start of words, as (alias, handler, words used)
+    def verb(self, words):
+        node, found = self.verbs, None
+        for index, word in enumerate(words):
+            node = node.get(word.lower())
+            if node is None:
+                break
+            if None in node:
+                found = node[None] + (index + 1,)
+        return found
+
+    def parse(self, text, pending=None):
+        words = text.split()
+        if not words:
+            return None
+        found = self.verb(words)
+        if found:
+            alias, handler, used = found
+            slots = self.slots.get(handler, ())
+            return ParsedCommand(alias, handler, self._arguments(slots, (), words[used:]), slots)
+        if pending is not None:
+            args = self._arguments(pending.slots, pending.args, words)
+            return ParsedCommand(pending.verb, pending.handler, args, pending.slots)
+        return ParsedCommand(words[0].lower())
+
+    # fill the slots from len(args) on. Each phrase runs to the next slot's
+    # preposition, the last one to the end of the line.
+    @staticmethod
+    def _arguments(slots, args, words):
+        args = list(args)
+        index = 0
+        while index < len(words) and len(args) < len(slots):
+            lead = slots[len(args)][0]
+            if lead and words[index].lower() == lead:
+                index += 1
+                if index == len(words):
+                    break
+            stop = slots[len(args) + 1][0] if len(args) + 1 < len(slots) else None
+            end = index
+            while end < len(words) and words[end].lower() != stop:
+                end += 1
+            args.append(" ".join(words[index:end]))
+            index = end
+        return tuple(args)
+
+# The help screen, compiled into a Template once
+HELP_SECTIONS = {
+    "Movement": [
+        ("move/go/g/m <direction>", "Navigate in a direction (forward/back/left/right)"),
+        ("goto/go to/route <room>", "Show the quickest way to a room"),
+        ("exits/ex", "Show available exits from current location")
+    ],
+    "Observation": [
+        ("look/l/whereami", "View current location description"),
+        ("inspect/ins/i/look at <item>", "Examine an item closely")
+    ],
+    "Inventory": [
+        ("inventory/inv/e", "View your carried items"),
+        ("take/t/pickup/pick up <item>", "Pick up an item"),
+        ("use/u <item> on <target>", "Use an item on something")
+    ],
+    "System": [
+        ("undo/redo", "Take back your last move, or put it back again"),
+        ("help/h/?", "Show this help screen")
+    ]
+}
+
+HELP_EXAMPLES = [
+    ("move forward", "Move forward"),
+    ("take spanner", "Pick up the rusty spanner"),
+    ("inspect beacon", "Inspect the emergency beacon"),
+    ("use antenna on beacon", "Use antenna on beacon"),
+    ("take spanner; go left", "Run several commands in one line"),
+]
+
+def help_template():
+    lines = ["{BOLD}Available commands:{RESET}", "{CYAN}-------------------{RESET}"]
+    for category, commands in HELP_SECTIONS.items():
+        lines.append(f"\n{{BOLD}}{category}:{{RESET}}")
+        for cmd, desc in commands:
+            lines.append(f"  {{GREEN}}{cmd}{{RESET}}")
+            lines.append(f"      {desc}")
+    lines.append("\n{YELLOW}Examples:{RESET}")
+    for example, desc in HELP_EXAMPLES:
+        lines.append(f"  {{CYAN}}{example}{{RESET}} - {desc}")
+    return Template("\n".join(lines))
+
+HELP = help_template()
+ITEM_LINE = Template("- {CYAN}{name}{RESET}")
+COMMAND_SUGGESTION = Template("{RED}Command not found. Did you mean '{YELLOW}{suggestion}{RED}'?{RESET}")
+
+# Views a session keeps rendered, see RenderCache
+RENDER_CACHE_SIZE = 8
+
+# A session's last few rendered views (look, exits, inventory, help) as tuples of
+# output lines, least recently used first. Keys carry whatever the view depends on,
+# Game.version for the ones that change with the game state, so a stale entry is
+# never found again and just ages out. A plain dict keeps the order for less memory
+# than an OrderedDict, every session has one of these.
+class RenderCache:
+    __slots__ = ("capacity", "entries")
+
+    def __init__(self, capacity=RENDER_CACHE_SIZE):
+        self.capacity = capacity
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        lines = self.entries.pop(key, None)
+        if lines is not None:
+            self.entries[key] = lines
+        return lines
+
+    def put(self, key, lines):
+        self.entries[key] = lines
+        if len(self.entries) > self.capacity:
+            del self.entries[next(iter(self.entries))]
+
+# Steps a game can always undo. The history is cut back to this many once it's
+# twice as long, so a session never holds more than 2 * UNDO_LIMIT checkpoints.
+UNDO_LIMIT = 32
+
+# The game's state after a command, for undo, redo and Game.fork(). Checkpoints are
+# never changed once made and each points at the one before it, so a history is a
+# chain of them and a fork's history is the same chain with new ones on the end.
+#
+# Everything in one is ints and tuples. A new checkpoint shares whatever the
+# command didn't change with its parent: the same inventory tuple, and the same
+# rooms tuple (room name, item ids, room name, item ids... for the rooms the
+# session has changed, flat as it's a third the size of a dict) unless
+# World.touched says a room's items moved, in which case only those rooms get new
+# item tuples. A step costs a small object plus what actually changed.
+#
+# The RNG isn't part of it: undoing and trying IRIS again rolls again. A fork gets
+# a copy of the generator, so both branches roll the same.
+class Checkpoint:
+    __slots__ = ("parent", "depth", "label", "room_id", "facing", "move_count", "flags",
+                 "inventory", "rooms", "running", "ending", "pending", "dialog")
+
+    def __init__(self, parent, label, room_id, facing, move_count, flags, inventory, rooms,
+                 running, ending, pending, dialog):
+        self.parent = parent
+        self.depth = parent.depth + 1 if parent is not None else 0
+        # the command that got the game here, for "undo" and "redo" to name
+        self.label = label
+        self.room_id = room_id
+        self.facing = facing
+        self.move_count = move_count
+        self.flags = flags
+        self.inventory = inventory
+        self.rooms = rooms
+        self.running = running
+        self.ending = ending
+        # pending command text, and the question being asked as (kind, room, direction,
+        # trigger, step, calibrated), both None when there isn't one
+        self.pending = pending
+        self.dialog = dialog
+
+    # the same game state, whatever led to it
+    def same(self, other):
+        return (self.room_id == other.room_id and self.facing == other.facing
+                and self.move_count == other.move_count and self.flags == other.flags
+                and self.inventory == other.inventory and self.rooms == other.rooms
+                and self.running == other.running and self.ending == other.ending
+                and self.pending == other.pending and self.dialog == other.dialog)
+
+    # this checkpoint on top of another parent
+    def moved_to(self, parent):
+        return Checkpoint(parent, self.label, self.room_id, self.facing, self.move_count, self.flags,
+                          self.inventory, self.rooms, self.running, self.ending, self.pending, self.dialog)
+
+    # The last count checkpoints up to this one as a chain of their own. The old chain
+    # is left alone, forks may still be using it.
+    def cut(self, count):
+        kept = []
+        checkpoint = self
+        while checkpoint is not None and len(kept) < count:
+            kept.append(checkpoint)
+            checkpoint = checkpoint.parent
+        parent = None
+        for checkpoint in reversed(kept):
+            parent = checkpoint.moved_to(parent)
+        return parent
+
 # Main game class to handle the game logic
 class Game:
-    def __init__(self, player, rooms):
+    # every alias and the handler it runs
+    COMMANDS = {
+        # Movement
+        "move": "command_move",
+        "m": "command_move",
+        "go": "command_move",
+        "g": "command_move",
+        "goto": "command_goto",
+        "go to": "command_goto",
+        "route": "command_goto",
+
+        # Observation
+        "look": "command_look",
+        "l": "command_look",
+        "whereami": "command_look",
+        "exits": "command_exits",
+        "ex": "command_exits",
+
+        # Inventory
+        "inventory": "command_inventory",
+        "inv": "command_inventory",
+        "e": "command_inventory",
+
+        # Interaction
+        "take": "command_take",
+        "t": "command_take",
+        "pickup": "command_take",
+        "pick up": "command_take",
+        "get": "command_take",
+        "use": "command_use",
+        "u": "command_use",
+        "inspect": "command_inspect",
+        "ins": "command_inspect",
+        "examine": "command_inspect",
+        "i": "command_inspect",
+        "look at": "command_inspect",
+
+        # System
+        "undo": "command_undo",
+        "redo": "command_redo",
+        "help": "command_help",
+        "h": "command_help",
+        "?": "command_help",
+    }
+
+    # the arguments each handler reads, with the prepositions between them
+    SYNTAX = {
+        "command_move": ("direction",),
+        "command_goto": ("room",),
+        "command_take": ("item",),
+        "command_use": ("item", "on", "item"),
+        "command_inspect": ("item",),
+    }
+
+    grammar = CommandGrammar(COMMANDS, SYNTAX)
+
+    def __init__(self, player, rooms, io=None, seed=None, record=False, metrics=None, events=None):
         self.player = player
-        self.rooms = rooms
+        # the game works on the same world as its player
+        if isinstance(rooms, World):
+            player.rooms = rooms
+        self.rooms = player.rooms
+        # the game and the player always share one I/O port
+        self.io = io or player.io
+        self.player.io = self.io
         self.running = True
-        self.commands = {
-            # Movement
-            "move": self.command_move,
-            "m": self.command_move,
-            "go": self.command_move,
-            "g": self.command_move,
-            
-            # Observation
-            "look": self.command_look,
-            "l": self.command_look,
-            "whereami": self.command_look,
-            "exits": self.command_exits,
-            "ex": self.command_exits,
-            
-            # Inventory
-            "inventory": self.command_inventory,
-            "inv": self.command_inventory,
-            "e": self.command_inventory,
-            
-            # Interaction
-            "take": self.command_take,
-            "t": self.command_take,
-            "pickup": self.command_take,
-            "get": self.command_take,
-            "use": self.command_use,
-            "u": self.command_use,
-            "inspect": self.command_inspect,
-            "ins": self.command_inspect,
-            "examine": self.command_inspect,
-            "i": self.command_inspect,
-            
-            # System
-            "help": self.command_help,
-            "h": self.command_help,
-            "?": self.command_help,
-        }
+        self.ending = None
+        # every random roll comes from this seeded generator so sessions can be replayed
+        self.seed = random.randrange(2 ** 32) if seed is None else seed
+        self._rng = None
+        # optional journal of everything the player typed, see Journal. Pass a text
+        # stream as record to have it written out as the game goes.
+        self.journal = None
+        if record:
+            stream = None if record is True else record
+            self.journal = Journal(self.seed, self.rooms.template.fingerprint, stream)
+        self.commands = CommandTable(self)
         self.pending_command = None
+        # the question the game is waiting on an answer to, see Dialog
+        self.dialog = None
+        # bumped by everything that can change what look or inventory show, see changed()
+        self.version = 0
+        # made on the first look, exits, inventory or help
+        self.renders = None
+        # undo history, see Checkpoint: the last checkpoint taken, the version it was
+        # taken at, the command it'll be named after and the checkpoints undone since
+        self.head = None
+        self.recorded = 0
+        self.label = None
+        self.redos = None
+        # the command aliases never change, so every game shares one suggestion index
+        self.command_suggestions = command_suggestions(self.commands)
+        # optional metrics.Metrics. Without it nothing is wrapped or timed.
+        self.metrics = metrics
+        if metrics is not None:
+            self.io.metrics = metrics
+            self._instrument(metrics)
+        # optional events.SessionEvents the game reports what the player does to
+        self.events = events
+
+    # The generator is only made the first time something rolls, most sessions never do
+    @property
+    def rng(self):
+        if self._rng is None:
+            self._rng = random.Random(self.seed)
+        return self._rng
+
+    @rng.setter
+    def rng(self, rng):
+        self._rng = rng
+
+    # Time handle_command and every handler. The wrappers replace the entries on this
+    # instance only, so games without metrics run the plain methods.
+    def _instrument(self, metrics):
+        def timed(function, name, **labels):
+            def wrapper(*args):
+                started = time.perf_counter()
+                try:
+                    return function(*args)
+                finally:
+                    metrics.observe(name, time.perf_counter() - started, **labels)
+            wrapper.__name__ = function.__name__
+            return wrapper
+
+        self.handle_command = timed(self.handle_command, "iris_command_seconds")
+        handlers = {}
+        for alias, handler in self.commands.items():
+            if handler not in handlers:
+                handlers[handler] = timed(handler, "iris_handler_seconds", command=handler.__name__[len("command_"):])
+            self.commands[alias] = handlers[handler]
 
 # Start the game
     def start(self):
         try:
-            print(self.rooms[self.player.current_room].description)
+            self.io.output(self.rooms[self.player.current_room].description)
             while self.running:
+                # a question has already been shown, otherwise ask for a command
+                waiting = self.dialog is not None
+                started = time.perf_counter()
                 try:
-                    command_input = input("\n> ").strip()
-                    if not command_input:
-                        continue
-                    
-                    if self.pending_command:
-                        if command_input.split()[0] in self.commands:
-                            self.pending_command = None
-                            self.handle_command(command_input)
-                        else:
-                            full_command = f"{self.pending_command} {command_input}"
-                            self.pending_command = None
-                            self.handle_command(full_command)
-                    else:
-                        self.handle_command(command_input)
-                    
-                    if self.player.move_count == 3 and not self.player.flags.get("three_move_cutscene_played") and self.player.flags["entered_airlock_from_door"]:
-                        Cutscene([
-                            "The dust storm sure hit hard... ",
-                            "You should probably check if something is damaged outside, ",
-                            "try exiting through the airlock. "
-                        ], speed=0.03, lineDelay=2).play()
-                        self.player.flags["three_move_cutscene_played"] = True
-                        
+                    command_input = self.io.read("" if waiting else "\n> ")
+                except EOFError:
+                    break
+                if self.metrics is not None:
+                    wait = "iris_prompt_wait_seconds" if waiting else "iris_input_wait_seconds"
+                    self.metrics.observe(wait, time.perf_counter() - started)
+                try:
+                    self.step(command_input)
                 except Exception as e:
-                    print(f"Command error: {str(e)}")
+                    self.io.output(f"Command error: {str(e)}")
+                    record_error(self.io, "start", e)
                     
         except Exception as e:
-            print(f"Critical game error: {str(e)}")
-            print("Game session terminated unexpectedly.")
+            self.io.output(f"Critical game error: {str(e)}")
+            record_error(self.io, "start", e)
+            self.io.output("Game session terminated unexpectedly.")
+
+# Run one line of player input and return a CommandResult describing what happened.
+# This is the entry point for headless sessions, start() just calls it in a loop.
+    def step(self, command_input):
+        command_input = command_input.strip()
+        result = CommandResult(command_input)
+        # once the game is over nothing more is played, or journaled after its end
+        if not self.running:
+            return result
+        # an empty line is still an answer
+        if not command_input and self.dialog is None:
+            return result
+
+        before = self.state()
+        self.io.result = result
+        self.io.hold()
+        if self.journal is not None:
+            if self.dialog is not None:
+                self.journal.answer(command_input)
+            else:
+                self.journal.command(command_input)
+        try:
+            if ";" not in command_input:
+                self._run_command(command_input)
+            else:
+                # "take spanner; go left" runs each part in turn, and a part that comes
+                # while the game is asking something is the answer, like lines of a script
+                for part in command_input.split(";"):
+                    if not self.running:
+                        break
+                    self._run_command(part.strip())
+        finally:
+            self.io.result = None
+            self.io.release()
+            # a later part of the batch may have answered the question an earlier one asked
+            if self.dialog is None:
+                result.awaiting = None
+            after = self.state()
+            for key in after.keys() - before.keys():
+                # a room this command touched for the first time started out as in the template
+                if key.startswith("room_items."):
+                    before[key] = tuple(item.name for item in self.rooms[key[len("room_items."):]].items)
+            for key in before.keys() - after.keys():
+                # and one an undo put back is as in the template again
+                if key.startswith("room_items."):
+                    after[key] = tuple(item.name for item in self.rooms[key[len("room_items."):]].items)
+            result.changes = {key: (before.get(key), value) for key, value in after.items() if before.get(key) != value}
+        if self.journal is not None:
+            self.journal.commit()
+            if not self.running:
+                self.journal.finish(self)
+        return result
+
+    def _run_command(self, command_input):
+        player = self.player
+        moves = player.move_count
+        if self.head is None and self.dialog is None:
+            self.head = self.checkpoint(None)
+            self.recorded = self.version
+        if self.events is not None:
+            before = (self.dialog, player.room_id, player.flags.bits, self.running)
+        # "undo" and "redo" are never answers, they work the history even mid-question
+        if self.dialog is not None and command_input.casefold() not in ("undo", "redo"):
+            self.answer(command_input)
+        else:
+            if self.dialog is None:
+                self.label = command_input
+            self.handle_command(command_input)
+        if player.move_count != moves:
+            self.rooms.triggers.fire("moves", player.move_count, player.flags, self)
+        if self.version != self.recorded and self.dialog is None:
+            self._record()
+        if self.events is not None:
+            self._emit(command_input, *before)
+
+# Events for one command or answer: what was typed, then the flags it changed and
+# the ending if it ended the game
+    def _emit(self, text, dialog, room_id, flags, running):
+        events = self.events
+        player = self.player
+        fields = {"room": self.rooms.template.room_list[room_id]}
+        if dialog is not None:
+            fields["dialog"] = dialog.kind
+        fields["text"] = text
+        if player.room_id != room_id:
+            fields["to"] = player.current_room
+        events.emit("command" if dialog is None else "answer", **fields)
+        changed = flags ^ player.flags.bits
+        if changed:
+            here = player.current_room
+            for name in PLAYER_FLAGS:
+                if changed & FLAG_BITS[name]:
+                    events.emit("flag", room=here, flag=name, value=player.flags[name])
+        if running and not self.running:
+            events.emit("ending", room=player.current_room, ending=self.ending, moves=player.move_count)
+
+# Stop the command at a question. The game waits in this state, holding nothing
+# but the Dialog, until the next input answers it.
+    def ask(self, dialog):
+        self.dialog = dialog
+        self.io.ask(dialog.prompt(self))
+
+    def answer(self, text):
+        dialog, self.dialog = self.dialog, None
+        # answers move the player, hand out items and take them away
+        self.changed()
+        if self.io.result is not None:
+            self.io.result.prompts.append((self.io.render(dialog.prompt(self)), text))
+        try:
+            dialog.answer(self, text)
+        except GameError as e:
+            self.io.output(f"Error: {str(e)}")
+            record_error(self.io, "answer", e)
+        except Exception as e:
+            self.io.output(f"Unexpected error: {str(e)}")
+            record_error(self.io, "answer", e)
+
+# Run a list of inputs on a headless port, stopping early if the game ends.
+# Commands and prompt answers share one queue, exactly like lines typed at a terminal.
+    def run_script(self, lines):
+        self.io.feed(*lines)
+        results = []
+        while self.running:
+            try:
+                command_input = self.io.read("" if self.dialog else "\n> ")
+            except EOFError:
+                break
+            results.append(self.step(command_input))
+        return results
+
+    # Compact binary snapshot of the whole session: player position, inventory, flags
+    # and which rooms' contents changed. Layout (little-endian):
+    #   header   magic "IRS", version, world fingerprint, room, facing, move count,
+    #            flag bitset, running, ending, pending command length
+    #   body     pending command (utf-8), the dialog being answered if any,
+    #            inventory count + item ids,
+    #            changed room count, then per room: room id, item count + item ids
+    def snapshot(self):
+        template = self.rooms.template
+        player = self.player
+        pending = self.pending_command.text().encode() if self.pending_command else b""
+
+        data = bytearray(SNAPSHOT_HEADER.pack(
+            SNAPSHOT_MAGIC, SNAPSHOT_VERSION, template.fingerprint,
+            player.room_id, player.facing,
+            player.move_count, player.flags.bits, self.running, ENDINGS.index(self.ending), len(pending)))
+        data += pending
+        dialog = self.dialog
+        if dialog is None:
+            data += SNAPSHOT_DIALOG.pack(0, NO_ROOM, 0, 0, 0, 0)
+        else:
+            data += SNAPSHOT_DIALOG.pack(
+                DIALOGS.index(type(dialog)), template.room_ids.get(dialog.room, NO_ROOM),
+                DIRECTION_IDS.get(dialog.direction, 0), dialog.trigger, dialog.step, dialog.calibrated)
+        data += _pack_ids(player.inventory.ids)
+        data += SNAPSHOT_COUNT.pack(len(self.rooms.moved))
+        for room_name, room_items in self.rooms.moved.items():
+            data += SNAPSHOT_ID.pack(template.room_ids[room_name])
+            data += _pack_ids(room_items.ids)
+        return bytes(data)
+
+    # Load a snapshot taken with snapshot() into this game, replacing its state
+    def restore(self, data):
+        template = self.rooms.template
+        (magic, version, fingerprint, room_id, facing, move_count,
+         flags, running, ending, pending_length) = SNAPSHOT_HEADER.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise GameError("Not a save file this version of the game can load")
+        if fingerprint != template.fingerprint:
+            raise GameError("This save was made in a different world")
+
+        offset = SNAPSHOT_HEADER.size
+        pending = data[offset:offset + pending_length].decode()
+        offset += pending_length
+        kind, dialog_room, direction, trigger, step, calibrated = SNAPSHOT_DIALOG.unpack_from(data, offset)
+        offset += SNAPSHOT_DIALOG.size
+        dialog = None
+        if kind:
+            dialog = DIALOGS[kind](
+                template.room_list[dialog_room] if dialog_room != NO_ROOM else None,
+                DIRECTIONS[direction], trigger, step, bool(calibrated))
+        inventory, offset = _unpack_ids(data, offset)
+        (moved_count,) = SNAPSHOT_COUNT.unpack_from(data, offset)
+        offset += SNAPSHOT_COUNT.size
+        moved = {}
+        for _ in range(moved_count):
+            (moved_room,) = SNAPSHOT_ID.unpack_from(data, offset)
+            room_items, offset = _unpack_ids(data, offset + SNAPSHOT_ID.size)
+            moved[template.room_list[moved_room]] = ItemBag.from_ids(room_items, template.catalog)
+
+        player = self.player
+        player.room_id = room_id
+        player.facing = facing
+        player.move_count = move_count
+        player.flags = Flags(flags)
+        player.inventory = ItemBag.from_ids(inventory, template.catalog)
+        self.rooms.moved = moved
+        self.running = bool(running)
+        self.ending = ENDINGS[ending]
+        self.pending_command = self.grammar.parse(pending) if pending else None
+        self.dialog = dialog
+        self.changed()
+        # a loaded game starts a new history
+        self.head = self.redos = None
+        self.rooms.touched = None
+        return self
+
+    # New game restored from a snapshot
+    @classmethod
+    def from_snapshot(cls, data, world=None, io=None, name="Player1", seed=None, metrics=None, events=None):
+        player = Player(name, world or world_template, io=io)
+        return cls(player, player.rooms, seed=seed, metrics=metrics, events=events).restore(data)
+
+    # The game as it is now, as a Checkpoint on top of parent, sharing what hasn't
+    # changed since parent was taken
+    def checkpoint(self, parent):
+        player = self.player
+        world = self.rooms
+        inventory = tuple(player.inventory.ids)
+        if parent is None:
+            rooms = tuple(field for room_name, room_items in world.moved.items()
+                          for field in (room_name, tuple(room_items.ids)))
+        else:
+            if inventory == parent.inventory:
+                inventory = parent.inventory
+            rooms = parent.rooms
+            if world.touched:
+                fields = list(rooms)
+                names = fields[::2]
+                for room_name in world.touched:
+                    room_items = tuple(world.moved[room_name].ids)
+                    if room_name not in names:
+                        fields += (room_name, room_items)
+                    elif fields[2 * names.index(room_name) + 1] != room_items:
+                        fields[2 * names.index(room_name) + 1] = room_items
+                if fields != list(rooms):
+                    rooms = tuple(fields)
+        dialog = self.dialog
+        if dialog is not None:
+            dialog = (DIALOGS.index(type(dialog)), dialog.room, dialog.direction, dialog.trigger,
+                      dialog.step, dialog.calibrated)
+        return Checkpoint(parent, self.label, player.room_id, player.facing, player.move_count,
+                          player.flags.bits, inventory, rooms, self.running, self.ending,
+                          self.pending_command.text() if self.pending_command else None, dialog)
+
+    # A command changed the game and isn't waiting on an answer: add a checkpoint to
+    # the history, unless it ended up just as it was. A game loaded halfway through a
+    # question starts its history once that's answered, there's nothing before it to undo.
+    def _record(self):
+        self.recorded = self.version
+        if self.head is None:
+            self.head = self.checkpoint(None)
+            self.rooms.touched = None
+            return
+        checkpoint = self.checkpoint(self.head)
+        self.rooms.touched = None
+        if checkpoint.same(self.head):
+            return
+        if checkpoint.depth >= 2 * UNDO_LIMIT:
+            checkpoint = checkpoint.cut(UNDO_LIMIT)
+        self.head = checkpoint
+        self.redos = None
+
+    # Put the game back to a checkpoint and make it the head of the history
+    def _load(self, checkpoint):
+        catalog = self.rooms.template.catalog
+        player = self.player
+        player.room_id = checkpoint.room_id
+        player.facing = checkpoint.facing
+        player.move_count = checkpoint.move_count
+        player.flags.bits = checkpoint.flags
+        player.inventory = ItemBag.from_ids(checkpoint.inventory, catalog)
+        rooms = checkpoint.rooms
+        self.rooms.moved = {rooms[i]: ItemBag.from_ids(rooms[i + 1], catalog) for i in range(0, len(rooms), 2)}
+        self.rooms.touched = None
+        self.running = checkpoint.running
+        self.ending = checkpoint.ending
+        self.pending_command = self.grammar.parse(checkpoint.pending) if checkpoint.pending else None
+        self.dialog = None
+        self.head = checkpoint
+        self.changed()
+        self.recorded = self.version
+        if checkpoint.dialog is not None:
+            kind, room, direction, trigger, step, calibrated = checkpoint.dialog
+            self.ask(DIALOGS[kind](room, direction, trigger, step, calibrated))
+
+    # A new game carrying on from exactly where this one is, even halfway through a
+    # question, on its own I/O port. The two share all of their history so far and
+    # either can undo back through it; what happens after the fork is their own.
+    def fork(self, io=None, metrics=None, events=None):
+        io = io or HeadlessIO(keep_transcript=False, color=self.io.color)
+        player = Player(self.player.name, self.rooms.template, io=io)
+        game = Game(player, player.rooms, io=io, seed=self.seed, metrics=metrics, events=events)
+        head = self.head
+        checkpoint = self.checkpoint(head)
+        if head is not None and checkpoint.same(head):
+            checkpoint = head
+        game.label = self.label
+        game._load(checkpoint)
+        # halfway through a question the fork's history ends where this one's does,
+        # so its undo takes back the command that asked, the same as this game's
+        game.head = head
+        if self.version != self.recorded:
+            game.recorded = None
+            game.rooms.touched = set(self.rooms.touched) if self.rooms.touched else None
+        if self._rng is not None:
+            game.rng.setstate(self._rng.getstate())
+        return game
+
+# The game is over, with one of the ENDINGS
+    def end(self, ending):
+        self.ending = ending
+        self.running = False
+
+# The player's room, inventory or a room's items may have changed: rendered views
+# keyed on the old version are out of date
+    def changed(self):
+        self.version += 1
+
+# Send a view from the render cache, or run show() to output it and keep what it wrote
+    def cached(self, key, show):
+        renders = self.renders
+        if renders is None:
+            renders = self.renders = RenderCache()
+        key += (self.io.color,)
+        lines = renders.get(key)
+        if self.metrics is not None:
+            self.metrics.inc("iris_render_cache_total", result="miss" if lines is None else "hit")
+        if lines is not None:
+            self.io.replay(lines)
+            return
+        io = self.io
+        io.captured = []
+        try:
+            show()
+        finally:
+            lines, io.captured = io.captured, None
+        renders.put(key, tuple(lines))
+
+    def state(self):
+        state = self.player.state()
+        state["running"] = self.running
+        state["ending"] = self.ending
+        for room_name, room_items in self.rooms.moved.items():
+            state[f"room_items.{room_name}"] = tuple([item.name for item in room_items])
+        return state
 
 # Handle commands input by the player
     def handle_command(self, command_input):
@@ -526,79 +2325,150 @@ class Game:
             return
 
         try:
-            parts = command_input.split()
-            command = parts[0].lower()
-            args = parts[1:]
+            command = self.grammar.parse(command_input, self.pending_command)
+            self.pending_command = None
+            if command is None:
+                return
 
-            if command in self.commands:
-                self.commands[command](args)
+            if command.handler:
+                if self.metrics is not None:
+                    self.metrics.inc("iris_commands_total", result="hit")
+                # the handler asks for what's missing and the next line carries on from here
+                if not command.complete:
+                    self.pending_command = command
+                self.commands[command.verb](command.args)
             else:
-                suggestions = difflib.get_close_matches(command, self.commands.keys(), n=1, cutoff=0.6)
-                if suggestions:
-                    print(f"{Colors.RED}Command not found. Did you mean '{Colors.YELLOW}{suggestions[0]}{Colors.RED}'?{Colors.RESET}")
+                command = command.verb
+                suggestion = self.command_suggestions.suggest(command, cutoff=0.6)
+                if self.metrics is not None:
+                    self.metrics.inc("iris_commands_total", result="suggested" if suggestion else "unknown")
+                    self.metrics.inc("iris_suggestions_total", kind="command", result="hit" if suggestion else "miss")
+                if suggestion:
+                    self.io.output(COMMAND_SUGGESTION, suggestion=suggestion)
                 else:
                     raise GameError(f"Unknown command: '{command}'. Type 'help' for available commands.")
                     
         except GameError as e:
-            print(f"Error: {str(e)}")
+            self.io.output(f"Error: {str(e)}")
+            record_error(self.io, "handle_command", e)
         except Exception as e:
-            print(f"Unexpected command error: {str(e)}")
+            self.io.output(f"Unexpected command error: {str(e)}")
+            record_error(self.io, "handle_command", e)
+# Shared item resolver for every command: the first bag that has a match wins
+    def find_item(self, name, *bags):
+        for bag in bags:
+            item = bag.find(name)
+            if item:
+                if self.metrics is not None:
+                    self.metrics.inc("iris_item_lookups_total", result="hit")
+                return item
+        if self.metrics is not None:
+            self.metrics.inc("iris_item_lookups_total", result="miss")
+        return None
+
+# Closest item name across the bags for a miss, or None
+    def suggest_item(self, name, *bags):
+        matches = [match for match in (bag.suggest(name) for bag in bags) if match]
+        if self.metrics is not None:
+            self.metrics.inc("iris_suggestions_total", kind="item", result="hit" if matches else "miss")
+        return max(matches)[1] if matches else None
+
 # handlers for each command
     def command_move(self, args):
         try:
             if not args:
-                self.pending_command = "move"
                 raise GameError("Move where? (forward/back/left/right)")
                 
-            self.player.move(" ".join(args))
+            dialog = self.player.move(args[0])
+            self.changed()
+            if dialog:
+                self.ask(dialog)
         except GameError as e:
-            print(f"Move error: {str(e)}")
+            self.io.output(f"Move error: {str(e)}")
+            record_error(self.io, "command_move", e)
         except Exception as e:
-            print(f"Unexpected move error: {str(e)}")
+            self.io.output(f"Unexpected move error: {str(e)}")
+            record_error(self.io, "command_move", e)
+
+    def command_goto(self, args):
+        try:
+            if not args:
+                raise GameError("Go to which room?")
+
+            navigation = self.rooms.template.navigation
+            room_name = args[0]
+            target = navigation.find_room(room_name)
+            if not target:
+                raise GameError(f"There's no room called '{room_name}'")
+            title = target.replace('_', ' ').title()
+            if target == self.player.current_room:
+                self.io.output(f"You are already in the {title}.")
+                return
+
+            found = navigation.route(self.player.current_room, self.player.facing_direction, target,
+                                     self.player.flags)
+            if found is None:
+                raise GameError(f"There's no way to get to the {title} from here")
+            route, doors = found
+            self.io.output(f"Route to the {title} ({len(route)} move{'s' if len(route) != 1 else ''}):")
+            self.io.output("  " + ", ".join(f"move {move}" for move in route))
+            for door in navigation.locked(self.player.flags).intersection(doors):
+                self.io.output(f"  The {door.replace('_', ' ')} door will ask for an access code.")
+            if AIRLOCK in doors:
+                self.io.output("  You'll have to confirm going through the airlock.")
+        except GameError as e:
+            self.io.output(f"Route error: {str(e)}")
+            record_error(self.io, "command_goto", e)
+        except Exception as e:
+            self.io.output(f"Unexpected route error: {str(e)}")
+            record_error(self.io, "command_goto", e)
 
     def command_look(self, args):
         try:
-            self.player.look()
+            self.cached(("look", self.version), self.player.look)
         except Exception as e:
-            print(f"Look command failed: {str(e)}")
+            self.io.output(f"Look command failed: {str(e)}")
+            record_error(self.io, "command_look", e)
 
     def command_inventory(self, args):
         try:
-            self.player.view_inventory()
+            self.cached(("inventory", self.version), self.player.view_inventory)
         except Exception as e:
-            print(f"Inventory command failed: {str(e)}")
+            self.io.output(f"Inventory command failed: {str(e)}")
+            record_error(self.io, "command_inventory", e)
 
     def command_take(self, args):
         try:
             if not args:
-                self.pending_command = "take"
                 raise GameError("Take what?")
                 
-            item_name = " ".join(args)
+            item_name = args[0]
             room = self.rooms.get(self.player.current_room)
             if not room:
                 raise GameError("Current room not found")
             
-            available_items = [item.name.lower() for item in room.items]
-            
-            item = next((i for i in room.items if i.name.lower() == item_name.lower()), None)
+            room_items = self.rooms.items_in(room.name)
+            item = self.find_item(item_name, room_items)
             if not item:
-                suggestions = difflib.get_close_matches(item_name, available_items, n=1, cutoff=0.5)
-                if suggestions:
-                    raise GameError(f"No item named '{item_name}' found. Did you mean '{suggestions[0]}'?")
+                suggestion = self.suggest_item(item_name, room_items)
+                if suggestion:
+                    raise GameError(f"No item named '{item_name}' found. Did you mean '{suggestion}'?")
                 raise GameError(f"No item named '{item_name}' found here")
                 
-            if any(i.name.lower() == item_name.lower() for i in self.player.inventory):
+            if item in self.player.inventory:
                 raise GameError(f"You already have {item.name}")
                 
             self.player.inventory.append(item)
-            room.items.remove(item)
-            print(f"You picked up the {item.name}.")
+            self.rooms.remove_item(room.name, item)
+            self.changed()
+            self.io.output(f"You picked up the {item.name}.")
             
         except GameError as e:
-            print(f"Take error: {str(e)}")
+            self.io.output(f"Take error: {str(e)}")
+            record_error(self.io, "command_take", e)
         except Exception as e:
-            print(f"Unexpected take error: {str(e)}")
+            self.io.output(f"Unexpected take error: {str(e)}")
+            record_error(self.io, "command_take", e)
 
     ## End Dhyan's Code
 
@@ -607,81 +2477,56 @@ class Game:
     def command_use(self, args):
         try:
             if not args:
-                self.pending_command = "use"
                 raise GameError("Use what? (e.g., spanner on briefcase)")
                 
-            if "on" not in args:
-                self.pending_command = "use " + " ".join(args)
+            if len(args) < 2:
                 raise GameError("Use on what? (syntax: use <item> on <target>)")
                 
-            on_idx = args.index("on")
-            item_name = " ".join(args[:on_idx])
-            target_name = " ".join(args[on_idx+1:])
+            item_name, target_name = args
 
-            tool = next((i for i in self.player.inventory if i.name.lower() == item_name.lower()), None)
+            tool = self.find_item(item_name, self.player.inventory)
             if not tool:
                 raise GameError(f"You don't have an item named '{item_name}'")
 
-            if tool.name == "Unstable Power Cell" and target_name.lower() == "iris":
-                if self.player.flags.get("iris_broken"):
-                    print(f"{Colors.RED}The IRIS device is completely destroyed and cannot be used.{Colors.RESET}")
-                    return
-                    
-                target_in_inventory = next((i for i in self.player.inventory if i.name.lower() == "iris"), None)
-                if target_in_inventory:
-                    self.trigger_iris_ending()
-                    return
-                else:
-                    raise GameError("You need to have the IRIS device in your inventory to use the power cell on it.")
-
             room = self.rooms[self.player.current_room]
-            target = next((i for i in room.items if i.name.lower() == target_name.lower()), None)
-            in_inventory = False
-            if not target:
-                target = next((i for i in self.player.inventory if i.name.lower() == target_name.lower()), None)
-                in_inventory = bool(target)
+            target = self.find_item(target_name, self.rooms.items_in(room.name), self.player.inventory)
+            in_inventory = target is not None and target in self.player.inventory
 
-            if not target:
-                raise GameError(f"There is no '{target_name}' here or in your inventory")
+            # from here on items can be used up, handed out or moved
+            self.changed()
 
-            if tool.name == "Antenna" and target.name == "Emergency Beacon":
-                Cutscene([
-                    "You attach the antenna onto the emergency beacon. ",
-                    "The red error light turns blue and then... it turns green. ",
-                    "A faint buzzing sound confirms the signal is broadcasting. ",
-                    "Now it's just a matter of waiting... ",
-                    "",
-                    "Hours pass. ",
-                    "Then... a sound. A voice crackles through the comms. ",
-                    "\"We received your signal. Help is on the way.\" ",
-                    "You're going home. "
-                ], speed=0.04, lineDelay=2).play()
-                print("=== ENDING: RESCUED ===")
-                self.running = False
+            # scripted item pairs come first, matched on what was typed if the target isn't here
+            pair = (tool.key, target.key if target else target_name.casefold())
+            if self.rooms.triggers.fire("use", pair, self.player.flags, self, tool, target, in_inventory):
                 return
 
+            if not target:
+                raise GameError(f"There is no '{target_name}' here or in your inventory")
+
             if target.requires and any(tool.name == req for req in target.requires):
-                print(f"You used {tool.name} on {target.name}.")
+                self.io.output(f"You used {tool.name} on {target.name}.")
                 if target.contains:
-                    print(f"{target.name} opens, revealing:")
+                    self.io.output(f"{target.name} opens, revealing:")
                     for content_name in target.contains:
-                        content = items.get(content_name)
+                        content = self.rooms.items.get(content_name)
                         if not content:
                             continue
                         self.player.inventory.append(content)
-                        print(f"- {content.name} (added to inventory)")
+                        self.io.output(f"- {content.name} (added to inventory)")
                     if in_inventory:
                         self.player.inventory.remove(target)
                     else:
-                        room.items.remove(target)
+                        self.rooms.remove_item(room.name, target)
                 return
 
-            print(f"Using {tool.name} on {target.name} did nothing.")
+            self.io.output(f"Using {tool.name} on {target.name} did nothing.")
             
         except GameError as e:
-            print(f"Use error: {str(e)}")
+            self.io.output(f"Use error: {str(e)}")
+            record_error(self.io, "command_use", e)
         except Exception as e:
-            print(f"Unexpected use error: {str(e)}")
+            self.io.output(f"Unexpected use error: {str(e)}")
+            record_error(self.io, "command_use", e)
 
     ## End Saatvik's Code
 
@@ -689,90 +2534,48 @@ class Game:
 
 # special logic for the IRIS device ending
     def trigger_iris_ending(self):
-        Cutscene([
-            "You slot the humming power cell into the IRIS device. ",
-            "The screen flickers to life, bathing you in a cold, blue light. ",
-            "IRIS: 'Primary power detected. Life support protocol IRIS now active. '",
-            "IRIS: 'Calibration required. Please respond to prompts to stabilize system core. '",
-            "IRIS: 'Failure to comply may result in... unintended consequences. '"
-        ], speed=0.04, lineDelay=2).play()
-
-        calibration_success = True
-        prompts = {
-            "First, reroute auxiliary power. Do you route to [1] shields or [2] life-support?": "2",
-            "Next, align the gravimetric field. Set frequency to [1] 77.3 GHz or [2] 99.1 GHz?": "1",
-            "Finally, purge the coolant system. Do you [1] vent externally or [2] recycle coolant?": "1"
-        }
+        self.rooms.cutscenes["iris_activation"].play(self.io)
+        self.iris_calibration(0)
 
-        for prompt, correct_answer in prompts.items():
-            print(f"IRIS: '{prompt}'")
-            choice = input("> ").strip()
-            if choice != correct_answer:
-                calibration_success = False
-                Cutscene(["IRIS: 'Calibration failed. System integrity compromised.'"]).play()
-                break
-            else:
-                Cutscene(["IRIS: '...Acknowledged.'"], speed=0.01, lineDelay=0.5).play()
-        
-        if calibration_success:
-            Cutscene(["IRIS: 'Calibration successful. System is stable.'"]).play()
-
-        Cutscene([
-            "The device hums louder, its light intensifying.",
-            "IRIS: 'Final activation sequence initiated.'",
-            "IRIS: 'Warning: Prototype stabilization field may have unpredictable results.'",
-            "A countdown appears on the screen: 5... 4... 3..."
-        ], speed=0.04, lineDelay=1.5).play()
-
-        print("\nWhat do you do?")
-        print("1. Trust the device. Let IRIS activate.")
+# ask calibration question number step, or go on to the choice once all were right
+    def iris_calibration(self, step):
+        if step == len(IRIS_CALIBRATION):
+            self.iris_choice(calibrated=True)
+            return
+        self.io.output(f"IRIS: '{list(IRIS_CALIBRATION)[step]}'")
+        self.ask(IrisDialog(step=step))
+
+    def iris_choice(self, calibrated):
+        if calibrated:
+            self.rooms.cutscenes["iris_calibration_successful"].play(self.io)
+
+        self.rooms.cutscenes["iris_countdown"].play(self.io)
+
+        self.io.output("\nWhat do you do?")
+        self.io.output("1. Trust the device. Let IRIS activate.")
         
-        has_spanner = any(item.name == "Rusty Spanner" for item in self.player.inventory)
-        if has_spanner:
-            print("2. This is a mistake! Smash the device with the spanner!")
-
-        while True:
-            choice = input("> ").strip()
-            if choice == '1':
-                extraterrestrial_chance = 0.80 if not calibration_success else 0.55
-                if random.random() < extraterrestrial_chance:
-                    Cutscene([
-                        "IRIS: 'Activation complete. Emitting preservation field...'",
-                        "The blue light pulses... but the device emits a high-pitched whine.",
-                        "IRIS: 'WARNING! UNKNOWN UHF INTERFERENCE DETECTED! SOURCE... APPROACHING!'",
-                        "The spaceship's hull groans, not from the wind, but from a shadow falling over it.",
-                        "You look out the viewport to see something vast and dark descending from the Martian sky.",
-                        "IRIS attracted the wrong kind of attention.",
-                        "\n=== ENDING: ALIENS ==="
-                    ], speed=0.04, lineDelay=2).play()
-                    self.running = False
-                else:
-                    Cutscene([
-                        "IRIS: 'Activation complete. Biostabilization commencing.'",
-                        "A wave of cold energy washes over you. Your muscles lock, your breathing stops, but you feel no panic.",
-                        "Your vision is filled with a serene, endless blue light.",
-                        "You are safe. Preserved. Waiting for a rescue that may never come.",
-                        "You are immortal on the red planet. Forever.",
-                        "\n=== ENDING: SURVIVING, ALONE ==="
-                    ], speed=0.04, lineDelay=2).play()
-                    self.running = False
-                break
-            elif choice == '2' and has_spanner:
-                Cutscene([
-                    "You grip the rusty spanner and swing with all your might!",
-                    "Sparks erupt as metal screams against plastic.",
-                    "IRIS: 'ERROR! ERROR! SUBJECT NON-COMPLIANT! CATASTROPHIC-'",
-                    "The light from the device dies with a final, pathetic flicker.",
-                    "The IRIS device is completely destroyed.",
-                    "You stand alone in the silence."
-                ], speed=0.04, lineDelay=2).play()
-                # Remove IRIS and power cell from inventory
-                self.player.inventory = [item for item in self.player.inventory 
-                                       if item.name not in ["Iris", "Unstable Power Cell"]]
-                self.player.flags["iris_broken"] = True
-                break
+        if self.player.inventory.find("Rusty Spanner") is not None:
+            self.io.output("2. This is a mistake! Smash the device with the spanner!")
+        self.ask(IrisDialog(step=len(IRIS_CALIBRATION), calibrated=calibrated))
+
+    def iris_decision(self, dialog, choice):
+        has_spanner = self.player.inventory.find("Rusty Spanner") is not None
+        if choice == '1':
+            if self.rng.random() < IRIS_ALIEN_CHANCE[dialog.calibrated]:
+                self.rooms.cutscenes["iris_aliens"].play(self.io)
+                self.end("ALIENS")
             else:
-                print("Invalid choice. Please enter 1" + (" or 2" if has_spanner else ""))
+                self.rooms.cutscenes["iris_surviving"].play(self.io)
+                self.end("SURVIVING, ALONE")
+        elif choice == '2' and has_spanner:
+            self.rooms.cutscenes["iris_smashed"].play(self.io)
+            # Remove IRIS and power cell from inventory
+            for item in [item for item in self.player.inventory if item.name in ["Iris", "Unstable Power Cell"]]:
+                self.player.inventory.remove(item)
+            self.player.flags["iris_broken"] = True
+        else:
+            self.io.output("Invalid choice. Please enter 1" + (" or 2" if has_spanner else ""))
+            self.ask(dialog)
 
     ## End Dhyan's Code
 
@@ -780,42 +2583,10 @@ class Game:
 
     def command_help(self, args):
         try:
-            print(f"{Colors.BOLD}Available commands:{Colors.RESET}")
-            print(f"{Colors.CYAN}-------------------{Colors.RESET}")
-            
-            help_sections = {
-                "Movement": [
-                    ("move/go/g/m <direction>", "Navigate in a direction (forward/back/left/right)"),
-                    ("exits/ex", "Show available exits from current location")
-                ],
-                "Observation": [
-                    ("look/l/whereami", "View current location description"),
-                    ("inspect/ins/i <item>", "Examine an item closely")
-                ],
-                "Inventory": [
-                    ("inventory/inv/e", "View your carried items"),
-                    ("take/t/pickup <item>", "Pick up an item"),
-                    ("use/u <item> on <target>", "Use an item on something")
-                ],
-                "System": [
-                    ("help/h/?", "Show this help screen")                
-                    ]
-            }
-            
-            for category, commands in help_sections.items():
-                print(f"\n{Colors.BOLD}{category}:{Colors.RESET}")
-                for cmd, desc in commands:
-                    print(f"  {Colors.GREEN}{cmd}{Colors.RESET}")
-                    print(f"      {desc}")
-            
-            print(f"\n{Colors.YELLOW}Examples:{Colors.RESET}")
-            print(f"  {Colors.CYAN}move forward{Colors.RESET} - Move forward")
-            print(f"  {Colors.CYAN}take spanner{Colors.RESET} - Pick up the rusty spanner")
-            print(f"  {Colors.CYAN}inspect beacon{Colors.RESET} - Inspect the emergency beacon")
-            print(f"  {Colors.CYAN}use antenna on beacon{Colors.RESET} - Use antenna on beacon")
-            
+            self.cached(("help",), lambda: self.io.output(HELP))
         except Exception as e:
-            print(f"Help command failed: {str(e)}")
+            self.io.output(f"Help command failed: {str(e)}")
+            record_error(self.io, "command_help", e)
 
     ## End Saatvik's Code
 
@@ -823,20 +2594,63 @@ class Game:
 
     def command_exits(self, args):
         try:
-            room = self.rooms.get(self.player.current_room)
-            if not room:
-                raise GameError("Current room not found")
-                
-            relative_exits = self.player.get_room_exits()
-            
-            if not relative_exits:
-                print("There are no visible exits from this location.")
+            # exits only depend on where the player is and which way they face
+            self.cached(("exits", self.player.room_id, self.player.facing), self.show_exits)
+        except Exception as e:
+            self.io.output(f"Error showing exits: {str(e)}")
+            record_error(self.io, "command_exits", e)
+
+    def show_exits(self):
+        room = self.rooms.get(self.player.current_room)
+        if not room:
+            raise GameError("Current room not found")
+
+        relative_exits = self.player.get_room_exits()
+
+        if not relative_exits:
+            self.io.output("There are no visible exits from this location.")
+        else:
+            self.io.output("Available exits:")
+            for direction, target in relative_exits.items():
+                self.io.output(f"- {direction.capitalize()} to {target.replace('_', ' ').title()}")
+
+    def command_undo(self, args):
+        try:
+            if self.head is None:
+                self.io.output("There's nothing to undo.")
+                return
+            if self.version != self.recorded:
+                # halfway through a question: take back the command that asked it
+                label, checkpoint = self.label, self.head
             else:
-                print("Available exits:")
-                for direction, target in relative_exits.items():
-                    print(f"- {direction.capitalize()} to {target.replace('_', ' ').title()}")
+                label, checkpoint = self.head.label, self.head.parent
+                if checkpoint is None:
+                    self.io.output("There's nothing to undo.")
+                    return
+                if self.redos is None:
+                    self.redos = []
+                self.redos.append(self.head)
+            self.io.output(f"Took back '{label}'.")
+            self._load(checkpoint)
+            if self.dialog is None:
+                self.command_look(args)
         except Exception as e:
-            print(f"Error showing exits: {str(e)}")
+            self.io.output(f"Undo failed: {str(e)}")
+            record_error(self.io, "command_undo", e)
+
+    def command_redo(self, args):
+        try:
+            if not self.redos:
+                self.io.output("There's nothing to redo.")
+                return
+            checkpoint = self.redos.pop()
+            self.io.output(f"Did '{checkpoint.label}' again.")
+            self._load(checkpoint)
+            if self.dialog is None:
+                self.command_look(args)
+        except Exception as e:
+            self.io.output(f"Redo failed: {str(e)}")
+            record_error(self.io, "command_redo", e)
 
     ## End Dhyan's Code
 
@@ -845,56 +2659,209 @@ class Game:
     def command_inspect(self, args):      
         try:
             if not args:          
-                self.pending_command = "inspect"
                 raise GameError("Inspect what?")
                 
-            item_name = " ".join(args)
+            item_name = args[0]
             room = self.rooms.get(self.player.current_room)
             if not room:
                 raise GameError("Current room not found")
             
-            item = next((i for i in self.player.inventory if i.name.lower() == item_name.lower()), None)
-            if not item:
-                item = next((i for i in room.items if i.name.lower() == item_name.lower()), None)
+            item = self.find_item(item_name, self.player.inventory, self.rooms.items_in(room.name))
             
             if not item:
-                available_items = [item.name.lower() for item in room.items]
-                inventory_items = [item.name.lower() for item in self.player.inventory]
-                all_items = available_items + inventory_items
-                
-                suggestions = difflib.get_close_matches(item_name, all_items, n=1, cutoff=0.5)
-                if suggestions:
-                    raise GameError(f"No item named '{item_name}' found. Did you mean '{suggestions[0]}'?")
+                suggestion = self.suggest_item(item_name, self.rooms.items_in(room.name), self.player.inventory)
+                if suggestion:
+                    raise GameError(f"No item named '{item_name}' found. Did you mean '{suggestion}'?")
                 raise GameError(f"There is no '{item_name}' here or in your inventory")
                 
-            print(item.inspect())
+            self.io.output(ITEM_INSPECT, description=item.inspect())
             
         except GameError as e:
-            print(f"Inspect error: {str(e)}")
+            self.io.output(f"Inspect error: {str(e)}")
+            record_error(self.io, "command_inspect", e)
         except Exception as e:
-            print(f"Unexpected inspect error: {str(e)}")
+            self.io.output(f"Unexpected inspect error: {str(e)}")
+            record_error(self.io, "command_inspect", e)
 
     ## End Saatvik's Code
 
     ## Start Dhyan's Code
 
+# Append-only record of a session: the RNG seed, every command and every prompt answer,
+# in the order they were typed. Entries from a command are only kept (and written to
+# the stream, if there is one) once the command finishes, and when the game ends the
+# final snapshot and ending are added so a replay can be checked against them.
+#
+# On disk it's JSON lines: a header, then {"c": command} / {"a": answer}, then {"end": ...}.
+class Journal:
+    version = 1
+
+    def __init__(self, seed, fingerprint, stream=None):
+        self.seed = seed
+        self.fingerprint = fingerprint
+        self.entries = []
+        self.committed = 0
+        self.final = None
+        self.ending = None
+        self.stream = stream
+        if stream:
+            self._write({"journal": self.version, "seed": seed, "world": fingerprint})
+
+    def _write(self, record):
+        self.stream.write(json.dumps(record) + "\n")
+        self.stream.flush()
+
+    def command(self, text):
+        self.entries.append(("c", text))
+
+    def answer(self, text):
+        self.entries.append(("a", text))
+
+    def commit(self):
+        if self.stream:
+            for kind, text in self.entries[self.committed:]:
+                self._write({kind: text})
+        self.committed = len(self.entries)
+
+    def finish(self, game):
+        self.final = game.snapshot()
+        self.ending = game.ending
+        if self.stream:
+            self._write({"end": {"ending": self.ending, "snapshot": self.final.hex()}})
+
+    # commands, each with the prompt answers typed while it ran
+    def commands(self):
+        commands = []
+        for kind, text in self.entries:
+            if kind == "c":
+                commands.append((text, []))
+            elif commands:
+                commands[-1][1].append(text)
+        return commands
+
+    def save(self, path):
+        with open(path, "w") as stream:
+            journal = Journal(self.seed, self.fingerprint, stream)
+            journal.entries = list(self.entries)
+            journal.commit()
+            if self.final is not None:
+                journal.final, journal.ending = self.final, self.ending
+                journal._write({"end": {"ending": self.ending, "snapshot": self.final.hex()}})
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as stream:
+            header = json.loads(stream.readline())
+            if header.get("journal") != cls.version:
+                raise GameError(f"{path} is not a journal this version of the game can replay")
+            journal = cls(header["seed"], header["world"])
+            for line in stream:
+                record = json.loads(line)
+                if "end" in record:
+                    journal.ending = record["end"]["ending"]
+                    journal.final = bytes.fromhex(record["end"]["snapshot"])
+                elif "c" in record:
+                    journal.command(record["c"])
+                elif "a" in record:
+                    journal.answer(record["a"])
+            journal.committed = len(journal.entries)
+        return journal
+
+# Outcome of replaying a journal
+class ReplayResult:
+    def __init__(self, game, commands, errors):
+        self.game = game
+        self.commands = commands
+        self.errors = errors
+        self.ending = game.ending
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def __repr__(self):
+        return f"ReplayResult(ok={self.ok}, commands={self.commands}, ending={self.ending!r}, errors={self.errors})"
+
+# Re-run a journal headlessly, with no cutscene delays and no output kept, and check
+# that every recorded answer was asked for and that the game ends in the recorded state
+def replay(journal, world=None):
+    world = world or world_template
+    errors = []
+    if journal.fingerprint != world.fingerprint:
+        errors.append("journal was recorded in a different world")
+        return ReplayResult(Game(Player("Replay", world, io=HeadlessIO(keep_transcript=False)), world), 0, errors)
+
+    io = HeadlessIO(keep_transcript=False)
+    game = Game(Player("Replay", world, io=io), world, seed=journal.seed)
+    commands = journal.commands()
+    for number, (command, answers) in enumerate(commands, 1):
+        game.step(command)
+        for answer in answers:
+            if game.dialog is None:
+                errors.append(f"command {number} ({command!r}) left answer {answer!r} unused")
+                break
+            game.step(answer)
+        if errors:
+            break
+
+    if journal.final is not None:
+        if game.ending != journal.ending:
+            errors.append(f"ending {game.ending!r} does not match recorded {journal.ending!r}")
+        if game.snapshot() != journal.final:
+            errors.append("final state does not match the recording")
+    return ReplayResult(game, len(commands), errors)
+
 
 if __name__ == "__main__":
     try:
+        options = dict(arg.partition("=")[::2] for arg in sys.argv[1:])
+        # --replay=<journal> re-runs a recorded session and checks it ends the same way
+        if "--replay" in options:
+            result = replay(Journal.load(options["--replay"]))
+            print(result)
+            sys.exit(0 if result.ok else 1)
+        # --headless runs the commands piped in on stdin without pacing and prints the transcript
+        headless = "--headless" in options
+        # --time-scale=<factor> speeds up or slows down cutscenes, 0 plays them instantly
+        time_scale = float(options.get("--time-scale", 1.0))
+        # --record=<journal> keeps a journal of the session for replay
+        record = open(options["--record"], "w") if options.get("--record") else False
+        # --metrics=<file> keeps Prometheus-format metrics for the session in a text file
+        metrics = exporter = None
+        if options.get("--metrics"):
+            metrics = Metrics()
+            exporter = PrometheusFileExporter(metrics, options["--metrics"]).start()
+        # --events=<file> logs what the player does for analysis, see events.py
+        event_log = events = None
+        if options.get("--events"):
+            event_log = EventLog(options["--events"], metrics=metrics).start()
+            events = event_log.session(secrets.token_hex(8))
+        # --no-color leaves out colour codes (they're also off when stdout isn't a terminal)
+        color = False if "--no-color" in options else None
+        if headless:
+            io = HeadlessIO(color=terminal_color() if color is None else color)
+        else:
+            io = ConsoleIO(clock=Clock(time_scale), color=color)
             
-        player = Player("Player1", rooms)
-        intro = Cutscene([
-        f"{Colors.BLUE}Sol 37. The storm hit harder than anything predicted.{Colors.RESET} ",
-        f"{Colors.BLUE}The habitat collapsed. You're the only one who made it to the rover in time.{Colors.RESET} ",
-        f"{Colors.RED}Power is out. Oxygen is dropping. You have to get inside...{Colors.RESET}"
-        ], speed=0.04, lineDelay=2)
-        intro.play()
-
-        game = Game(player, rooms)
-        game.start()
+        player = Player("Player1", rooms, io=io)
+        player.rooms.cutscenes["intro"].play(io)
+
+        game = Game(player, rooms, io=io, record=record, metrics=metrics, events=events)
+        try:
+            if headless:
+                io.output(game.rooms[player.current_room].description)
+                game.run_script(sys.stdin.read().splitlines())
+                sys.stdout.write(io.text())
+            else:
+                game.start()
+        finally:
+            if event_log:
+                event_log.stop()
+            if exporter:
+                exporter.stop()
         
     except Exception as e:
         print(f"{Colors.RED}Fatal error: {str(e)}{Colors.RESET}")
         print(f"{Colors.RED}Game cannot start.{Colors.RESET}")
 
-        ## End Dhyan's Code
\ No newline at end of file
+        ## End Dhyan's Code
@@ -0,0 +1,213 @@
+## Metrics
+#
+# Counters and latency histograms for the engine, and exporters that publish them.
+# A Game only records anything when it's given a Metrics object, otherwise every
+# hook is a single "is None" check. Metrics can be shared by any number of games
+# (the server uses one for all its sessions).
+#
+# Exporters take a Metrics and publish its text form in the Prometheus exposition
+# format. PrometheusFileExporter rewrites a file every few seconds (for node
+# exporter's textfile collector or just to look at), HTTPExporter serves
+# /metrics on a local port. Anything with start() and stop() can be used instead.
+
+import os
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Bucket upper bounds in seconds, from 10 microseconds (a cached lookup) to a minute
+# (a slow cutscene or a player thinking about an answer)
+BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+DESCRIPTIONS = {
+    "iris_commands_total": "Commands handled, by how they were resolved",
+    "iris_command_seconds": "Time to handle one command, including prompts and cutscenes",
+    "iris_handler_seconds": "Time spent in each command handler",
+    "iris_item_lookups_total": "Item names resolved by commands, by whether anything matched",
+    "iris_render_cache_total": "Look, exits, inventory and help views, by whether they came from the render cache",
+    "iris_suggestions_total": "Fuzzy 'did you mean' lookups, by whether one was found",
+    "iris_errors_total": "Errors reported to the player, by where they happened and their type",
+    "iris_cutscene_seconds": "Time to play each cutscene, including its pauses",
+    "iris_prompt_wait_seconds": "Time waiting for the player to answer a prompt",
+    "iris_input_wait_seconds": "Time waiting for the player's next command",
+    "iris_sessions_resident": "Sessions with their game in memory",
+    "iris_sessions_hibernated": "Idle sessions saved to disk to free memory",
+    "iris_session_lookups_total": "Sessions looked up for a command, by whether they had to be woken from disk",
+    "iris_session_evictions_total": "Sessions saved to disk, by the policy that chose them",
+    "iris_session_wake_seconds": "Time to load a hibernated session back into memory",
+    "iris_events_total": "Player events for the event log, by whether they were queued or dropped",
+}
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        # one count per bucket plus one for anything over the last bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    # upper bound of the bucket the q-th quantile falls in, None if nothing was observed
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    # gauges hold the latest value, like how many sessions are in memory right now
+    def set(self, name, value, **labels):
+        self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(self.buckets)
+        histogram.observe(seconds)
+
+    def counter(self, name, **labels):
+        return self.counters.get(self._key(name, labels), 0)
+
+    def gauge(self, name, **labels):
+        return self.gauges.get(self._key(name, labels))
+
+    def histogram(self, name, **labels):
+        return self.histograms.get(self._key(name, labels))
+
+    # Prometheus text exposition format. Safe to call from an exporter thread while
+    # games keep recording: it works on copies and a sample may just be a moment old.
+    def render(self):
+        families = {}
+        for (name, labels), value in list(self.counters.items()):
+            families.setdefault(name, ("counter", []))[1].append(f"{name}{_labels(labels)} {value}")
+        for (name, labels), value in list(self.gauges.items()):
+            families.setdefault(name, ("gauge", []))[1].append(f"{name}{_labels(labels)} {value}")
+        for (name, labels), histogram in list(self.histograms.items()):
+            lines = families.setdefault(name, ("histogram", []))[1]
+            counts = list(histogram.counts)
+            total = 0
+            for bound, count in zip(histogram.buckets, counts):
+                total += count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', repr(bound)),))} {total}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {total + counts[-1]}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        out = []
+        for name in sorted(families):
+            kind, lines = families[name]
+            if name in DESCRIPTIONS:
+                out.append(f"# HELP {name} {DESCRIPTIONS[name]}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(lines)
+        return "\n".join(out) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Rewrites a Prometheus text file every interval seconds, and once more on stop()
+class PrometheusFileExporter:
+    def __init__(self, metrics, path, interval=15.0):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def write(self):
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as f:
+            f.write(self.metrics.render())
+        os.replace(temporary, self.path)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="metrics-file", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+        self.write()
+
+
+# Serves the metrics at http://host:port/metrics from a background thread
+class HTTPExporter:
+    def __init__(self, metrics, host="127.0.0.1", port=9100):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        # port 0 picks a free port, report the one we actually got
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
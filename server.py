@@ -0,0 +1,316 @@
+## Multi-session game server
+#
+# Runs one Game per TCP/telnet connection, all inside a single asyncio event loop.
+# The engine itself stays synchronous: each command runs to completion on a
+# SessionIO port that never blocks. Cutscene pauses are recorded as delays and
+# played back with asyncio.sleep. A question ends the command with the game
+# waiting in a Dialog state, and the player's reply is simply the next input.
+#
+# --metrics-port serves Prometheus metrics for all sessions over HTTP, --metrics-file
+# writes them to a text file instead. --no-color sends plain text for clients that
+# can't show ANSI colours.
+#
+# --hibernate DIR keeps idle sessions on disk once the games in memory go over
+# --memory-budget megabytes (see sessions.py). --eviction idle also hibernates any
+# session idle for --max-idle seconds.
+#
+# --events FILE logs every player's commands, answers, flag changes and ending
+# (see events.py) from a background thread, rotating the file every --events-mb
+# megabytes. --events-overflow wait lets a command wait briefly for the writer
+# instead of dropping events when it falls behind.
+#
+#   python server.py [--host 127.0.0.1] [--port 4000] [--time-scale 1.0]
+#                    [--metrics-port PORT] [--metrics-file FILE] [--no-color]
+#                    [--hibernate DIR] [--memory-budget MB] [--min-idle SECONDS]
+#                    [--eviction lru|idle] [--max-idle SECONDS]
+#                    [--events FILE] [--events-mb MB] [--events-overflow drop|wait]
+
+import sys
+import time
+import asyncio
+import secrets
+
+from main import Clock, Game, GameIO, Player, rooms
+from events import EventLog
+from metrics import HTTPExporter, Metrics, PrometheusFileExporter
+from sessions import SessionManager, SessionStore
+
+# Telnet "go ahead": sent after every prompt so clients know it's their turn
+IAC_GA = b"\xff\xf9"
+# Telnet "no operation", which clients ignore: sent just before the go ahead when the
+# game is waiting on an answer to a question rather than a command, so scripted
+# clients can tell the two apart without reading the prompt
+IAC_NOP = b"\xff\xf1"
+
+
+# Clock that doesn't sleep, it queues the pause on the port so the session
+# coroutine can wait it out with asyncio.sleep
+class PacedClock(Clock):
+    def __init__(self, io, time_scale=1.0):
+        super().__init__(time_scale)
+        self.io = io
+
+    def sleep(self, seconds):
+        if self.time_scale > 0 and seconds > 0:
+            self.io.emit(seconds * self.time_scale)
+
+
+# Non-blocking I/O port for one connection. Output is queued as text and delays
+# for the session coroutine to send; input is read by the session, never the game.
+class SessionIO(GameIO):
+    def __init__(self, time_scale=1.0, color=True):
+        super().__init__(color=color)
+        self.clock = PacedClock(self, time_scale)
+        self.queue = []
+
+    def emit(self, item):
+        self.queue.append(item)
+
+    def write(self, text):
+        self.emit(text)
+
+    def take(self):
+        queue, self.queue = self.queue, []
+        return queue
+
+
+# One connected player. With a SessionManager the game is looked up for every
+# command and no reference is kept while waiting for input, so it can hibernate.
+class Session:
+    def __init__(self, reader, writer, time_scale=1.0, metrics=None, color=True, manager=None, events=None):
+        self.id = secrets.token_hex(8)
+        self.reader = reader
+        self.writer = writer
+        self.metrics = metrics
+        self.manager = manager
+        self.io = SessionIO(time_scale, color)
+        game = Game(Player("Player1", rooms, io=self.io), rooms, io=self.io, metrics=metrics,
+                    events=events.session(self.id) if events is not None else None)
+        self._game = None
+        if manager is None:
+            self._game = game
+        else:
+            manager.add(self.id, game)
+
+    @property
+    def game(self):
+        return self._game if self.manager is None else self.manager.get(self.id)
+
+    async def run(self):
+        await self.open()
+        await self.flush()
+
+        running, waiting = True, False
+        while running:
+            # when the game is waiting on a question it has already shown it
+            if waiting:
+                line = await self.readline("iris_prompt_wait_seconds", question=True)
+            else:
+                line = await self.ask("\n> ")
+            if line is None:
+                return
+            running, waiting = await self.execute(line)
+            await self.flush()
+        await self.flush()
+
+    async def open(self):
+        game = self.game
+        game.rooms.cutscenes["intro"].play(self.io)
+        self.io.output(game.rooms[game.player.current_room].description)
+
+    # run one line, returns whether the game is still going and waiting on an answer
+    async def execute(self, line):
+        game = self.game
+        game.step(line)
+        return game.running, game.dialog is not None
+
+    async def close(self):
+        if self.manager is not None:
+            self.manager.remove(self.id)
+
+    async def flush(self):
+        await self.send(self.io.take())
+
+    # write output items, waiting out any cutscene pauses without blocking the loop
+    async def send(self, items):
+        for item in items:
+            if isinstance(item, str):
+                self.writer.write(item.encode())
+            else:
+                await self.writer.drain()
+                await asyncio.sleep(item)
+        await self.writer.drain()
+
+    async def ask(self, prompt):
+        await self.flush()
+        await self.send([prompt])
+        return await self.readline("iris_input_wait_seconds")
+
+    # the player's next line, timed into the given histogram when metrics are on
+    async def readline(self, metric=None, question=False):
+        self.writer.write(IAC_NOP + IAC_GA if question else IAC_GA)
+        await self.writer.drain()
+        started = time.perf_counter()
+        data = await self.reader.readline()
+        if self.metrics is not None and metric:
+            self.metrics.observe(metric, time.perf_counter() - started)
+        if not data:
+            return None
+        return strip_telnet(data).decode(errors="replace").strip()
+
+
+# drop telnet negotiation (IAC <command> [<option>]) from a line of input
+def strip_telnet(data):
+    if b"\xff" not in data:
+        return data
+    out = bytearray()
+    i = 0
+    while i < len(data):
+        if data[i] == 0xff and i + 1 < len(data):
+            i += 3 if data[i + 1] in (251, 252, 253, 254) else 2
+            continue
+        out.append(data[i])
+        i += 1
+    return bytes(out)
+
+
+class GameServer:
+    def __init__(self, host="127.0.0.1", port=4000, time_scale=1.0, backlog=1024, metrics=None, color=True,
+                 manager=None, sweep_interval=5.0, events=None):
+        self.host = host
+        self.port = port
+        self.time_scale = time_scale
+        self.backlog = backlog
+        self.metrics = metrics
+        self.color = color
+        # optional sessions.SessionManager to hibernate idle sessions
+        self.manager = manager
+        # optional events.EventLog every session's game reports to
+        self.events = events
+        self.sweep_interval = sweep_interval
+        self.sessions = set()
+        self.server = None
+        self.sweeper = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port, backlog=self.backlog)
+        # port 0 picks a free port, report the one we actually got
+        self.port = self.server.sockets[0].getsockname()[1]
+        if self.manager is not None:
+            self.sweeper = asyncio.create_task(self.sweep())
+        return self
+
+    async def sweep(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self.manager.sweep()
+
+    async def serve_forever(self):
+        if not self.server:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.sweeper:
+            self.sweeper.cancel()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    def new_session(self, reader, writer):
+        return Session(reader, writer, self.time_scale, self.metrics, self.color, self.manager, self.events)
+
+    async def handle_connection(self, reader, writer):
+        session = self.new_session(reader, writer)
+        self.sessions.add(session)
+        try:
+            await session.run()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.sessions.discard(session)
+            await session.close()
+            writer.close()
+
+
+# Minimal client for tests and scripts. Talks to a running server over TCP and
+# reads until the server hands the turn back with telnet "go ahead". asking says
+# whether the game is waiting on an answer to a question.
+class LocalClient:
+    def __init__(self, host="127.0.0.1", port=4000):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+        self.asking = False
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        return await self.receive()
+
+    # everything the server sent up to its next prompt, "" once the game is over
+    async def receive(self):
+        try:
+            data = await self.reader.readuntil(IAC_GA)
+            data = data[:-len(IAC_GA)]
+        except asyncio.IncompleteReadError as e:
+            data = e.partial
+        self.asking = data.endswith(IAC_NOP)
+        if self.asking:
+            data = data[:-len(IAC_NOP)]
+        return data.decode(errors="replace")
+
+    async def send(self, line):
+        self.writer.write(f"{line}\r\n".encode())
+        await self.writer.drain()
+        return await self.receive()
+
+    async def play(self, lines):
+        return [await self.send(line) for line in lines]
+
+    async def close(self):
+        if self.writer:
+            self.writer.close()
+            await self.writer.wait_closed()
+
+
+if __name__ == "__main__":
+    options = {"--host": "127.0.0.1", "--port": "4000", "--time-scale": "1.0", "--metrics-port": None, "--metrics-file": None,
+               "--hibernate": None, "--memory-budget": "64", "--min-idle": "30", "--eviction": "lru", "--max-idle": "600",
+               "--events": None, "--events-mb": "16", "--events-overflow": "drop"}
+    args = sys.argv[1:]
+    for i, arg in enumerate(args[:-1]):
+        if arg in options:
+            options[arg] = args[i + 1]
+
+    metrics = exporter = None
+    if options["--metrics-port"]:
+        metrics = Metrics()
+        exporter = HTTPExporter(metrics, options["--host"], int(options["--metrics-port"])).start()
+    elif options["--metrics-file"]:
+        metrics = Metrics()
+        exporter = PrometheusFileExporter(metrics, options["--metrics-file"]).start()
+
+    manager = None
+    if options["--hibernate"]:
+        manager = SessionManager(SessionStore(options["--hibernate"]), int(float(options["--memory-budget"]) * 2 ** 20),
+                                 min_idle=float(options["--min-idle"]), policy=options["--eviction"],
+                                 max_idle=float(options["--max-idle"]), metrics=metrics)
+
+    events = None
+    if options["--events"]:
+        events = EventLog(options["--events"], int(float(options["--events-mb"]) * 2 ** 20),
+                          overflow=options["--events-overflow"], metrics=metrics).start()
+
+    server = GameServer(options["--host"], int(options["--port"]), float(options["--time-scale"]),
+                        metrics=metrics, color="--no-color" not in args, manager=manager, events=events)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if events:
+            events.stop()
+        if exporter:
+            exporter.stop()
@@ -0,0 +1,219 @@
+## Session hibernation
+#
+# Keeps hosted games in memory only while they're being played. A SessionManager
+# knows every session by ID and when it last ran a command. Once more sessions are
+# resident than the memory budget allows, the least recently used ones that have
+# been idle for at least min_idle seconds are packed (snapshot, seed and RNG state)
+# into a SessionStore on disk and their Game is dropped. The next get() for one of
+# them reads it back and rebuilds the Game on the same I/O port, which takes well
+# under a millisecond, so the player never notices.
+#
+# Eviction policies:
+#   lru    only while over budget, least recently used idle sessions first (default)
+#   idle   as lru, and also any session idle for longer than max_idle on sweep()
+#
+# stats() reports hits (found in memory), misses (woken from disk), evictions and
+# wake times. Given a Metrics object the manager publishes the same numbers as
+# iris_session_* metrics.
+#
+# Journals aren't hibernated, so sessions that record one should stay resident.
+# Nor is undo history: a woken game can't undo what was played before it slept.
+
+import os
+import time
+import marshal
+from collections import OrderedDict
+
+from main import Game, GameError
+
+# Rough size of one resident session in bytes, see "python bench.py --only memory".
+# The budget is turned into a number of resident sessions with it.
+SESSION_BYTES = 4096
+
+POLICIES = ("lru", "idle")
+
+# bump when pack()'s layout changes
+PACK_FORMAT = 1
+
+
+# Everything needed to rebuild a game, as bytes
+def pack(game):
+    rng = game._rng.getstate() if game._rng is not None else None
+    return marshal.dumps((PACK_FORMAT, game.player.name, game.seed, rng, game.snapshot()))
+
+
+def unpack(data, io=None, world=None, metrics=None, events=None):
+    version, name, seed, rng, snapshot = marshal.loads(data)
+    if version != PACK_FORMAT:
+        raise GameError("Hibernated session was saved by a different version of the game")
+    game = Game.from_snapshot(snapshot, world, io=io, name=name, seed=seed, metrics=metrics, events=events)
+    if rng is not None:
+        game.rng.setstate(rng)
+    return game
+
+
+# One file per hibernated session in a directory
+class SessionStore:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, session_id):
+        return os.path.join(self.path, f"{session_id}.session")
+
+    def save(self, session_id, data):
+        path = self._file(session_id)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(data)
+        os.replace(temporary, path)
+
+    # read a session back, removing it from the store
+    def load(self, session_id):
+        path = self._file(session_id)
+        with open(path, "rb") as f:
+            data = f.read()
+        os.remove(path)
+        return data
+
+    def discard(self, session_id):
+        try:
+            os.remove(self._file(session_id))
+        except FileNotFoundError:
+            pass
+
+
+class SessionManager:
+    def __init__(self, store, memory_budget=64 * 2 ** 20, session_bytes=SESSION_BYTES, min_idle=30.0,
+                 policy="lru", max_idle=600.0, world=None, metrics=None, clock=time.monotonic):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown eviction policy {policy!r}, expected one of {', '.join(POLICIES)}")
+        self.store = store
+        self.max_resident = max(1, memory_budget // session_bytes)
+        self.min_idle = min_idle
+        self.policy = policy
+        self.max_idle = max_idle
+        self.world = world
+        self.metrics = metrics
+        self.clock = clock
+        # session id -> game, least recently used first
+        self.resident = OrderedDict()
+        self.last_used = {}
+        # I/O ports and event streams outlive hibernation, a woken game gets them back
+        self.ports = {}
+        self.events = {}
+        self.hibernated = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = dict.fromkeys(POLICIES, 0)
+        self.wake_seconds = 0.0
+        self.slowest_wake = 0.0
+
+    def __contains__(self, session_id):
+        return session_id in self.resident or session_id in self.hibernated
+
+    def __len__(self):
+        return len(self.resident) + len(self.hibernated)
+
+    def add(self, session_id, game):
+        self.resident[session_id] = game
+        self.last_used[session_id] = self.clock()
+        self.ports[session_id] = game.io
+        if game.events is not None:
+            self.events[session_id] = game.events
+        self.enforce()
+        self._publish()
+
+    # The session's game, woken from the store if it was hibernated. Counts as use,
+    # so don't hold on to the game while the player is idle or it can't be freed.
+    def get(self, session_id):
+        game = self.resident.get(session_id)
+        if game is not None:
+            self.hits += 1
+            self.resident.move_to_end(session_id)
+            if self.metrics is not None:
+                self.metrics.inc("iris_session_lookups_total", result="hit")
+        else:
+            if session_id not in self.hibernated:
+                raise KeyError(session_id)
+            game = self._wake(session_id)
+        self.last_used[session_id] = self.clock()
+        self.enforce()
+        return game
+
+    def remove(self, session_id):
+        if self.resident.pop(session_id, None) is None and session_id in self.hibernated:
+            self.hibernated.discard(session_id)
+            self.store.discard(session_id)
+        self.last_used.pop(session_id, None)
+        self.ports.pop(session_id, None)
+        self.events.pop(session_id, None)
+        self._publish()
+
+    def _wake(self, session_id):
+        started = time.perf_counter()
+        game = unpack(self.store.load(session_id), self.ports[session_id], self.world, self.metrics,
+                      self.events.get(session_id))
+        self.hibernated.discard(session_id)
+        self.resident[session_id] = game
+        elapsed = time.perf_counter() - started
+        self.misses += 1
+        self.wake_seconds += elapsed
+        self.slowest_wake = max(self.slowest_wake, elapsed)
+        if self.metrics is not None:
+            self.metrics.inc("iris_session_lookups_total", result="miss")
+            self.metrics.observe("iris_session_wake_seconds", elapsed)
+        self._publish()
+        return game
+
+    def hibernate(self, session_id, policy="lru"):
+        # packed and saved before it's dropped, so a session that can't be stays resident
+        self.store.save(session_id, pack(self.resident[session_id]))
+        del self.resident[session_id]
+        self.hibernated.add(session_id)
+        self.evictions[policy] += 1
+        if self.metrics is not None:
+            self.metrics.inc("iris_session_evictions_total", policy=policy)
+        self._publish()
+
+    # Hibernate least recently used sessions while over budget. Sessions used in the
+    # last min_idle seconds stay, even if that means going over for a while.
+    def enforce(self):
+        if len(self.resident) <= self.max_resident:
+            return
+        now = self.clock()
+        for session_id in list(self.resident):
+            if len(self.resident) <= self.max_resident or now - self.last_used[session_id] < self.min_idle:
+                break
+            self.hibernate(session_id, "lru")
+
+    # Periodic check: the budget, and under the idle policy every long-idle session
+    def sweep(self):
+        self.enforce()
+        if self.policy != "idle":
+            return
+        now = self.clock()
+        for session_id in list(self.resident):
+            if now - self.last_used[session_id] < self.max_idle:
+                break
+            self.hibernate(session_id, "idle")
+
+    def _publish(self):
+        if self.metrics is not None:
+            self.metrics.set("iris_sessions_resident", len(self.resident))
+            self.metrics.set("iris_sessions_hibernated", len(self.hibernated))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "resident": len(self.resident),
+            "hibernated": len(self.hibernated),
+            "max_resident": self.max_resident,
+            "policy": self.policy,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "evictions": dict(self.evictions),
+            "mean_wake_ms": self.wake_seconds / self.misses * 1000 if self.misses else None,
+            "slowest_wake_ms": self.slowest_wake * 1000,
+        }
@@ -0,0 +1,215 @@
+## Monte Carlo ending simulator
+#
+# Works out how likely each ending is for every endgame strategy: the answers to
+# the three IRIS calibration prompts, whether the player carries the Rusty Spanner,
+# whether the antenna was taken from the Old Rover, and the final choice.
+#
+# Each strategy is first played through the real engine, headless, with the IRIS
+# roll forced low and then high. That tells us whether the ending depends on the
+# roll and which ending each side gives. The roll itself is then sampled in large
+# batches (with NumPy when it's installed) on seeded per-worker streams, and the
+# results come with 95% confidence intervals. --engine plays every sample through
+# the engine instead, which is much slower but checks the shortcut.
+#
+#   python simulate.py [--playouts N] [--workers W] [--seed S] [--engine] [--json]
+
+import os
+import sys
+import json
+import math
+import random
+from itertools import product
+from multiprocessing import Pool
+
+from main import IRIS_ALIEN_CHANCE, IRIS_CALIBRATION, FixedRoll, Game, HeadlessIO, Player, world_template
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+IRIS_DESTROYED = "IRIS DESTROYED"
+BATCH = 1_000_000
+
+CORRECT = tuple(IRIS_CALIBRATION.values())
+
+# Ways to answer the calibration prompts. Calibration stops at the first wrong
+# answer, so these cover every distinct outcome.
+CALIBRATIONS = {"all correct": CORRECT}
+for miss in range(len(CORRECT)):
+    wrong = "1" if CORRECT[miss] == "2" else "2"
+    CALIBRATIONS[f"wrong answer {miss + 1}"] = CORRECT[:miss] + (wrong,)
+
+
+class Strategy:
+    def __init__(self, calibration, has_spanner, took_antenna, choice):
+        self.calibration = calibration
+        self.has_spanner = has_spanner
+        self.took_antenna = took_antenna
+        self.choice = choice
+
+    @property
+    def name(self):
+        return (f"calibration: {self.calibration}, spanner: {'yes' if self.has_spanner else 'no'}, "
+                f"antenna: {'taken' if self.took_antenna else 'left'}, choice: {self.choice}")
+
+    @property
+    def answers(self):
+        return CALIBRATIONS[self.calibration] + ("1" if self.choice == "trust IRIS" else "2",)
+
+
+def strategies():
+    for calibration, has_spanner, took_antenna in product(CALIBRATIONS, (False, True), (False, True)):
+        choices = ("trust IRIS", "smash IRIS") if has_spanner else ("trust IRIS",)
+        for choice in choices:
+            yield Strategy(calibration, has_spanner, took_antenna, choice)
+
+
+# A game standing next to IRIS with the power cell, set up for the strategy
+def endgame(strategy, rng):
+    io = HeadlessIO(keep_transcript=False)
+    game = Game(Player("Simulator", world_template, io=io), world_template)
+    items = world_template.items
+    carried = ["iris", "unstable_power_cell"]
+    if strategy.has_spanner:
+        carried.append("rusty_spanner")
+    if strategy.took_antenna:
+        carried.append("antenna")
+        game.player.flags["old_rover_alive"] = False
+    for key in carried:
+        game.player.inventory.append(items[key])
+    game.rng = rng
+    return game
+
+
+def outcome(game):
+    if game.ending:
+        return game.ending
+    if game.player.flags["iris_broken"]:
+        return IRIS_DESTROYED
+    return "NO ENDING"
+
+
+def play(strategy, rng):
+    game = endgame(strategy, rng)
+    game.step("use unstable power cell on iris")
+    for answer in strategy.answers:
+        game.step(answer)
+    return outcome(game)
+
+
+# What the engine does with a strategy: the ending on a low and a high roll,
+# and the chance of rolling low if the roll is used at all
+def probe(strategy):
+    low = FixedRoll(0.0)
+    low_outcome = play(strategy, low)
+    if not low.used:
+        return {"low": low_outcome, "high": low_outcome, "chance": None}
+    high_outcome = play(strategy, FixedRoll(1.0 - 1e-9))
+    calibrated = CALIBRATIONS[strategy.calibration] == CORRECT
+    return {"low": low_outcome, "high": high_outcome, "chance": IRIS_ALIEN_CHANCE[calibrated]}
+
+
+# --- sampling ----------------------------------------------------------------
+
+# count of n uniform draws that land under chance, in batches
+def count_low(chance, n, seed):
+    low = 0
+    if numpy is not None:
+        stream = numpy.random.default_rng(numpy.random.SeedSequence(seed))
+        while n > 0:
+            size = min(n, BATCH)
+            low += int(numpy.count_nonzero(stream.random(size) < chance))
+            n -= size
+        return low
+    stream = random.Random(repr(seed))
+    draw = stream.random
+    while n > 0:
+        size = min(n, BATCH)
+        low += sum(draw() < chance for _ in range(size))
+        n -= size
+    return low
+
+
+def _sample(task):
+    index, chance, n, seed = task
+    return index, n, count_low(chance, n, seed)
+
+
+def _play_engine(task):
+    index, n, seed = task
+    strategy = list(strategies())[index]
+    stream = random.Random(repr(seed))
+    counts = {}
+    for _ in range(n):
+        result = play(strategy, stream)
+        counts[result] = counts.get(result, 0) + 1
+    return index, counts
+
+
+# 95% Wilson score interval for a proportion
+def wilson(successes, n, z=1.96):
+    if n == 0:
+        return 0.0, 0.0
+    p = successes / n
+    centre = p + z * z / (2 * n)
+    spread = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n))
+    scale = 1 + z * z / n
+    return max(0.0, (centre - spread) / scale), min(1.0, (centre + spread) / scale)
+
+
+def simulate(playouts=1_000_000, workers=None, seed=0, engine=False):
+    plans = list(strategies())
+    probes = [probe(strategy) for strategy in plans]
+    counts = [{} for _ in plans]
+
+    # one independent stream per (strategy, worker chunk), all derived from seed
+    chunks = workers or os.cpu_count() or 1
+    per_chunk = [playouts // chunks + (1 if i < playouts % chunks else 0) for i in range(chunks)]
+    if engine:
+        tasks = [(i, n, (seed, i, c)) for i in range(len(plans)) for c, n in enumerate(per_chunk) if n]
+        with Pool(workers) as pool:
+            for index, found in pool.imap_unordered(_play_engine, tasks):
+                for result, count in found.items():
+                    counts[index][result] = counts[index].get(result, 0) + count
+    else:
+        tasks = []
+        for i, found in enumerate(probes):
+            if found["chance"] is None:
+                counts[i][found["low"]] = playouts
+                continue
+            tasks += [(i, found["chance"], n, (seed, i, c)) for c, n in enumerate(per_chunk) if n]
+        with Pool(workers) as pool:
+            for index, n, low in pool.imap_unordered(_sample, tasks):
+                found = probes[index]
+                for result, count in ((found["low"], low), (found["high"], n - low)):
+                    if count:
+                        counts[index][result] = counts[index].get(result, 0) + count
+
+    report = []
+    for strategy, found in zip(plans, counts):
+        total = sum(found.values())
+        endings = {}
+        for result, count in sorted(found.items()):
+            low, high = wilson(count, total)
+            endings[result] = {"count": count, "p": count / total, "ci95": [low, high]}
+        report.append({"strategy": strategy.name, "playouts": total, "endings": endings})
+    return report
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+
+    def option(name, default):
+        return type(default)(args[args.index(name) + 1]) if name in args else default
+
+    report = simulate(option("--playouts", 1_000_000), option("--workers", 0) or None,
+                      option("--seed", 0), "--engine" in args)
+    if "--json" in args:
+        print(json.dumps(report, indent=2))
+    else:
+        for row in report:
+            print(f"\n{row['strategy']}  ({row['playouts']} playouts)")
+            for result, stats in row["endings"].items():
+                low, high = stats["ci95"]
+                print(f"  {result:<18} {stats['p']:7.2%}   95% CI {low:7.2%} - {high:7.2%}")
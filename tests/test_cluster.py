@@ -0,0 +1,87 @@
+import os
+import sys
+import signal
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cluster import Router
+from server import LocalClient
+
+
+async def start_router(workers=2):
+    router = await Router(port=0, workers=workers, time_scale=0, color=False).start()
+    return router, router.server.sockets[0].getsockname()[1]
+
+
+def test_killed_worker_fails_its_sessions_fast():
+    async def scenario():
+        router, port = await start_router()
+        try:
+            client = LocalClient(port=port)
+            await client.connect()
+            await client.send("move forward")
+            link = router.link_for(next(iter(router.placement)))
+            os.kill(link.process.pid, signal.SIGKILL)
+
+            reply = await asyncio.wait_for(client.send("look"), 5)
+            assert "your game was lost" in reply
+            assert client.reader.at_eof()
+            await client.close()
+            assert not link.alive
+
+            # new players still get a game, on the worker that's left
+            other = LocalClient(port=port)
+            assert "rover pad" in await asyncio.wait_for(other.connect(), 5)
+            assert "launch bay" in await asyncio.wait_for(other.send("move forward"), 5)
+            await other.close()
+        finally:
+            await router.close()
+
+    asyncio.run(scenario())
+
+
+def test_migrated_session_carries_on_where_it_was():
+    async def scenario():
+        router, port = await start_router()
+        try:
+            client = LocalClient(port=port)
+            await client.connect()
+            for line in ("move forward", "move left", "take unstable power cell"):
+                await client.send(line)
+            session_id = next(iter(router.placement))
+            source = router.placement[session_id]
+
+            assert await router.migrate(session_id, 1 - source)
+            assert not await router.migrate(session_id, 1 - source)
+            assert router.placement[session_id] == 1 - source
+            assert router.migrations == 1
+            counts = await router.counts()
+            assert counts[source] == 0 and counts[1 - source] == 1
+
+            assert "Unstable Power Cell" in await asyncio.wait_for(client.send("inventory"), 5)
+            assert "exit the rover" in await asyncio.wait_for(client.send("move forward"), 5)
+            await client.close()
+        finally:
+            await router.close()
+
+    asyncio.run(scenario())
+
+
+def test_restarted_worker_keeps_its_sessions():
+    async def scenario():
+        router, port = await start_router(workers=1)
+        try:
+            client = LocalClient(port=port)
+            await client.connect()
+            await client.send("move forward")
+            old = router.links[0]
+
+            await router.restart(0)
+            assert router.links[0] is not old and not old.alive
+            assert "engine room" in await asyncio.wait_for(client.send("move left"), 5)
+            await client.close()
+        finally:
+            await router.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,64 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from events import EventLog, log_files, read_events, summarize
+from explore import shortest_lines
+from main import Game, HeadlessIO, Player, world_template
+
+
+def test_rotation_keeps_the_newest_events(tmp_path):
+    path = str(tmp_path / "events.log")
+    log = EventLog(path, max_bytes=1000, backups=2, batch_size=10, flush_interval=60).start()
+    for number in range(100):
+        assert log.session("s1").emit("command", room="center", text=f"look {number}")
+    log.stop()
+
+    assert log.stats()["written"] == 100
+    assert log.rotations > 2
+    assert log_files(path) == [f"{path}.2", f"{path}.1", path]
+    assert all(os.path.getsize(name) <= 1000 for name in log_files(path))
+    # the oldest fell off the end, what's left is in order
+    numbers = [int(event["text"].split()[1]) for event in read_events([path])]
+    assert numbers == list(range(100 - len(numbers), 100))
+    assert 10 <= len(numbers) < 100
+
+
+def test_full_queue_drops_by_default(tmp_path):
+    log = EventLog(str(tmp_path / "events.log"), queue_size=3)
+    results = [log.put({"t": 0, "s": 1, "e": "command"}) for _ in range(5)]
+    assert results == [True, True, True, False, False]
+    assert (log.stats()["dropped"], log.stats()["backlog"]) == (2, 3)
+
+
+def test_full_queue_waits_for_the_writer(tmp_path):
+    path = str(tmp_path / "events.log")
+    log = EventLog(path, queue_size=1, flush_interval=0.001, overflow="wait", max_wait=5).start()
+    events = log.session("s1")
+    assert all(events.emit("command", room="center", text="look") for _ in range(50))
+    log.stop()
+    assert log.stats()["dropped"] == 0
+    assert len(list(read_events([path]))) == 50
+
+    # nobody's writing, so waiting doesn't help for long
+    stalled = EventLog(path, queue_size=1, flush_interval=60, overflow="wait", max_wait=0.01).start()
+    assert stalled.put({"t": 0, "s": 1, "e": "command"})
+    assert not stalled.put({"t": 0, "s": 1, "e": "command"})
+    stalled.stop()
+    assert stalled.dropped == 1
+
+
+def test_a_played_game_summarized(tmp_path):
+    path = str(tmp_path / "events.log")
+    log = EventLog(path).start()
+    io = HeadlessIO(color=False)
+    game = Game(Player("Tester", world_template, io=io), world_template, io=io, seed=1, events=log.session("s1"))
+    for line in shortest_lines("RESCUED"):
+        game.step(line)
+    log.stop()
+
+    summary = summarize(read_events([path]))
+    assert summary["sessions"] == 1
+    assert summary["endings"] == {"RESCUED": 1}
+    assert summary["keypad"]["unlocked"] == 1
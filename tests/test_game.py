@@ -0,0 +1,229 @@
+import os
+import sys
+from io import BytesIO
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from explore import shortest_lines
+from main import (UNDO_LIMIT, AirlockDialog, Game, GameError, HeadlessIO, Player, read_snapshots, replay,
+                  world_template, write_snapshots)
+from metrics import Metrics
+
+
+def new_game(seed=1):
+    io = HeadlessIO(color=False)
+    return Game(Player("Tester", world_template, io=io), world_template, io=io, seed=seed)
+
+
+# Walks to the airlock, which asks before letting the player out
+def at_airlock():
+    game = new_game()
+    for line in ("move forward", "move left", "take unstable power cell", "move forward"):
+        game.step(line)
+    assert isinstance(game.dialog, AirlockDialog)
+    return game
+
+
+def test_undo_after_from_snapshot_mid_dialog():
+    game = Game.from_snapshot(at_airlock().snapshot(), io=HeadlessIO(color=False))
+    game.step("yes")
+    assert game.player.current_room == "open_area"
+
+    game.step("undo")
+    assert game.io.text().splitlines()[-1] == "There's nothing to undo."
+    assert game.dialog is None
+    assert game.player.current_room == "open_area"
+
+    # the history starts from the restored game once the question is answered
+    game.step("move right")
+    game.step("undo")
+    assert "Took back 'move right'." in game.io.text()
+    assert game.player.current_room == "open_area"
+
+
+def test_batch_answering_its_own_question_is_not_awaiting():
+    game = new_game()
+    for line in ("move forward", "move left", "take unstable power cell", "move forward", "yes", "move right",
+                 "take rusty spanner", "take sealed briefcase", "use rusty spanner on sealed briefcase"):
+        game.step(line)
+
+    # calibrate IRIS and then smash it, all in one line
+    result = game.step("use unstable power cell on iris; 2; 1; 1; 2")
+    assert game.dialog is None
+    assert result.awaiting is None
+    assert game.player.flags["iris_broken"]
+
+    result = new_game().step("move forward; move left; take unstable power cell; move forward; yes")
+    assert result.awaiting is None
+    assert result.prompts
+
+
+def test_input_after_the_ending_is_ignored():
+    io = HeadlessIO(color=False)
+    game = Game(Player("Tester", world_template, io=io), world_template, io=io, seed=1, record=True)
+    for line in shortest_lines("RESCUED"):
+        game.step(line)
+    assert game.ending == "RESCUED"
+    recorded = game.journal.commands()
+
+    result = game.step("look")
+    assert result.lines == []
+    assert game.journal.commands() == recorded
+    assert replay(game.journal).ok
+
+
+def test_goto_goes_around_the_locked_communications_room():
+    game = new_game()
+    game.player.current_room, game.player.facing_direction = "center", "west"
+    game.step("goto north debris")
+    assert "access code" not in game.io.text()
+    assert "move left, move right, move right" in game.io.text()
+
+    # once the keypad is open the route through it is just as good
+    game.player.flags["comms_unlocked"] = True
+    game.step("goto north debris")
+    assert "move forward, move left, move right" in game.io.text()
+
+    game.player.flags["comms_unlocked"] = False
+    game.step("goto communications room")
+    assert game.io.text().splitlines()[-1] == "  The communications room door will ask for an access code."
+
+
+def test_snapshot_round_trip():
+    game = at_airlock()
+    data = game.snapshot()
+    copy = Game.from_snapshot(data, io=HeadlessIO(color=False))
+    assert copy.snapshot() == data
+    assert copy.player.current_room == game.player.current_room
+    assert [item.name for item in copy.player.inventory] == ["Unstable Power Cell"]
+    assert isinstance(copy.dialog, AirlockDialog)
+
+    # both carry on the same way
+    for each in (game, copy):
+        each.step("yes")
+        each.step("look")
+    assert copy.io.text().splitlines()[-3:] == game.io.text().splitlines()[-3:]
+    assert copy.snapshot() == game.snapshot()
+
+    stream = BytesIO()
+    assert write_snapshots(stream, [game, new_game()]) == 2
+    stream.seek(0)
+    assert list(read_snapshots(stream)) == [game.snapshot(), new_game().snapshot()]
+
+
+def test_snapshot_from_another_version_or_world_is_refused():
+    data = at_airlock().snapshot()
+    game = new_game()
+    before = game.snapshot()
+
+    other_version = data[:3] + bytes([data[3] + 1]) + data[4:]
+    with pytest.raises(GameError, match="version"):
+        game.restore(other_version)
+    other_world = data[:4] + bytes(4) + data[8:]
+    with pytest.raises(GameError, match="different world"):
+        game.restore(other_world)
+    assert game.snapshot() == before
+
+
+# look and inventory, as the game shows them now
+def views(game):
+    return [game.step(line).lines for line in ("look", "inventory")]
+
+
+def test_cached_views_follow_take_use_move_and_restore():
+    metrics = Metrics()
+    io = HeadlessIO(color=False)
+    game = Game(Player("Tester", world_template, io=io), world_template, io=io, seed=1, metrics=metrics)
+    for line in shortest_lines("RESCUED")[:-1]:
+        game.step(line)
+        if game.dialog is None:
+            shown = views(game)
+            # a second look comes from the cache and says the same
+            assert views(game) == shown
+            # and so does a game that has never rendered anything
+            assert views(Game.from_snapshot(game.snapshot(), io=HeadlessIO(color=False))) == shown
+    assert metrics.counter("iris_render_cache_total", result="hit") > 0
+
+    game = new_game()
+    game.step("move forward; move left")
+    before = game.snapshot()
+    look, inventory = views(game)
+    assert any("Unstable Power Cell" in line for line in look)
+    game.step("take unstable power cell")
+    assert views(game) != [look, inventory]
+    game.restore(before)
+    assert views(game) == [look, inventory]
+
+
+def test_undo_and_redo():
+    game = new_game()
+    for line in ("move forward", "move left", "take unstable power cell"):
+        game.step(line)
+    taken = game.snapshot()
+
+    assert game.step("undo").lines[0] == "Took back 'take unstable power cell'."
+    assert list(game.player.inventory) == []
+    assert "- Unstable Power Cell" in game.step("look").lines
+    assert game.step("redo").lines[0] == "Did 'take unstable power cell' again."
+    assert game.snapshot() == taken
+
+    # a new move forgets what could be redone
+    game.step("undo")
+    game.step("take oily rag")
+    assert game.step("redo").lines == ["There's nothing to redo."]
+    assert [item.name for item in game.player.inventory] == ["Oily Rag"]
+
+    for _ in range(3):
+        game.step("undo")
+    assert game.snapshot() == new_game().snapshot()
+    assert game.step("undo").lines == ["There's nothing to undo."]
+
+
+def test_undo_takes_back_the_command_that_asked():
+    game = at_airlock()
+    game.step("undo")
+    assert game.dialog is None
+    assert game.player.current_room == "engine_room"
+    assert [item.name for item in game.player.inventory] == ["Unstable Power Cell"]
+    game.step("move forward")
+    assert isinstance(game.dialog, AirlockDialog)
+    game.step("yes")
+    assert game.player.current_room == "open_area"
+
+
+def test_history_is_cut_back():
+    game = new_game()
+    game.step("move forward; move left")
+    for _ in range(3 * UNDO_LIMIT):
+        game.step("move back")
+    assert game.head.depth <= 2 * UNDO_LIMIT
+    for _ in range(UNDO_LIMIT):
+        assert game.step("undo").lines[0].startswith("Took back")
+
+
+def test_fork_goes_its_own_way():
+    game = new_game()
+    game.step("move forward; move left; take unstable power cell")
+    asked = game.snapshot()
+    game.step("move forward")
+    fork = game.fork()
+    assert fork.snapshot() == game.snapshot()
+    assert isinstance(fork.dialog, AirlockDialog)
+    assert fork.io is not game.io
+
+    fork.step("yes")
+    game.step("no")
+    assert fork.player.current_room == "open_area"
+    assert game.player.current_room == "engine_room"
+    assert game.dialog is None
+    assert fork.rng.random() == game.rng.random()
+
+    # both share the history up to the fork, which ends before the question
+    fork.step("undo")
+    assert fork.snapshot() == asked
+    fork.step("undo")
+    game.step("undo")
+    assert fork.snapshot() == game.snapshot()
+    assert list(fork.player.inventory) == []
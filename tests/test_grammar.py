@@ -0,0 +1,60 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import Game, HeadlessIO, Player, world_template
+
+
+def new_game():
+    io = HeadlessIO(color=False)
+    return Game(Player("Tester", world_template, io=io), world_template, io=io, seed=1)
+
+
+def test_longest_verb_and_prepositions():
+    grammar = new_game().grammar
+    command = grammar.parse("Pick Up rusty spanner")
+    assert (command.verb, command.handler, command.args) == ("pick up", "command_take", ("rusty spanner",))
+    assert grammar.parse("look at beacon").handler == "command_inspect"
+    assert grammar.parse("look").handler == "command_look"
+
+    command = grammar.parse("use rusty spanner on sealed briefcase")
+    assert command.args == ("rusty spanner", "sealed briefcase")
+    assert command.complete
+    assert grammar.parse(command.text()).args == command.args
+
+    unknown = grammar.parse("xyzzy now")
+    assert (unknown.verb, unknown.handler) == ("xyzzy", None)
+    assert grammar.parse("   ") is None
+
+
+def test_incomplete_command_carries_on_with_the_next_line():
+    grammar = new_game().grammar
+    pending = grammar.parse("use rusty spanner")
+    assert not pending.complete
+    assert pending.text() == "use rusty spanner on"
+    for line in ("on sealed briefcase", "sealed briefcase"):
+        command = grammar.parse(line, pending)
+        assert command.args == ("rusty spanner", "sealed briefcase")
+        assert command.complete
+    # a new verb starts over
+    assert grammar.parse("look", pending).handler == "command_look"
+
+
+def test_game_keeps_the_pending_command_between_lines():
+    game = new_game()
+    game.step("use")
+    assert game.pending_command.args == ()
+    game.step("rusty spanner")
+    assert game.pending_command.args == ("rusty spanner",)
+    game.step("on sealed briefcase")
+    assert game.pending_command is None
+    assert game.io.text().splitlines()[-1] == "Use error: You don't have an item named 'rusty spanner'"
+
+
+def test_semicolons_run_commands_in_order():
+    game = new_game()
+    result = game.step("move forward; move left ;take power cell;; inventory")
+    assert game.player.current_room == "engine_room"
+    assert [item.name for item in game.player.inventory] == ["Unstable Power Cell"]
+    assert result.lines[-1] == "- Unstable Power Cell"
@@ -0,0 +1,69 @@
+import os
+import sys
+from urllib.request import urlopen
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import Game, HeadlessIO, Player, world_template
+from metrics import HTTPExporter, Metrics, PrometheusFileExporter
+
+
+def test_render_counters_gauges_and_histograms():
+    metrics = Metrics(buckets=(0.1, 1.0))
+    metrics.inc("iris_commands_total", result="hit")
+    metrics.inc("iris_commands_total", 2, result="hit")
+    metrics.inc("iris_errors_total", where='say "hi"\n', type="GameError")
+    metrics.set("iris_sessions_resident", 4)
+    for seconds in (0.05, 0.5, 5):
+        metrics.observe("iris_command_seconds", seconds)
+
+    assert metrics.render().splitlines() == [
+        "# HELP iris_command_seconds Time to handle one command, including prompts and cutscenes",
+        "# TYPE iris_command_seconds histogram",
+        'iris_command_seconds_bucket{le="0.1"} 1',
+        'iris_command_seconds_bucket{le="1.0"} 2',
+        'iris_command_seconds_bucket{le="+Inf"} 3',
+        "iris_command_seconds_sum 5.55",
+        "iris_command_seconds_count 3",
+        "# HELP iris_commands_total Commands handled, by how they were resolved",
+        "# TYPE iris_commands_total counter",
+        'iris_commands_total{result="hit"} 3',
+        "# HELP iris_errors_total Errors reported to the player, by where they happened and their type",
+        "# TYPE iris_errors_total counter",
+        'iris_errors_total{type="GameError",where="say \\"hi\\"\\n"} 1',
+        "# HELP iris_sessions_resident Sessions with their game in memory",
+        "# TYPE iris_sessions_resident gauge",
+        "iris_sessions_resident 4",
+    ]
+    assert metrics.histogram("iris_command_seconds").quantile(0.5) == 1.0
+    assert Metrics().render() == "\n"
+
+
+def test_a_game_records_its_commands():
+    metrics = Metrics()
+    io = HeadlessIO(color=False)
+    game = Game(Player("Tester", world_template, io=io), world_template, io=io, seed=1, metrics=metrics)
+    for line in ("look", "lokk", "xyzzy", "take nothing"):
+        game.step(line)
+    assert metrics.counter("iris_commands_total", result="suggested") == 1
+    assert metrics.counter("iris_commands_total", result="unknown") == 1
+    assert metrics.histogram("iris_command_seconds").count == 4
+    assert "iris_render_cache_total" in metrics.render()
+
+
+def test_exporters_publish_the_text_form(tmp_path):
+    metrics = Metrics()
+    metrics.inc("iris_commands_total", result="hit")
+
+    path = str(tmp_path / "iris.prom")
+    exporter = PrometheusFileExporter(metrics, path, interval=60).start()
+    exporter.stop()
+    with open(path) as f:
+        assert f.read() == metrics.render()
+
+    exporter = HTTPExporter(metrics, port=0).start()
+    try:
+        with urlopen(f"http://127.0.0.1:{exporter.port}/metrics", timeout=5) as response:
+            assert response.read().decode() == metrics.render()
+    finally:
+        exporter.stop()
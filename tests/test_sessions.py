@@ -0,0 +1,84 @@
+import os
+import sys
+import marshal
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import Game, GameError, HeadlessIO, Player, world_template
+from sessions import PACK_FORMAT, SESSION_BYTES, SessionManager, SessionStore, pack, unpack
+
+LINES = ("move forward", "move left", "take unstable power cell", "move forward", "yes", "move right")
+
+
+def new_game(seed):
+    io = HeadlessIO(color=False)
+    return Game(Player("Tester", world_template, io=io), world_template, io=io, seed=seed)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def manager(tmp_path, clock, **options):
+    return SessionManager(SessionStore(str(tmp_path)), memory_budget=2 * SESSION_BYTES, min_idle=10,
+                          clock=clock, **options)
+
+
+def test_least_recently_used_idle_session_sleeps_and_wakes(tmp_path):
+    clock = Clock()
+    sessions = manager(tmp_path, clock)
+    games = {}
+    for session_id in ("a", "b"):
+        games[session_id] = new_game(seed=7)
+        sessions.add(session_id, games[session_id])
+        for line in LINES:
+            games[session_id].step(line)
+
+    # over budget, but nobody has been idle long enough yet
+    sessions.add("c", new_game(seed=1))
+    assert sessions.stats()["resident"] == 3
+
+    clock.now = 60
+    sessions.get("b")
+    sessions.add("d", new_game(seed=1))
+    assert sessions.hibernated == {"a", "c"}
+    assert sorted(os.listdir(tmp_path)) == ["a.session", "c.session"]
+    assert "a" in sessions and len(sessions) == 4
+
+    # the woken game is the same game, on the same port, down to its dice
+    woken = sessions.get("a")
+    assert woken is not games["a"]
+    assert woken.io is games["a"].io
+    assert woken.snapshot() == games["b"].snapshot()
+    assert woken.rng.random() == games["b"].rng.random()
+    assert os.listdir(tmp_path) == ["c.session"]
+
+    stats = sessions.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]["lru"]) == (1, 1, 2)
+
+
+def test_idle_policy_sweeps_long_idle_sessions(tmp_path):
+    clock = Clock()
+    sessions = manager(tmp_path, clock, policy="idle", max_idle=100)
+    sessions.add("a", new_game(seed=1))
+    clock.now = 50
+    sessions.add("b", new_game(seed=1))
+    clock.now = 120
+    sessions.sweep()
+    assert sessions.hibernated == {"a"}
+    sessions.remove("a")
+    assert "a" not in sessions
+    assert os.listdir(tmp_path) == []
+
+
+def test_packed_session_from_another_version_is_refused():
+    data = pack(new_game(seed=1))
+    assert unpack(data).snapshot() == new_game(seed=1).snapshot()
+    with pytest.raises(GameError):
+        unpack(marshal.dumps((PACK_FORMAT + 1,) + marshal.loads(data)[1:]))
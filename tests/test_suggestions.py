@@ -0,0 +1,43 @@
+import os
+import sys
+import difflib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import Game, HeadlessIO, Player, SuggestionIndex, world_template
+
+WORDS = ["move", "inventory", "inspect", "take", "use", "help", "look", "exits", "goto", "undo", "redo"]
+
+
+def test_same_answers_as_difflib():
+    index = SuggestionIndex(WORDS)
+    for query in ("mvoe", "inventroy", "inspcet", "tkae", "hlep", "lok", "exist", "xyzzy", "redo", "und", "u"):
+        for cutoff in (0.5, 0.6, 0.8):
+            expected = difflib.get_close_matches(query, WORDS, n=1, cutoff=cutoff)
+            assert index.suggest(query, cutoff) == (expected[0] if expected else None), (query, cutoff)
+
+
+def test_words_come_and_go():
+    index = SuggestionIndex(["rusty spanner", "rusty spanner"])
+    assert index.suggest("rusty spaner") == "rusty spanner"
+    index.remove("rusty spanner")
+    assert index.suggest("rusty spaner") == "rusty spanner"
+    index.remove("rusty spanner")
+    assert index.suggest("rusty spaner") is None
+    assert index.grams == {}
+
+    # a cached miss is forgotten once a word that matches arrives
+    assert index.suggest("beacn") is None
+    index.add("beacon")
+    assert index.suggest("beacn") == "beacon"
+    score, word = index.best("beacn")
+    assert word == "beacon" and 0.6 <= score < 1
+
+
+def test_suggestions_in_the_game():
+    io = HeadlessIO(color=False)
+    game = Game(Player("Tester", world_template, io=io), world_template, io=io, seed=1)
+    game.step("lokk")
+    assert io.text().splitlines()[-1] == "Command not found. Did you mean 'look'?"
+    game.step("move forward; move left; take unstable powr cell")
+    assert "Did you mean 'unstable power cell'?" in io.text().splitlines()[-1]
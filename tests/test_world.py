@@ -0,0 +1,64 @@
+import os
+import sys
+import json
+import copy
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import WORLD_FILE, WORLD_FORMAT, WorldError, compile_world
+
+
+def world_data():
+    with open(WORLD_FILE) as f:
+        return json.load(f)
+
+
+# compile_world's complaints about a broken copy of world.json
+def problems(change):
+    data = copy.deepcopy(world_data())
+    change(data)
+    with pytest.raises(WorldError) as error:
+        compile_world(data)
+    return str(error.value)
+
+
+def test_world_file_compiles():
+    assert compile_world(world_data())[0] == WORLD_FORMAT
+
+
+def test_missing_and_unknown_cutscenes():
+    def change(data):
+        del data["cutscenes"]["intro"]
+        data["cutscenes"]["outro"] = {"lines": ["Bye"], "speed": -1}
+    found = problems(change)
+    assert "cutscenes: missing 'intro'" in found
+    assert "cutscenes.outro.speed: expected a number of seconds" in found
+
+
+def test_triggers_pointing_at_nothing():
+    def change(data):
+        data["triggers"] += [
+            {"on": "enter", "key": "nowhere", "action": "keypad"},
+            {"on": "enter", "key": "center", "action": "explode"},
+            {"on": "use", "key": ["Rusty Spanner", "Nothing"], "action": "iris"},
+            {"on": "moves", "key": 3, "action": "storm_warning", "flags": {"no_such_flag": True}},
+            {"on": "sneeze", "key": 1, "action": "keypad"},
+        ]
+    found = problems(change)
+    assert "triggers[" in found
+    assert "key: no room 'nowhere'" in found
+    assert "action: no 'enter' action called 'explode'" in found
+    assert "key: no item named 'Nothing'" in found
+    assert "flags: no player flag called 'no_such_flag'" in found
+    assert "on: expected one of enter, moves, use" in found
+
+
+def test_npcs_the_engine_needs_and_where_they_are():
+    def change(data):
+        data["npcs"]["ghost"] = {"name": "Ghost", "room": "attic", "description": "Boo"}
+        del data["npcs"]["old_rover"]
+    found = problems(change)
+    assert "npcs: missing 'old_rover'" in found
+    assert "npcs.ghost.room: no room 'attic'" in found